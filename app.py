@@ -7,13 +7,22 @@ from gooey import Gooey, GooeyParser
 from src.cleanCloud import cleanCloud
 from src.cleanClouds import cleanClouds
 from src.segmentCloud import segmentCloud
-from src.segmentClouds import segmentClouds
+from src.segmentClouds import segmentClouds, cleanSegmentFile
+from src.batchProcess import runBatch, c2mThreadCount
+from src.lasTriage import triageFiles
+from src.cleanBackends import CLEAN_BACKENDS, SOR_MODES
+from src.csfCache import CSF_CACHE_MAX_MB
+from src.voxelComponents import COMPONENTS_ENGINES
+from src.demRaster import DEM_ENGINES
+from src.segmentCloud import HEIGHT_MODES
+from src.asyncWriter import WRITE_BUDGET_MB
 
 from src.lasTimeTagging import processLASdir as lasProcess
 
 from src.imageTimeTagging import processIMGdir as imgProcess
 
 from src.imageTimeSort import IMGsort as IMGsort
+from src.imageTimeSort import OUTPUT_MODES
 
 from src.lasRender import lasRender as lasRender
 from src.lasRenderMany import lasRenderMany as lasRenderMany
@@ -26,6 +35,128 @@ except:
   print("An exception occurred while loading SfM, do not use SfM tool")
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+def addCleanArguments(panel):
+    """
+    Adds the performance options of cleanCloud (pushdown, tiling, backend, SOR mode, CSF cache) to a panel.
+    """
+    panel.add_argument('--pushdown', default=False,
+                       help='Drop points below the intensity threshold while reading the LAS files (only XYZ + intensity are loaded).',
+                       metavar="Filter While Reading",
+                       action='store_true', widget='BlockCheckbox')
+
+    panel.add_argument('--tile_size', type=float, required=False,
+                       default=None,
+                       metavar='Tile Size',
+                       help='Clean each track in square tiles of this size (meters) when it does not fit in memory. Leave empty to clean the whole track at once.')
+
+    panel.add_argument('--tile_halo', type=float, required=False,
+                       default=1.0,
+                       metavar='Tile Overlap',
+                       help='Overlap (meters) read around each tile.')
+
+    panel.add_argument('--tile_workers', type=int, required=False,
+                       default=1,
+                       metavar='Tile Workers',
+                       help='Number of tiles to clean at the same time, each in its own process.')
+
+    panel.add_argument('--backend', type=str, default="cloudcompare",
+                       metavar='Cleaning Backend',
+                       help='Library the cleaning filters run with (numpy does not need CloudComPy).',
+                       widget="Dropdown", choices=CLEAN_BACKENDS)
+
+    panel.add_argument('--sor_mode', type=str, default="exact",
+                       metavar='SOR Mode',
+                       help='Exact (k-NN) or approximate (voxel occupancy) SOR filter; voxel reports its agreement with exact.',
+                       widget="Dropdown", choices=SOR_MODES)
+
+    panel.add_argument('--no_csf_cache', default=False,
+                       help='Always recompute the ground separation instead of reusing a cached one.',
+                       metavar="Disable CSF Cache",
+                       action='store_true', widget='BlockCheckbox')
+
+    panel.add_argument('--csf_cache_mb', type=int, required=False,
+                       default=CSF_CACHE_MAX_MB,
+                       metavar='CSF Cache Size (MB)',
+                       help='Size limit (MB) of the CSF cache next to the LAS files, least recently used masks are removed.')
+
+
+def addSegmentArguments(panel):
+    """
+    Adds the performance options of segmentCloud (components engine, DEM engine, height mode, export layers) to a panel.
+    """
+    panel.add_argument('--components_engine', type=str, default="cloudcompare",
+                       metavar='Components Engine',
+                       help='Extract fish / coral components with CloudCompare or with the NumPy voxel engine (one label per point).',
+                       widget="Dropdown", choices=COMPONENTS_ENGINES)
+
+    panel.add_argument('--dem_engine', type=str, default="numpy",
+                       metavar='DEM Engine',
+                       help='Create the DEM with the NumPy raster engine or with CloudCompare (RasterizeToMesh).',
+                       widget="Dropdown", choices=DEM_ENGINES)
+
+    panel.add_argument('--height_mode', type=str, default="raster",
+                       metavar='Height Mode',
+                       help='Height above the DEM by bilinear lookup in the DEM raster (numpy DEM engine) or by cloud-to-mesh distances.',
+                       widget="Dropdown", choices=HEIGHT_MODES)
+
+    panel.add_argument('--export_layers', type=str, required=False,
+                       default=None,
+                       metavar='Export Layers',
+                       help='Comma separated layers to write instead of the default ones of the export option, e.g. "fish,coral,ground,dem".')
+
+
+def addWriteArguments(panel):
+    """
+    Adds the background writer options (async_writes, write_budget_mb) to a panel of a batch command.
+    """
+    panel.add_argument('--async_writes', default=False,
+                       help='Write the output files in the background while the next LAS file is processed.',
+                       metavar="Background Writes",
+                       action='store_true', widget='BlockCheckbox')
+
+    panel.add_argument('--write_budget_mb', type=int, required=False,
+                       default=WRITE_BUDGET_MB,
+                       metavar='Write Budget (MB)',
+                       help='Memory (MB) of the outputs that may wait to be written before processing waits for them.')
+
+
+def cleanOptions(args):
+    """
+    Keyword arguments of cleanCloud / cleanClouds from the options of addCleanArguments (and addWriteArguments).
+    """
+    options = dict(pushdown=args.pushdown,
+                   tile_size=args.tile_size,
+                   tile_halo=args.tile_halo,
+                   tile_workers=args.tile_workers,
+                   backend=args.backend,
+                   sor_mode=args.sor_mode,
+                   csf_cache=not args.no_csf_cache,
+                   csf_cache_mb=args.csf_cache_mb)
+
+    if 'async_writes' in vars(args):
+        options.update(async_writes=args.async_writes, write_budget_mb=args.write_budget_mb)
+
+    return options
+
+
+def segmentOptions(args):
+    """
+    Keyword arguments of segmentCloud / segmentClouds from the options of addSegmentArguments (and addWriteArguments).
+    """
+    options = dict(components_engine=args.components_engine,
+                   dem_engine=args.dem_engine,
+                   height_mode=args.height_mode,
+                   export_layers=[layer.strip() for layer in args.export_layers.split(",")] if args.export_layers else None)
+
+    if 'async_writes' in vars(args):
+        options.update(async_writes=args.async_writes, write_budget_mb=args.write_budget_mb)
+
+    return options
+
 
 # ----------------------------------------------------------------------------------------------------------------------
 # Gooey GUI
@@ -106,6 +237,10 @@ def main():
                                       metavar="Intermediate Export Option",
                                       action='store_true', widget='BlockCheckbox')
 
+    clean_parser_panel_6 = clean_parser.add_argument_group('Optional Arguments for Performance',
+                                                           'Options that change how fast, or with how much memory, the files are processed.')
+    addCleanArguments(clean_parser_panel_6)
+
     # Clean dir parser
     clean_dir_parser = subs.add_parser('CleanFiles')
 
@@ -171,6 +306,16 @@ def main():
                                           metavar="Intermediate Export Option",
                                           action='store_true', widget='BlockCheckbox')
 
+    clean_dir_parser_panel_5.add_argument('--workers', type=int, required=False,
+                                          default=1,
+                                          metavar='Workers',
+                                          help='Number of LAS files to process at the same time, each in its own process.')
+
+    clean_dir_parser_panel_6 = clean_dir_parser.add_argument_group('Optional Arguments for Performance',
+                                                                   'Options that change how fast, or with how much memory, the files are processed.')
+    addCleanArguments(clean_dir_parser_panel_6)
+    addWriteArguments(clean_dir_parser_panel_6)
+
     # Segment parser
     segment_parser = subs.add_parser('Segment')
 
@@ -234,9 +379,9 @@ def main():
                                         help='The Grid step used to create the DEM.')
 
     segment_parser_panel_4.add_argument('--empty_cell_fill_option', type=str, required=False,
-                                        default="KRIGING",
+                                        default="INTERPOLATE_DELAUNAY",
                                         metavar='Empty cell fill Option for DEM',
-                                        help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","INTERPOLATE_DELAUNAY","KRIGING"')
+                                        help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","FILL_NEAREST","INTERPOLATE_IDW","INTERPOLATE_DELAUNAY","KRIGING" (KRIGING is much slower)')
 
     segment_parser_panel_5 = segment_parser.add_argument_group('Other Optional Arguments',
                                                                'Provide a path to LAS file to clean.')
@@ -251,6 +396,10 @@ def main():
                                         action='store_true',
                                         widget='BlockCheckbox')
 
+    segment_parser_panel_6 = segment_parser.add_argument_group('Optional Arguments for Performance',
+                                                               'Options that change how fast, or with how much memory, the files are processed.')
+    addSegmentArguments(segment_parser_panel_6)
+
     # segment many parser
     segment_dir_parser = subs.add_parser('SegmentFiles')
 
@@ -316,9 +465,9 @@ def main():
 
     # not working rn cant figure out how to add the choice to the end of the variable name
     segment_dir_parser_panel_4.add_argument('--empty_cell_fill_option', type=str, required=False,
-                                            default="KRIGING",
+                                            default="INTERPOLATE_DELAUNAY",
                                             metavar='Empty cell fill Ooption for DEM',
-                                            help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","INTERPOLATE_DELAUNAY","KRIGING"')
+                                            help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","FILL_NEAREST","INTERPOLATE_IDW","INTERPOLATE_DELAUNAY","KRIGING" (KRIGING is much slower)')
 
     segment_dir_parser_panel_5 = segment_dir_parser.add_argument_group('Other Optional Arguments',
                                                                        'Provide a path to LAS file to clean.')
@@ -333,6 +482,16 @@ def main():
                                             action='store_true',
                                             widget='BlockCheckbox')
 
+    segment_dir_parser_panel_5.add_argument('--workers', type=int, required=False,
+                                            default=1,
+                                            metavar='Workers',
+                                            help='Number of LAS files to process at the same time, each in its own process.')
+
+    segment_dir_parser_panel_6 = segment_dir_parser.add_argument_group('Optional Arguments for Performance',
+                                                                       'Options that change how fast, or with how much memory, the files are processed.')
+    addSegmentArguments(segment_dir_parser_panel_6)
+    addWriteArguments(segment_dir_parser_panel_6)
+
     # Clean Segment parser
     cleansegment_parser = subs.add_parser('CleanSegment')
 
@@ -431,9 +590,9 @@ def main():
 
     # not working rn cant figure out how to add the choice to the end of the variable name
     cleansegment_parser_panel_7.add_argument('--empty_cell_fill_option', type=str, required=False,
-                                             default="KRIGING",
+                                             default="INTERPOLATE_DELAUNAY",
                                              metavar='Empty cell fill Ooption for DEM',
-                                             help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","INTERPOLATE_DELAUNAY","KRIGING"')
+                                             help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","FILL_NEAREST","INTERPOLATE_IDW","INTERPOLATE_DELAUNAY","KRIGING" (KRIGING is much slower)')
 
     cleansegment_parser_panel_8 = cleansegment_parser.add_argument_group('Other Optional Arguments',
                                                                          'Provide a path to LAS file to clean.')
@@ -454,6 +613,11 @@ def main():
                                              action='store_true',
                                              widget='BlockCheckbox')
 
+    cleansegment_parser_panel_9 = cleansegment_parser.add_argument_group('Optional Arguments for Performance',
+                                                                         'Options that change how fast, or with how much memory, the files are processed.')
+    addCleanArguments(cleansegment_parser_panel_9)
+    addSegmentArguments(cleansegment_parser_panel_9)
+
     # Many Clean Segment parser
     cleansegment_dir_parser = subs.add_parser('manyCleanSegment')
 
@@ -555,9 +719,9 @@ def main():
 
     # not working rn cant figure out how to add the choice to the end of the variable name
     cleansegment_dir_parser_panel_7.add_argument('--empty_cell_fill_option', type=str, required=False,
-                                                 default="KRIGING",
+                                                 default="INTERPOLATE_DELAUNAY",
                                                  metavar='Empty cell fill Ooption for DEM',
-                                                 help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","INTERPOLATE_DELAUNAY","KRIGING"')
+                                                 help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","FILL_NEAREST","INTERPOLATE_IDW","INTERPOLATE_DELAUNAY","KRIGING" (KRIGING is much slower)')
 
     cleansegment_dir_parser_panel_8 = cleansegment_dir_parser.add_argument_group('Other Optional Arguments',
                                                                                  'Provide a path to LAS file to clean.')
@@ -578,6 +742,17 @@ def main():
                                                  action='store_true',
                                                  widget='BlockCheckbox')
 
+    cleansegment_dir_parser_panel_8.add_argument('--workers', type=int, required=False,
+                                                 default=1,
+                                                 metavar='Workers',
+                                                 help='Number of LAS files to process at the same time, each in its own process.')
+
+    cleansegment_dir_parser_panel_9 = cleansegment_dir_parser.add_argument_group('Optional Arguments for Performance',
+                                                                                 'Options that change how fast, or with how much memory, the files are processed.')
+    addCleanArguments(cleansegment_dir_parser_panel_9)
+    addSegmentArguments(cleansegment_dir_parser_panel_9)
+    addWriteArguments(cleansegment_dir_parser_panel_9)
+
     # Image Sort
     image_sort_parser = subs.add_parser('Sort')
     image_sort_parser_panel_1 = image_sort_parser.add_argument_group('Just Sorting')
@@ -594,6 +769,11 @@ def main():
                                            default=r'C:\Users\Alexander.Swann\Desktop\testingDATA\newoutput',
                                            help='Directory to save the processed files.', widget='DirChooser')
 
+    image_sort_parser_panel_1.add_argument('--output_mode', type=str, default="copy",
+                                           metavar='Output Mode',
+                                           help='How the sorted files are placed: copy, hardlink, symlink, reflink, or manifest (writes an index file, copies nothing).',
+                                           widget="Dropdown", choices=OUTPUT_MODES)
+
     # Clean Segment + Image Sort
 
     cleansegmentsort_dir_parser = subs.add_parser('Everything')
@@ -616,6 +796,11 @@ def main():
                                                      default=r'C:\Users\Alexander.Swann\Desktop\testingDATA\newoutput',
                                                      help='Directory to save the processed files.', widget='DirChooser')
 
+    cleansegmentsort_dir_parser_panel_1.add_argument('--output_mode', type=str, default="copy",
+                                                     metavar='Output Mode',
+                                                     help='How the sorted files are placed: copy, hardlink, symlink, reflink, or manifest (writes an index file, copies nothing).',
+                                                     widget="Dropdown", choices=OUTPUT_MODES)
+
     cleansegmentsort_dir_parser_panel_2 = cleansegmentsort_dir_parser.add_argument_group(
         'Optional Arguments for Cleaning',
         'More Options For Cleaning.')
@@ -703,9 +888,9 @@ def main():
 
     # not working rn cant figure out how to add the choice to the end of the variable name
     cleansegmentsort_dir_parser_panel_7.add_argument('--empty_cell_fill_option', type=str, required=False,
-                                                     default="KRIGING",
+                                                     default="INTERPOLATE_DELAUNAY",
                                                      metavar='Empty cell fill Option for DEM',
-                                                     help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","INTERPOLATE_DELAUNAY","KRIGING"')
+                                                     help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","FILL_NEAREST","INTERPOLATE_IDW","INTERPOLATE_DELAUNAY","KRIGING" (KRIGING is much slower)')
 
     cleansegmentsort_dir_parser_panel_8 = cleansegmentsort_dir_parser.add_argument_group('Other Optional Arguments',
                                                                                          'Other Optional Arguments.')
@@ -726,6 +911,16 @@ def main():
                                                      action='store_true',
                                                      widget='BlockCheckbox')
 
+    cleansegmentsort_dir_parser_panel_8.add_argument('--workers', type=int, required=False,
+                                                     default=1,
+                                                     metavar='Workers',
+                                                     help='Number of LAS files to process at the same time, each in its own process.')
+
+    cleansegmentsort_dir_parser_panel_9 = cleansegmentsort_dir_parser.add_argument_group('Optional Arguments for Performance',
+                                                                                         'Options that change how fast, or with how much memory, the files are processed.')
+    addCleanArguments(cleansegmentsort_dir_parser_panel_9)
+    addSegmentArguments(cleansegmentsort_dir_parser_panel_9)
+    addWriteArguments(cleansegmentsort_dir_parser_panel_9)
 
     # Las Image Render
     las_render_parser = subs.add_parser('FileRender')
@@ -826,7 +1021,8 @@ def main():
                                        knn=args.knn,
                                        nSigma=args.nSigma,
                                        verbose=args.verbose,
-                                       export=args.export)
+                                       export=args.export,
+                                       **cleanOptions(args))
 
             # cloud_cleaner = cleanCloud(pcd_file=args.pcd_file,
             #                            output_dir=args.output_dir)
@@ -855,7 +1051,8 @@ def main():
                                            coral_min_comp_size=args.coral_min_comp_size,
                                            max_coral_pts=args.max_coral_pts,
                                            exportOption=args.exportOption,
-                                           verbose=args.verbose)
+                                           verbose=args.verbose,
+                                           **segmentOptions(args))
 
             # Load the cleaned cloud from file
             cloud_segmentor.load_pcd()
@@ -873,7 +1070,9 @@ def main():
                                         knn=args.knn,
                                         nSigma=args.nSigma,
                                         verbose=args.verbose,
-                                        export=args.export)
+                                        export=args.export,
+                                        workers=args.workers,
+                                        **cleanOptions(args))
 
             # cloud_cleaner = cleanClouds(pcd_dir=args.pcd_dir,
             #                            output_dir=args.output_dir)
@@ -896,48 +1095,40 @@ def main():
                                             coral_min_comp_size=args.coral_min_comp_size,
                                             max_coral_pts=args.max_coral_pts,
                                             exportOption=args.exportOption,
-                                            verbose=args.verbose)
+                                            verbose=args.verbose,
+                                            workers=args.workers,
+                                            **segmentOptions(args))
 
             # Clean the clouds
             cloud_segmentor.cleanDir()
 
         elif args.command == 'CleanSegment':
-            # Create a cleanCloud instance
-            cloud_cleaner = cleanCloud(pcd_file=args.pcd_file,
-                                       output_dir=args.output_dir,
-                                       intensity_thresh=args.intensity_thresh,
-                                       density_thresh=args.density_thresh,
-                                       min_point_thresh=args.min_point_thresh,
-                                       knn=args.knn,
-                                       nSigma=args.nSigma,
-                                       verbose=args.verbose,
-                                       export=args.export)
-
-            # Load the cloud from file
-            cloud_cleaner.load_pcd()
-
-            # Clean the cloud
-            cloud_cleaner.clean()
-
-            cloud_segmentor = segmentCloud(pcd_file=args.pcd_file,
-                                           output_dir=args.output_dir,
-                                           dem_grid_step=args.dem_grid_step,
-                                           empty_cell_fill_option=args.empty_cell_fill_option,
-                                           pcd_above_seafloor_thresh=args.pcd_above_seafloor_thresh,
-                                           intensity_threshold=args.intensity_threshold,
-                                           coral_cell_size=args.coral_cell_size,
-                                           fish_cell_size=args.fish_cell_size,
-                                           fish_min_comp_size=args.fish_min_comp_size,
-                                           coral_min_comp_size=args.coral_min_comp_size,
-                                           max_coral_pts=args.max_coral_pts,
-                                           exportOption=args.exportOption,
-                                           verbose=args.verbose)
-
-            # Load the cleaned cloud from file
-            cloud_segmentor.load_pcd(pcd=cloud_cleaner)
-
-            # Segment the cloud
-            cloud_segmentor.segment()
+            clean_params = dict(output_dir=args.output_dir,
+                                intensity_thresh=args.intensity_thresh,
+                                density_thresh=args.density_thresh,
+                                min_point_thresh=args.min_point_thresh,
+                                knn=args.knn,
+                                nSigma=args.nSigma,
+                                verbose=args.verbose,
+                                export=args.export,
+                                **cleanOptions(args))
+
+            segment_params = dict(output_dir=args.output_dir,
+                                  dem_grid_step=args.dem_grid_step,
+                                  empty_cell_fill_option=args.empty_cell_fill_option,
+                                  pcd_above_seafloor_thresh=args.pcd_above_seafloor_thresh,
+                                  intensity_threshold=args.intensity_threshold,
+                                  coral_cell_size=args.coral_cell_size,
+                                  fish_cell_size=args.fish_cell_size,
+                                  fish_min_comp_size=args.fish_min_comp_size,
+                                  coral_min_comp_size=args.coral_min_comp_size,
+                                  max_coral_pts=args.max_coral_pts,
+                                  exportOption=args.exportOption,
+                                  verbose=args.verbose,
+                                  **segmentOptions(args))
+
+            # Clean the cloud and segment it, in memory unless the cleaning (e.g. tiled) leaves it on disk
+            cleanSegmentFile(args.pcd_file, clean_params, segment_params)
         elif args.command == 'manyCleanSegment':
             # Create a cleanCloud instance
             # cloud_cleaner = cleanCloud(pcd_file=args.pcd_file,
@@ -948,45 +1139,39 @@ def main():
             #                            verbose=args.verbose)
             pcd_files = glob.glob(f"{args.pcd_dir}/**/*.las", recursive=True)
 
-            for pcd_file in pcd_files:
-                cloud_cleaner = cleanCloud(pcd_file=pcd_file,
-                                           output_dir=args.output_dir,
-                                           intensity_thresh=args.intensity_thresh,
-                                           density_thresh=args.density_thresh,
-                                           min_point_thresh=args.min_point_thresh,
-                                           knn=args.knn,
-                                           nSigma=args.nSigma,
-                                           verbose=args.verbose,
-                                           export=args.export)
-
-                # Load the cloud from file
-                cloud_cleaner.load_pcd()
-
-                # Clean the cloud
-                cloud_cleaner.clean()
-
-                if None in [cloud_cleaner.originalPointCloud, cloud_cleaner.cleanedPointCloud]:
-                    print("Error: PCD file is empty")
-                else:
-                    cloud_segmentor = segmentCloud(pcd_file=pcd_file,
-                                                   output_dir=args.output_dir,
-                                                   dem_grid_step=args.dem_grid_step,
-                                                   empty_cell_fill_option=args.empty_cell_fill_option,
-                                                   pcd_above_seafloor_thresh=args.pcd_above_seafloor_thresh,
-                                                   intensity_threshold=args.intensity_threshold,
-                                                   coral_cell_size=args.coral_cell_size,
-                                                   fish_cell_size=args.fish_cell_size,
-                                                   fish_min_comp_size=args.fish_min_comp_size,
-                                                   coral_min_comp_size=args.coral_min_comp_size,
-                                                   max_coral_pts=args.max_coral_pts,
-                                                   exportOption=args.exportOption,
-                                                   verbose=args.verbose)
-
-                    # Load the cleaned cloud from file
-                    cloud_segmentor.load_pcd(pcd=cloud_cleaner)
-
-                    # Segment the cloud
-                    cloud_segmentor.segment()
+            # Reject sparse / tiny tracks from their LAS header before loading them
+            pcd_files, _ = triageFiles(pcd_files,
+                                       args.output_dir,
+                                       density_thresh=args.density_thresh,
+                                       min_point_thresh=args.min_point_thresh)
+
+            clean_params = dict(output_dir=args.output_dir,
+                                intensity_thresh=args.intensity_thresh,
+                                density_thresh=args.density_thresh,
+                                min_point_thresh=args.min_point_thresh,
+                                knn=args.knn,
+                                nSigma=args.nSigma,
+                                verbose=args.verbose,
+                                export=args.export,
+                                **cleanOptions(args))
+
+            segment_params = dict(output_dir=args.output_dir,
+                                  dem_grid_step=args.dem_grid_step,
+                                  empty_cell_fill_option=args.empty_cell_fill_option,
+                                  pcd_above_seafloor_thresh=args.pcd_above_seafloor_thresh,
+                                  intensity_threshold=args.intensity_threshold,
+                                  coral_cell_size=args.coral_cell_size,
+                                  fish_cell_size=args.fish_cell_size,
+                                  fish_min_comp_size=args.fish_min_comp_size,
+                                  coral_min_comp_size=args.coral_min_comp_size,
+                                  max_coral_pts=args.max_coral_pts,
+                                  exportOption=args.exportOption,
+                                  verbose=args.verbose,
+                                  max_thread_count=c2mThreadCount(args.workers),
+                                  **segmentOptions(args))
+
+            # Clean and segment each file, in parallel if more than one worker
+            runBatch(cleanSegmentFile, pcd_files, args=(clean_params, segment_params), workers=args.workers)
         elif args.command == 'Sort':
             tracks = lasProcess(input_dir=args.pcd_dir, output_dir=args.output_dir)
             tracks.run()
@@ -994,50 +1179,44 @@ def main():
             images = imgProcess(input_dir=args.img_dir, output_dir=args.output_dir)
             images.run()
 
-            imgSort = IMGsort(tracks.tracksDf, images.imagesDf, tracks.output_dir)
+            imgSort = IMGsort(tracks.tracksDf, images.imagesDf, tracks.output_dir, output_mode=args.output_mode)
             imgSort.run()
         elif args.command == 'Everything':
             pcd_files = glob.glob(f"{args.pcd_dir}/**/*.las", recursive=True)
 
-            for pcd_file in pcd_files:
-                cloud_cleaner = cleanCloud(pcd_file=pcd_file,
-                                           output_dir=args.output_dir,
-                                           intensity_thresh=args.intensity_thresh,
-                                           density_thresh=args.density_thresh,
-                                           min_point_thresh=args.min_point_thresh,
-                                           knn=args.knn,
-                                           nSigma=args.nSigma,
-                                           verbose=args.verbose,
-                                           export=args.export)
-
-                # Load the cloud from file
-                cloud_cleaner.load_pcd()
-
-                # Clean the cloud
-                cloud_cleaner.clean()
-
-                if None in [cloud_cleaner.originalPointCloud, cloud_cleaner.cleanedPointCloud]:
-                    print("Error: PCD file is empty")
-                else:
-                    cloud_segmentor = segmentCloud(pcd_file=pcd_file,
-                                                   output_dir=args.output_dir,
-                                                   dem_grid_step=args.dem_grid_step,
-                                                   empty_cell_fill_option=args.empty_cell_fill_option,
-                                                   pcd_above_seafloor_thresh=args.pcd_above_seafloor_thresh,
-                                                   intensity_threshold=args.intensity_threshold,
-                                                   coral_cell_size=args.coral_cell_size,
-                                                   fish_cell_size=args.fish_cell_size,
-                                                   fish_min_comp_size=args.fish_min_comp_size,
-                                                   coral_min_comp_size=args.coral_min_comp_size,
-                                                   max_coral_pts=args.max_coral_pts,
-                                                   exportOption=args.exportOption,
-                                                   verbose=args.verbose)
-
-                    # Load the cleaned cloud from file
-                    cloud_segmentor.load_pcd(pcd=cloud_cleaner)
-
-                    # Segment the cloud
-                    cloud_segmentor.segment()
+            # Reject sparse / tiny tracks from their LAS header before loading them
+            pcd_files, _ = triageFiles(pcd_files,
+                                       args.output_dir,
+                                       density_thresh=args.density_thresh,
+                                       min_point_thresh=args.min_point_thresh)
+
+            clean_params = dict(output_dir=args.output_dir,
+                                intensity_thresh=args.intensity_thresh,
+                                density_thresh=args.density_thresh,
+                                min_point_thresh=args.min_point_thresh,
+                                knn=args.knn,
+                                nSigma=args.nSigma,
+                                verbose=args.verbose,
+                                export=args.export,
+                                **cleanOptions(args))
+
+            segment_params = dict(output_dir=args.output_dir,
+                                  dem_grid_step=args.dem_grid_step,
+                                  empty_cell_fill_option=args.empty_cell_fill_option,
+                                  pcd_above_seafloor_thresh=args.pcd_above_seafloor_thresh,
+                                  intensity_threshold=args.intensity_threshold,
+                                  coral_cell_size=args.coral_cell_size,
+                                  fish_cell_size=args.fish_cell_size,
+                                  fish_min_comp_size=args.fish_min_comp_size,
+                                  coral_min_comp_size=args.coral_min_comp_size,
+                                  max_coral_pts=args.max_coral_pts,
+                                  exportOption=args.exportOption,
+                                  verbose=args.verbose,
+                                  max_thread_count=c2mThreadCount(args.workers),
+                                  **segmentOptions(args))
+
+            # Clean and segment each file, in parallel if more than one worker
+            runBatch(cleanSegmentFile, pcd_files, args=(clean_params, segment_params), workers=args.workers)
 
             tracks = lasProcess(input_dir=args.pcd_dir, output_dir=args.output_dir)
             tracks.run()
@@ -1045,7 +1224,7 @@ def main():
             images = imgProcess(input_dir=args.img_dir, output_dir=args.output_dir)
             images.run()
 
-            imgSort = IMGsort(tracks.tracksDf, images.imagesDf, tracks.output_dir)
+            imgSort = IMGsort(tracks.tracksDf, images.imagesDf, tracks.output_dir, output_mode=args.output_mode)
             imgSort.run()
         elif args.command == "FileRender":
 
@@ -212,9 +212,9 @@ def main():
                                         help='The Grid step used to create the DEM.')
 
     segment_parser_panel_4.add_argument('--empty_cell_fill_option', type=str, required=False,
-                                        default="KRIGING",
+                                        default="INTERPOLATE_DELAUNAY",
                                         metavar='Empty cell fill Option for DEM',
-                                        help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","INTERPOLATE_DELAUNAY","KRIGING"')
+                                        help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","FILL_NEAREST","INTERPOLATE_IDW","INTERPOLATE_DELAUNAY","KRIGING" (KRIGING is much slower)')
 
     segment_parser_panel_5 = segment_parser.add_argument_group('Other Optional Arguments',
                                                                'Provide a path to LAS file to clean.')
@@ -289,9 +289,9 @@ def main():
 
     # not working rn cant figure out how to add the choice to the end of the variable name
     segment_dir_parser_panel_4.add_argument('--empty_cell_fill_option', type=str, required=False,
-                                            default="KRIGING",
+                                            default="INTERPOLATE_DELAUNAY",
                                             metavar='Empty cell fill Ooption for DEM',
-                                            help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","INTERPOLATE_DELAUNAY","KRIGING"')
+                                            help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","FILL_NEAREST","INTERPOLATE_IDW","INTERPOLATE_DELAUNAY","KRIGING" (KRIGING is much slower)')
 
     segment_dir_parser_panel_5 = segment_dir_parser.add_argument_group('Other Optional Arguments',
                                                                        'Provide a path to LAS file to clean.')
@@ -400,9 +400,9 @@ def main():
 
     # not working rn cant figure out how to add the choice to the end of the variable name
     cleansegment_parser_panel_7.add_argument('--empty_cell_fill_option', type=str, required=False,
-                                             default="KRIGING",
+                                             default="INTERPOLATE_DELAUNAY",
                                              metavar='Empty cell fill Ooption for DEM',
-                                             help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","INTERPOLATE_DELAUNAY","KRIGING"')
+                                             help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","FILL_NEAREST","INTERPOLATE_IDW","INTERPOLATE_DELAUNAY","KRIGING" (KRIGING is much slower)')
 
     cleansegment_parser_panel_8 = cleansegment_parser.add_argument_group('Other Optional Arguments',
                                                                          'Provide a path to LAS file to clean.')
@@ -519,9 +519,9 @@ def main():
 
     # not working rn cant figure out how to add the choice to the end of the variable name
     cleansegment_dir_parser_panel_7.add_argument('--empty_cell_fill_option', type=str, required=False,
-                                                 default="KRIGING",
+                                                 default="INTERPOLATE_DELAUNAY",
                                                  metavar='Empty cell fill Ooption for DEM',
-                                                 help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","INTERPOLATE_DELAUNAY","KRIGING"')
+                                                 help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","FILL_NEAREST","INTERPOLATE_IDW","INTERPOLATE_DELAUNAY","KRIGING" (KRIGING is much slower)')
 
     cleansegment_dir_parser_panel_8 = cleansegment_dir_parser.add_argument_group('Other Optional Arguments',
                                                                                  'Provide a path to LAS file to clean.')
@@ -662,9 +662,9 @@ def main():
 
     # not working rn cant figure out how to add the choice to the end of the variable name
     cleansegmentsort_dir_parser_panel_7.add_argument('--empty_cell_fill_option', type=str, required=False,
-                                                     default="KRIGING",
+                                                     default="INTERPOLATE_DELAUNAY",
                                                      metavar='Empty cell fill Option for DEM',
-                                                     help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","INTERPOLATE_DELAUNAY","KRIGING"')
+                                                     help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","FILL_NEAREST","INTERPOLATE_IDW","INTERPOLATE_DELAUNAY","KRIGING" (KRIGING is much slower)')
 
     cleansegmentsort_dir_parser_panel_8 = cleansegmentsort_dir_parser.add_argument_group('Other Optional Arguments',
                                                                                          'Provide a path to LAS file to clean.')
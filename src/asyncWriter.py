@@ -0,0 +1,174 @@
+import os
+import threading
+import collections
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Constants
+# -----------------------------------------------------------------------------------------------------------
+
+# The clouds of the outputs waiting to be written may hold up to this much memory before submitting blocks
+WRITE_BUDGET_MB = 2048
+
+# Prefix of an output while it is being written (keeps the extension, which selects the file format)
+PARTIAL_PREFIX = ".part_"
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Functions
+# -----------------------------------------------------------------------------------------------------------
+
+# One writer per process: the batch workers are separate processes and clouds cannot be sent between them
+_writer = None
+
+
+def backgroundWriter(budget_mb=WRITE_BUDGET_MB):
+    """
+    The background writer of this process, created on first use (with this budget).
+    """
+    global _writer
+
+    if _writer is None:
+        _writer = asyncWriter(budget_mb)
+
+    return _writer
+
+
+def waitForWrite(output_file):
+    """
+    Waits until an output queued in the background writer of this process is written, e.g. before
+    changing the clouds it holds. Returns right away if the output is not queued.
+    """
+    if _writer is not None:
+        _writer.wait(output_file)
+
+
+def flushWrites(raise_errors=True):
+    """
+    Waits for the outputs of the background writer of this process, if it was used.
+
+    Args:
+    - raise_errors (bool): Raise an exception if an output could not be written.
+
+    Returns:
+    - list: (label, error) of the outputs that could not be written.
+    """
+    errors = _writer.flush() if _writer is not None else []
+
+    if errors and raise_errors:
+        raise Exception("Error: " + "\n".join(error for label, error in errors))
+
+    return errors
+
+
+def partialPath(output_file):
+    """
+    Path an output is written to before it is renamed to output_file.
+    """
+    return os.path.join(os.path.dirname(output_file), PARTIAL_PREFIX + os.path.basename(output_file))
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Classes
+# -----------------------------------------------------------------------------------------------------------
+
+class asyncWriter:
+    """
+    Bounded background writer for the outputs of the pipeline (BIN / LAS files): a background thread
+    serializes the clouds to their destination (e.g. the NAS) while the next track is loaded and
+    processed. The queued outputs keep their clouds alive, so the budget bounds the memory of the
+    clouds in flight: write blocks while it is exceeded (backpressure).
+
+    The clouds of an output must not be changed until it is written (wait).
+    """
+
+    def __init__(self, budget_mb=WRITE_BUDGET_MB):
+        self.budget_bytes = budget_mb * 2 ** 20
+
+        # Outputs waiting to be written: (save, output file, bytes held, label); the first one is being written
+        self.jobs = collections.deque()
+        self.pending_bytes = 0
+
+        # (label, error) of the outputs that could not be written since the last flush
+        self.errors = []
+
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def write(self, save, output_file, size_bytes=0, label=None):
+        """
+        Queues an output; blocks while the clouds of the queued outputs are over the budget (an output
+        larger than the budget is written on its own).
+
+        Args:
+        - save (callable): Serializes the output to the path it is given, e.g.
+          functools.partial(cc.SavePointCloud, cloud).
+        - output_file (str): Destination of the output.
+        - size_bytes (int): Memory held by the clouds of the output until it is written.
+        - label (str): Reported with the errors, e.g. the LAS file the output comes from.
+        """
+        with self.condition:
+            while self.pending_bytes > 0 and self.pending_bytes + size_bytes > self.budget_bytes:
+                self.condition.wait()
+
+            self.jobs.append((save, output_file, size_bytes, label))
+            self.pending_bytes += size_bytes
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="asyncWriter")
+                self.thread.start()
+
+    def run(self):
+        """
+        Writes the queued outputs one at a time; the thread stops when the queue is empty.
+        """
+        while True:
+            with self.condition:
+                if len(self.jobs) == 0:
+                    self.thread = None
+                    self.condition.notify_all()
+                    return
+
+                save, output_file, size_bytes, label = self.jobs[0]
+
+            # Written under a temporary name so a partial output is never mistaken for a complete one
+            partial_file = partialPath(output_file)
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+                save(partial_file)
+                os.replace(partial_file, output_file)
+
+            except Exception as e:
+                print(f"Warning: Could not write {os.path.basename(output_file)}\n{e}")
+                self.errors.append((label, f"Could not write {output_file}: {e}"))
+
+                if os.path.exists(partial_file):
+                    os.remove(partial_file)
+
+            with self.condition:
+                self.jobs.popleft()
+                self.pending_bytes -= size_bytes
+                self.condition.notify_all()
+
+    def wait(self, output_file):
+        """
+        Waits until an output is written (returns right away if it is not queued).
+        """
+        with self.condition:
+            while any(job[1] == output_file for job in self.jobs):
+                self.condition.wait()
+
+    def flush(self):
+        """
+        Waits until every queued output is written.
+
+        Returns:
+        - list: (label, error) of the outputs that could not be written since the last flush.
+        """
+        with self.condition:
+            while self.thread is not None:
+                self.condition.wait()
+
+            errors, self.errors = self.errors, []
+
+        return errors
@@ -0,0 +1,154 @@
+import os
+import time
+import traceback
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
+import psutil
+
+from common import announce
+from asyncWriter import flushWrites
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Functions
+# -----------------------------------------------------------------------------------------------------------
+
+# Barrier of the worker processes of a batch, set by initWorker
+_flushBarrier = None
+
+
+def initWorker(barrier):
+    """
+    Initializer of the worker processes of runBatch.
+    """
+    global _flushBarrier
+    _flushBarrier = barrier
+
+
+def flushWorker():
+    """
+    Waits for the background writes of the worker process this runs in. Sent once per worker at the
+    end of a batch; the barrier holds each worker until all of them took one, so no worker takes two.
+
+    Returns:
+    - list: (label, error) of the outputs that could not be written.
+    """
+    errors = flushWrites(raise_errors=False)
+    _flushBarrier.wait()
+
+    return errors
+
+
+def markFailedWrites(results, errors):
+    """
+    Marks the files whose outputs could not be written (background writer) as failed.
+    """
+    failedWrites = dict(errors)
+    for result in results:
+        if result['file'] in failedWrites:
+            result['status'], result['error'] = "failed", failedWrites[result['file']]
+
+
+def c2mThreadCount(workers):
+    """
+    Determine how many threads each worker may use for the C2M distance computation so that the
+    process pool does not oversubscribe the CPU.
+
+    Args:
+    - workers (int): Number of worker processes in the pool.
+
+    Returns:
+    - int: Threads available to each worker (at least 1).
+    """
+    return max(1, psutil.cpu_count() // max(1, workers))
+
+
+def runFile(function, pcd_file, *args):
+    """
+    Runs a single file through the provided function, catching any error so that one bad
+    track does not stop the rest of the batch.
+
+    Args:
+    - function (callable): Function that processes a single LAS file.
+    - pcd_file (str): Path to the LAS file.
+
+    Returns:
+    - dict: Per-file result (file, status, minutes, error).
+    """
+    t0 = time.time()
+
+    try:
+        function(pcd_file, *args)
+        status, error = "success", ""
+
+    except Exception as e:
+        print(f"ERROR: {os.path.basename(pcd_file)} failed\n{e}")
+        print(traceback.print_exc())
+        status, error = "failed", str(e)
+
+    return {'file': pcd_file,
+            'status': status,
+            'minutes': np.around(((time.time() - t0) / 60), 2),
+            'error': error}
+
+
+def runBatch(function, pcd_files, args=(), workers=1):
+    """
+    Runs every LAS file through the provided function. If workers is greater than 1, each
+    file is sent to its own worker process; otherwise the files are processed one at a time.
+
+    Args:
+    - function (callable): Module-level function that processes a single LAS file.
+    - pcd_files (list): Paths to the LAS files.
+    - args (tuple): Extra arguments passed to the function after the file path.
+    - workers (int): Number of worker processes.
+
+    Returns:
+    - list: Per-file results, in the same order as pcd_files.
+    """
+    if workers <= 1 or len(pcd_files) <= 1:
+        results = [runFile(function, pcd_file, *args) for pcd_file in pcd_files]
+
+        # The outputs of a track are written in the background while the next one is processed
+        markFailedWrites(results, flushWrites(raise_errors=False))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=initWorker,
+                                                    initargs=(multiprocessing.Barrier(workers),)) as executor:
+            futures = [executor.submit(runFile, function, pcd_file, *args) for pcd_file in pcd_files]
+            results = []
+
+            for pcd_file, future in zip(pcd_files, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    # The worker process itself died (e.g. out of memory)
+                    results.append({'file': pcd_file, 'status': "failed", 'minutes': np.nan, 'error': str(e)})
+
+            # Each worker writes its outputs in the background while it processes its next file; they are
+            # waited for once, before the pool shuts down
+            try:
+                flushes = [executor.submit(flushWorker) for _ in range(workers)]
+                markFailedWrites(results, [error for flush in flushes for error in flush.result()])
+            except Exception as e:
+                print(f"ERROR: Could not wait for the background writes of the workers\n{e}")
+
+    summarizeBatch(results)
+
+    return results
+
+
+def summarizeBatch(results):
+    """
+    Prints the success / failure of each file in a batch.
+    """
+    failed = [result for result in results if result['status'] != "success"]
+
+    announce(f"Batch Summary: {len(results) - len(failed)} succeeded, {len(failed)} failed")
+
+    for result in results:
+        print(f"{result['status'].upper():<8} {result['minutes']:>8} min   {os.path.basename(result['file'])}")
+
+        if result['error']:
+            print(f"         {result['error']}")
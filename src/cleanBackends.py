@@ -0,0 +1,273 @@
+import itertools
+
+import numpy as np
+from scipy import ndimage
+from scipy.spatial import cKDTree
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Constants
+# -----------------------------------------------------------------------------------------------------------
+
+# Backends cleanCloud can run its filters with
+CLEAN_BACKENDS = ["cloudcompare", "numpy"]
+
+# Defaults of cc.CSF.computeCSF, which cleanCloud calls without parameters
+CLOTH_RESOLUTION = 2.0
+CLASS_THRESHOLD = 0.5
+
+# Modes of the SOR filter: exact k-NN distances, or the voxel occupancy approximation
+SOR_MODES = ["exact", "voxel"]
+
+# Number of points the exact SOR is computed for when reporting the agreement of the voxel mode
+SOR_AGREEMENT_SAMPLE = 100_000
+
+# Cell size (meters) of the grid the surface density of the points is estimated with
+DENSITY_CELL = 1.0
+
+# Corrections of the voxel size for the vertical spread of the points
+VOXEL_SIZE_ITERATIONS = 3
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Functions
+# -----------------------------------------------------------------------------------------------------------
+
+def intensityMask(intensity, intensity_thresh):
+    """
+    Points kept by the intensity filter (intensity >= intensity_thresh), as filterBySFValue does.
+    """
+    return np.asarray(intensity) >= intensity_thresh
+
+
+def sorMask(xyz, knn=6, nSigma=10, workers=-1):
+    """
+    Statistical outlier removal with the semantics of CloudSamplingTools.sorFilter: the mean
+    distance of every point to its knn nearest neighbors is computed, and points whose mean
+    distance is above (average + nSigma * standard deviation) are removed.
+
+    Args:
+    - xyz (np.ndarray): (N, 3) coordinates.
+    - knn (int): Number of neighbors.
+    - nSigma (float): Number of standard deviations.
+    - workers (int): Threads used by the neighbor queries (-1 uses every core).
+
+    Returns:
+    - np.ndarray: Boolean mask of the kept points.
+    """
+    if len(xyz) <= knn:
+        return np.ones(len(xyz), dtype=bool)
+
+    # The closest "neighbor" of each point is the point itself
+    distances, _ = cKDTree(xyz).query(xyz, k=knn + 1, workers=workers)
+    meanDistances = distances[:, 1:].mean(axis=1)
+
+    return meanDistances <= meanDistances.mean() + nSigma * meanDistances.std()
+
+
+def voxelSize(xyz, knn=6, iterations=VOXEL_SIZE_ITERATIONS):
+    """
+    Voxel side of the approximate SOR, chosen so an occupied voxel holds about knn points and the
+    3 x 3 x 3 voxels around a point contain its nearest neighbors. Starts from the surface density
+    of the points and corrects it for their vertical spread.
+    """
+    cells = np.floor((xyz[:, :2] - xyz[:, :2].min(axis=0)) / DENSITY_CELL).astype(np.int64)
+    occupied = len(np.unique(cells[:, 0] * (cells[:, 1].max() + 1) + cells[:, 1]))
+    voxel_size = np.sqrt(knn * occupied * DENSITY_CELL ** 2 / len(xyz))
+
+    for _ in range(iterations):
+        ijk = np.floor((xyz - xyz.min(axis=0)) / voxel_size).astype(np.int64)
+        dims = ijk.max(axis=0) + 1
+        occupancy = len(xyz) / len(np.unique((ijk[:, 0] * dims[1] + ijk[:, 1]) * dims[2] + ijk[:, 2]))
+
+        # Occupancy grows with the voxel size to a power between 2 (surface) and 3 (volume)
+        voxel_size *= (knn / occupancy) ** (1 / 3)
+
+    return voxel_size
+
+
+def voxelNeighborCounts(xyz, voxel_size):
+    """
+    Number of other points in the 3 x 3 x 3 voxels around every point. The occupied voxels are
+    hashed once (sorted keys), then each of the 27 neighbor offsets is one vectorized lookup.
+
+    Args:
+    - xyz (np.ndarray): (N, 3) coordinates.
+    - voxel_size (float): Side of a voxel (meters).
+
+    Returns:
+    - np.ndarray: Neighbor count of every point.
+    """
+    # Voxel indices start at 1 so the neighbors of the border voxels have valid keys
+    ijk = np.floor((xyz - xyz.min(axis=0)) / voxel_size).astype(np.int64) + 1
+    dims = ijk.max(axis=0) + 2
+    keys = (ijk[:, 0] * dims[1] + ijk[:, 1]) * dims[2] + ijk[:, 2]
+
+    voxelKeys, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+
+    neighborCounts = np.zeros(len(voxelKeys), dtype=np.int64)
+    for di, dj, dk in itertools.product((-1, 0, 1), repeat=3):
+        neighborKeys = voxelKeys + (di * dims[1] + dj) * dims[2] + dk
+        position = np.minimum(np.searchsorted(voxelKeys, neighborKeys), len(voxelKeys) - 1)
+        found = voxelKeys[position] == neighborKeys
+        neighborCounts[found] += counts[position[found]]
+
+    return neighborCounts[inverse.ravel()] - 1
+
+
+def voxelSorMask(xyz, knn=6, nSigma=10, voxel_size=None):
+    """
+    Approximate statistical outlier removal from voxel occupancy instead of k-NN queries. On a
+    surface the mean distance to the k nearest neighbors scales with 1 / sqrt(local density), so
+    it is estimated from the neighbor count of each point and thresholded like sorFilter
+    (average + nSigma * standard deviation); points without any neighbor are always removed.
+
+    Args:
+    - xyz (np.ndarray): (N, 3) coordinates.
+    - knn (int): Number of neighbors of the exact filter.
+    - nSigma (float): Number of standard deviations.
+    - voxel_size (float): Side of a voxel (meters), derived from the point density by default.
+
+    Returns:
+    - np.ndarray: Boolean mask of the kept points.
+    """
+    if len(xyz) <= knn:
+        return np.ones(len(xyz), dtype=bool)
+
+    if voxel_size is None:
+        voxel_size = voxelSize(xyz, knn)
+
+    neighbors = voxelNeighborCounts(xyz, voxel_size)
+    isolated = neighbors == 0
+
+    # Only the relative distances matter, the threshold is in standard deviations
+    distances = 1 / np.sqrt(np.maximum(neighbors, 1))
+    threshold = distances[~isolated].mean() + nSigma * distances[~isolated].std() if np.any(~isolated) else 0
+
+    return ~isolated & (distances <= threshold)
+
+
+def sorAgreement(xyz, voxelMask, knn=6, nSigma=10, sample_size=SOR_AGREEMENT_SAMPLE, workers=-1):
+    """
+    Compares the voxel SOR with the exact SOR on a random sample: the exact mean k-NN distance is
+    only computed for the sampled points (against all the points), with the threshold taken from
+    the sample statistics.
+
+    Args:
+    - xyz (np.ndarray): (N, 3) coordinates the voxel SOR ran on.
+    - voxelMask (np.ndarray): Result of voxelSorMask.
+    - knn (int): Number of neighbors.
+    - nSigma (float): Number of standard deviations.
+    - sample_size (int): Number of sampled points.
+    - workers (int): Threads used by the neighbor queries (-1 uses every core).
+
+    Returns:
+    - dict: Counts over the sample (sample_points, agreeing_points, exact_removed, voxel_removed),
+      they can be summed over tiles.
+    """
+    if len(xyz) <= knn:
+        return dict(sample_points=0, agreeing_points=0, exact_removed=0, voxel_removed=0)
+
+    sample = np.random.default_rng(0).choice(len(xyz), size=min(sample_size, len(xyz)), replace=False)
+
+    distances, _ = cKDTree(xyz).query(xyz[sample], k=knn + 1, workers=workers)
+    meanDistances = distances[:, 1:].mean(axis=1)
+    exactMask = meanDistances <= meanDistances.mean() + nSigma * meanDistances.std()
+
+    return dict(sample_points=len(sample),
+                agreeing_points=int(np.sum(exactMask == voxelMask[sample])),
+                exact_removed=int(np.sum(~exactMask)),
+                voxel_removed=int(np.sum(~voxelMask[sample])))
+
+
+def sorReport(agreement):
+    """
+    Agreement of the voxel SOR with the exact SOR, as fractions of the sampled points.
+    """
+    sample_points = max(agreement['sample_points'], 1)
+
+    return dict(sor_sample_points=agreement['sample_points'],
+                sor_agreement=np.around(agreement['agreeing_points'] / sample_points, 5),
+                sor_exact_removed=np.around(agreement['exact_removed'] / sample_points, 5),
+                sor_voxel_removed=np.around(agreement['voxel_removed'] / sample_points, 5))
+
+
+def sorFilterMask(xyz, knn=6, nSigma=10, sor_mode="exact", workers=-1):
+    """
+    SOR filter in either mode; the voxel mode also measures its agreement with the exact filter.
+
+    Returns:
+    - np.ndarray: Boolean mask of the kept points.
+    - dict: Agreement counts (sorAgreement), None in exact mode.
+    """
+    if sor_mode == "voxel":
+        keep = voxelSorMask(xyz, knn=knn, nSigma=nSigma)
+        return keep, sorAgreement(xyz, keep, knn=knn, nSigma=nSigma, workers=workers)
+
+    return sorMask(xyz, knn=knn, nSigma=nSigma, workers=workers), None
+
+
+def clothSurface(xyz, cloth_resolution=CLOTH_RESOLUTION):
+    """
+    Grid approximation of the cloth of the CSF filter: the lowest point of every cell, with empty
+    cells taken from the nearest filled cell, smoothed over the neighbouring cells the way the
+    rigid cloth bridges small pits.
+
+    Returns:
+    - np.ndarray: Height of the surface under every point.
+    """
+    cells = np.floor((xyz[:, :2] - xyz[:, :2].min(axis=0)) / cloth_resolution).astype(np.int64)
+    shape = tuple(cells.max(axis=0) + 1)
+
+    surface = np.full(shape, np.inf)
+    np.minimum.at(surface, (cells[:, 0], cells[:, 1]), xyz[:, 2])
+
+    empty = np.isinf(surface)
+    if np.any(empty):
+        nearest = ndimage.distance_transform_edt(empty, return_distances=False, return_indices=True)
+        surface = surface[tuple(nearest)]
+
+    surface = ndimage.uniform_filter(surface, size=3, mode='nearest')
+
+    return surface[cells[:, 0], cells[:, 1]]
+
+
+def groundSplit(xyz, cloth_resolution=CLOTH_RESOLUTION, class_threshold=CLASS_THRESHOLD):
+    """
+    Grid-based ground / off-ground separation standing in for cc.CSF.computeCSF; the two masks are
+    returned in the same order as the clouds of computeCSF (low Z points, high Z points).
+
+    Args:
+    - xyz (np.ndarray): (N, 3) coordinates.
+    - cloth_resolution (float): Cell size of the cloth (meters).
+    - class_threshold (float): Points within this height of the cloth are low Z points (meters).
+
+    Returns:
+    - np.ndarray: Mask of the low Z points.
+    - np.ndarray: Mask of the high Z points.
+    """
+    if len(xyz) == 0:
+        return np.zeros(0, dtype=bool), np.zeros(0, dtype=bool)
+
+    lowZ = xyz[:, 2] - clothSurface(xyz, cloth_resolution) <= class_threshold
+
+    return lowZ, ~lowZ
+
+
+def cleanPoints(xyz, knn=6, nSigma=10, workers=-1, sor_mode="exact", highZ=None):
+    """
+    Runs the ground separation and the SOR filter of cleanCloud on points that already passed
+    the intensity filter. A high Z mask computed before (e.g. from the CSF cache) skips the
+    ground separation.
+
+    Returns:
+    - np.ndarray: Indices (into xyz) of the cleaned points, in ascending order.
+    - dict: Agreement counts of the voxel SOR (sorAgreement), None in exact mode.
+    """
+    if highZ is None:
+        lowZ, highZ = groundSplit(xyz)
+
+    highZIndex = np.flatnonzero(highZ)
+    keep, agreement = sorFilterMask(xyz[highZIndex], knn=knn, nSigma=nSigma, sor_mode=sor_mode, workers=workers)
+
+    return highZIndex[keep], agreement
@@ -1,17 +1,31 @@
 import os
 import time
+import shutil
+import functools
 import argparse
 import traceback
 
 import numpy as np
 
-import cloudComPy as cc
-import cloudComPy.CSF
+# CloudComPy is only needed by the "cloudcompare" cleaning backend
+try:
+    import cloudComPy as cc
+    import cloudComPy.CSF
 
-# import CloudCompare.cloudComPy as cc
-# import CloudCompare.cloudComPy.CSF
+    # import CloudCompare.cloudComPy as cc
+    # import CloudCompare.cloudComPy.CSF
+except ImportError:
+    cc = None
 
-from common import announce
+from common import announce, peakMemoryMB
+from pipelineContext import pipelineContext
+from lasReader import readLasHeader, countPoints, readPoints, readPointsAt, memmapRecords, writeLasFile, GPS_TIME_FORMATS
+from lasLoader import loadPointCloud, cloudFromColumns, entityBytes, maskedCloud, addPointIndex, pointIndex, deleteScalarFields, POINT_INDEX_SF
+from tiledClean import cleanTiled
+from cleanBackends import cleanPoints, groundSplit, sorFilterMask, sorReport, CLEAN_BACKENDS, SOR_MODES
+from cleanBackends import CLOTH_RESOLUTION, CLASS_THRESHOLD
+from csfCache import csfCache, CSF_CACHE_MAX_MB
+from asyncWriter import backgroundWriter, WRITE_BUDGET_MB
 
 
 # -----------------------------------------------------------------------------------------------------------
@@ -28,7 +42,18 @@ class cleanCloud:
                  knn=6,
                  nSigma=10,
                  verbose=False,
-                 export=True):
+                 export=True,
+                 export_coord_sf=False,
+                 pushdown=False,
+                 tile_size=None,
+                 tile_halo=1.0,
+                 tile_workers=1,
+                 backend="cloudcompare",
+                 sor_mode="exact",
+                 csf_cache=True,
+                 csf_cache_mb=CSF_CACHE_MAX_MB,
+                 async_writes=False,
+                 write_budget_mb=WRITE_BUDGET_MB):
 
         # Input PCD (las) file, checks
         self.pcd_file = pcd_file
@@ -53,6 +78,28 @@ class cleanCloud:
 
         self.SF_export = None
 
+        # Only add X / Y / Z coordinate scalar fields (12 bytes per point, copied by every later filter) if asked
+        self.export_coord_sf = export_coord_sf
+
+        # Apply the intensity threshold while reading the LAS file and only load XYZ + intensity;
+        # the original cloud then only holds the points above the threshold
+        self.pushdown = pushdown
+
+        # Clean the track tile by tile (side in meters) when it does not fit in memory; the halo is the
+        # overlap read around each tile so the filters behave the same at the tile edges
+        self.tile_size = tile_size
+        self.tile_halo = tile_halo
+        self.tile_workers = tile_workers
+
+        # Library the filters run with: "cloudcompare" (CSF / sorFilter) or "numpy" (NumPy / SciPy)
+        assert backend in CLEAN_BACKENDS, f"Error: backend must be one of {CLEAN_BACKENDS}"
+        if backend == "cloudcompare" and cc is None:
+            raise Exception("Error: CloudComPy is not installed, use the 'numpy' backend")
+        self.backend = backend
+
+        # Hands the clouds to the next stage (segmentation) without writing / re-reading the LAS file
+        self.context = pipelineContext(self.pcd_file)
+
         # Threshold values for filtering
         self.intensity_thresh = intensity_thresh
         self.perimeter_thresh = density_thresh
@@ -62,9 +109,26 @@ class cleanCloud:
         self.knn = knn
         self.nSigma = nSigma
 
+        # "exact" (k-NN) or "voxel" (approximate, voxel occupancy) SOR; the voxel mode reports its
+        # agreement with the exact filter on a sample of the points
+        assert sor_mode in SOR_MODES, f"Error: sor_mode must be one of {SOR_MODES}"
+        self.sor_mode = sor_mode
+        self.sorReport = {}
+
+        # Reuse the ground separation of a previous run on the same file with the same intensity
+        # threshold and CSF parameters (masks kept in a .csf_cache directory next to the LAS file)
+        self.csf_cache = csf_cache
+        self.csf_cache_mb = csf_cache_mb
+        self.csfCache = None
+        self.csf_cached = False
+
         # Should the cleaned las Files be Exported
         self.export_result = export
 
+        # Write the outputs in the background, while the next track is processed (waited for by runBatch)
+        self.async_writes = async_writes
+        self.write_budget_mb = write_budget_mb
+
         # Only print if True
         self.verbose = verbose
 
@@ -72,10 +136,20 @@ class cleanCloud:
         """
         Loads the provided PCD (LAS) file.
         """
+        if self.tile_size or self.backend == "numpy":
+            # Tiles / arrays are read while cleaning
+            return
+
         try:
             # Load the original point cloud
-            self.originalPointCloud = cc.loadPointCloud(self.pcd_file)
+            if self.pushdown:
+                self.originalPointCloud = loadPointCloud(self.pcd_file,
+                                                         fields=('intensity',),
+                                                         min_intensity=self.intensity_thresh)
+            else:
+                self.originalPointCloud = cc.loadPointCloud(self.pcd_file)
             self.originalPointCloud.setName("Original Point Cloud")
+            self.context.originalPointCloud = self.originalPointCloud
 
         except Exception as e:
             print(traceback.print_exc())
@@ -89,6 +163,14 @@ class cleanCloud:
         """
         t0 = time.time()
 
+        if self.tile_size:
+            self.cleanTiles(t0)
+            return
+
+        if self.backend == "numpy":
+            self.cleanArrays(t0)
+            return
+
         # Load the PCD from file
         if self.originalPointCloud is None:
             raise Exception("Error: You must use load_pcd before cleaning")
@@ -96,31 +178,41 @@ class cleanCloud:
         if self.verbose:
             announce(f"Cleaning {self.pcd_name}")
 
-        # Export coordinate to scalar fields (leave in case needed later)
-        self.SF_export = self.originalPointCloud.exportCoordToSF(True, True, True)
+        # Export coordinate to scalar fields, only on request (the extents come from the bounding box)
+        if self.export_coord_sf:
+            self.SF_export = self.originalPointCloud.exportCoordToSF(True, True, True)
 
         # Get scalar fields
-        scalarFieldX = self.originalPointCloud.getScalarField(3)
-        scalarFieldY = self.originalPointCloud.getScalarField(4)
-        scalarFieldZ = self.originalPointCloud.getScalarField(5)
         scalarFieldDictionary = self.originalPointCloud.getScalarFieldDic()
 
         if self.verbose:
             print(f"Export Result: \n {self.SF_export} \n")
             print(f"Scalar Field Dictionary: \n {scalarFieldDictionary} \n")
 
-        # Calculate the intensity scalar field (shape), set to 0 by default
-        intensityScalarField = self.originalPointCloud.getScalarField(scalarFieldDictionary['Intensity'])
-        self.originalPointCloud.setCurrentScalarField(0)
-
-        # Filter out lowest intensity values -> values below 100 (default)
-        self.filteredIntensityCloud = cc.filterBySFValue(self.intensity_thresh,
-                                                         intensityScalarField.getMax(),
-                                                         self.originalPointCloud)
+        if self.pushdown:
+            # The lowest intensity values were already dropped while loading
+            self.filteredIntensityCloud = self.originalPointCloud
+
+            # Shape of the whole track (before filtering), from the LAS header
+            header = readLasHeader(self.pcd_file)
+            y_across = abs(header['max_y'] - header['min_y'])
+            x_across = abs(header['max_x'] - header['min_x'])
+        else:
+            # Calculate the intensity scalar field (shape), set to 0 by default
+            intensityScalarField = self.originalPointCloud.getScalarField(scalarFieldDictionary['Intensity'])
+            self.originalPointCloud.setCurrentScalarField(0)
+
+            # Filter out lowest intensity values -> values below 100 (default)
+            self.filteredIntensityCloud = cc.filterBySFValue(self.intensity_thresh,
+                                                             intensityScalarField.getMax(),
+                                                             self.originalPointCloud)
+
+            # Calculate the shape of the point cloud from its bounding box
+            boundingBox = self.originalPointCloud.getOwnBB()
+            minCorner, maxCorner = boundingBox.minCorner(), boundingBox.maxCorner()
+            y_across = abs(maxCorner[1] - minCorner[1])
+            x_across = abs(maxCorner[0] - minCorner[0])
 
-        # Calculate the shape of the point cloud
-        y_across = abs(abs(scalarFieldY.getMin()) - abs(scalarFieldY.getMax()))
-        x_across = abs(abs(scalarFieldX.getMin()) - abs(scalarFieldX.getMax()))
         area_total = x_across * y_across
         pts_per_squared = self.filteredIntensityCloud.size() / area_total
 
@@ -133,27 +225,306 @@ class cleanCloud:
         if pts_per_squared < self.perimeter_thresh or self.filteredIntensityCloud.size() < self.min_point_thresh:
             # If the modified point cloud is too small, save it to trash folder
             trash_file = f"{self.trash_dir}/BAD_{self.pcd_name}"
-            cc.SavePointCloud(self.originalPointCloud, trash_file)
+            if self.pushdown:
+                # Only part of the track is in memory, keep the complete file
+                shutil.copyfile(self.pcd_file, trash_file)
+            else:
+                self.save(functools.partial(cc.SavePointCloud, self.originalPointCloud), trash_file,
+                          entityBytes(self.originalPointCloud))
             print(f"Warning: PCD file is considered bad, output as {os.path.basename(trash_file)}")
+
+            self.context.status = "bad"
+            self.context.record("clean",
+                                points_per_squared=pts_per_squared,
+                                trash_file=trash_file,
+                                peak_rss_mb=np.around(peakMemoryMB(), 1))
             return
 
         # Compute CSF (Conditional Sampling Framework) plugin for filtering lowest z values
-        clouds = cc.CSF.computeCSF(self.filteredIntensityCloud)
-        lowZPoints, highZPoints = clouds[0:2]
+        highZPoints = self.splitGround()
 
         # Remove statistical outliers using SOR filter, update cleaned point cloud
         # https://www.simulation.openfields.fr/documentation/CloudComPy/html/cloudSamplingTools.html#cloudComPy.CloudSamplingTools.sorFilter
-        cloudReference = cc.CloudSamplingTools.sorFilter(knn=self.knn, nSigma=self.nSigma, cloud=highZPoints)
-        self.cleanedPointCloud, res = highZPoints.partialClone(cloudReference)
+        if self.sor_mode == "voxel":
+            self.cleanedPointCloud = self.voxelSor(highZPoints)
+        else:
+            cloudReference = cc.CloudSamplingTools.sorFilter(knn=self.knn, nSigma=self.nSigma, cloud=highZPoints)
+            self.cleanedPointCloud, res = highZPoints.partialClone(cloudReference)
         self.cleanedPointCloud.setName("Cleaned Point Cloud")
 
         if self.export_result:
             self.output_file = f"{self.output_dir}/CLEAN_{self.pcd_name}"
-            cc.SavePointCloud(self.cleanedPointCloud, self.output_file)
+            self.save(functools.partial(cc.SavePointCloud, self.cleanedPointCloud), self.output_file,
+                      entityBytes(self.cleanedPointCloud))
             print(f"Exported {os.path.basename(self.output_file)}")
 
+        self.context.cleanedPointCloud = self.cleanedPointCloud
+        self.context.status = "clean"
+        self.context.record("clean",
+                            points_per_squared=pts_per_squared,
+                            cleaned_points=self.cleanedPointCloud.size(),
+                            output_file=self.output_file,
+                            minutes=np.around(((time.time() - t0) / 60), 2),
+                            peak_rss_mb=np.around(peakMemoryMB(), 1),
+                            csf_cached=self.csf_cached,
+                            handoff="memory",
+                            **self.sorReport)
+
         print(f"Completed in {np.around(((time.time() - t0) / 60), 2)} minutes")
 
+        if self.verbose:
+            print(f"Peak memory (RSS): {np.around(peakMemoryMB(), 1)} MB")
+
+    def csfParams(self):
+        """
+        Parameters the ground separation depends on, besides the file content (CSF cache key).
+        """
+        return dict(intensity_thresh=self.intensity_thresh,
+                    backend=self.backend,
+                    cloth_resolution=CLOTH_RESOLUTION,
+                    class_threshold=CLASS_THRESHOLD)
+
+    def cachedHighZ(self, point_count):
+        """
+        High Z mask of the intensity filtered points from the CSF cache.
+
+        Returns:
+        - np.ndarray: Boolean mask, None if the split is not cached (or the cache is off).
+        """
+        if not self.csf_cache:
+            return None
+
+        if self.csfCache is None:
+            self.csfCache = csfCache(self.pcd_file, max_mb=self.csf_cache_mb)
+
+        highZ = self.csfCache.load(self.csfParams(), point_count)
+        self.csf_cached = highZ is not None
+
+        if self.verbose and self.csf_cached:
+            print("Reusing the cached ground separation (CSF)")
+
+        return highZ
+
+    def splitGround(self):
+        """
+        Ground separation (CSF) of the intensity filtered cloud, read from the CSF cache when
+        possible and cached otherwise.
+
+        Returns:
+        - ccPointCloud: The high Z points.
+        """
+        point_count = self.filteredIntensityCloud.size()
+
+        highZ = self.cachedHighZ(point_count)
+        if highZ is not None:
+            return maskedCloud(self.filteredIntensityCloud, highZ)
+
+        if self.csf_cache:
+            # Traces the high Z points back to the filtered cloud to build the mask
+            addPointIndex(self.filteredIntensityCloud)
+
+        clouds = cc.CSF.computeCSF(self.filteredIntensityCloud)
+        lowZPoints, highZPoints = clouds[0:2]
+
+        if self.csf_cache:
+            highZ = np.zeros(point_count, dtype=bool)
+            highZ[pointIndex(highZPoints)] = True
+            self.csfCache.save(self.csfParams(), highZ)
+
+            deleteScalarFields(highZPoints, POINT_INDEX_SF)
+            deleteScalarFields(self.filteredIntensityCloud, POINT_INDEX_SF)
+
+        return highZPoints
+
+    def voxelSor(self, cloud):
+        """
+        Approximate SOR filter (cleanBackends.voxelSorMask) of a cloud.
+
+        Returns:
+        - ccPointCloud: The kept points.
+        """
+        keep, agreement = sorFilterMask(cloud.toNpArrayCopy(), knn=self.knn, nSigma=self.nSigma, sor_mode="voxel")
+        self.reportSor(agreement)
+
+        return maskedCloud(cloud, keep)
+
+    def reportSor(self, agreement):
+        """
+        Keeps (and prints) the agreement of the voxel SOR with the exact SOR for the clean record.
+        """
+        if agreement is None:
+            return
+
+        self.sorReport = sorReport(agreement)
+        print(f"Voxel SOR agrees with exact SOR on {self.sorReport['sor_agreement']:.2%} of "
+              f"{self.sorReport['sor_sample_points']} sampled points "
+              f"(removed: exact {self.sorReport['sor_exact_removed']:.3%}, "
+              f"voxel {self.sorReport['sor_voxel_removed']:.3%})")
+
+    def save(self, save, output_file, size_bytes=0):
+        """
+        Writes an output with save(path); with async_writes it is written in the background
+        (asyncWriter), size_bytes being the memory its clouds hold until then.
+        """
+        if self.async_writes:
+            backgroundWriter(self.write_budget_mb).write(save, output_file, size_bytes=size_bytes, label=self.pcd_file)
+        else:
+            save(output_file)
+
+    def trackIsBad(self, filtered_points):
+        """
+        Density check of clean for the modes that never load the whole track: the extent comes from
+        the LAS header. If the track is bad, the file is copied to the trash folder.
+
+        Args:
+        - filtered_points (int): Number of points above the intensity threshold.
+
+        Returns:
+        - float: Points per meter squared.
+        - bool: True if the track is bad.
+        """
+        header = readLasHeader(self.pcd_file)
+        area_total = abs(header['max_x'] - header['min_x']) * abs(header['max_y'] - header['min_y'])
+        pts_per_squared = filtered_points / area_total
+
+        if self.verbose:
+            print(f"Area Total: {area_total}")
+            print(f"Points Perimeter (^2): {pts_per_squared}")
+
+        if pts_per_squared < self.perimeter_thresh or filtered_points < self.min_point_thresh:
+            # If the modified point cloud is too small, save it to trash folder
+            trash_file = f"{self.trash_dir}/BAD_{self.pcd_name}"
+            shutil.copyfile(self.pcd_file, trash_file)
+            print(f"Warning: PCD file is considered bad, output as {os.path.basename(trash_file)}")
+
+            self.context.status = "bad"
+            self.context.record("clean", points_per_squared=pts_per_squared, trash_file=trash_file)
+            return pts_per_squared, True
+
+        return pts_per_squared, False
+
+    def recordClean(self, t0, pts_per_squared, cleaned_points):
+        """
+        Marks the track clean once its result has been written to self.output_file; the next stage
+        reads it from there unless the cleaned cloud was handed over (context.cleanedPointCloud).
+        """
+        print(f"Exported {os.path.basename(self.output_file)}")
+
+        self.context.status = "clean"
+        self.context.record("clean",
+                            points_per_squared=pts_per_squared,
+                            cleaned_points=cleaned_points,
+                            output_file=self.output_file,
+                            minutes=np.around(((time.time() - t0) / 60), 2),
+                            peak_rss_mb=np.around(peakMemoryMB(), 1),
+                            csf_cached=self.csf_cached,
+                            handoff="memory" if self.context.isClean() else "disk",
+                            **self.sorReport)
+
+        print(f"Completed in {np.around(((time.time() - t0) / 60), 2)} minutes")
+
+    def handOver(self, recordIndex, header):
+        """
+        Builds the cleaned cloud of the numpy backend from the kept records, so segmentation gets it in
+        memory like with the cloudcompare backend. As when the cleaned file is loaded, it is also the
+        original cloud of the context; only XYZ, intensity, GPS time and classification are loaded.
+
+        Args:
+        - recordIndex (np.ndarray): Sorted positions of the kept records in the LAS file.
+        - header (dict): Header returned by readLasHeader.
+        """
+        fields = ('intensity', 'classification')
+        if header['point_format'] in GPS_TIME_FORMATS:
+            fields += ('gps_time',)
+
+        columns, header = readPointsAt(self.pcd_file, recordIndex, fields=('X', 'Y', 'Z') + fields, header=header)
+
+        self.cleanedPointCloud = cloudFromColumns("Cleaned Point Cloud", columns, header, fields=fields)
+        self.context.originalPointCloud = self.cleanedPointCloud
+        self.context.cleanedPointCloud = self.cleanedPointCloud
+
+    def cleanTiles(self, t0):
+        """
+        Out-of-core version of clean: the same checks and filters, run tile by tile with the result
+        streamed to the output file; no cloud of the whole track is kept in memory, so the next stage
+        reads the output file.
+        """
+        if self.verbose:
+            announce(f"Cleaning {self.pcd_name} in tiles of {self.tile_size} m")
+
+        # Streamed count of the points above the intensity threshold
+        filtered_points = countPoints(self.pcd_file, min_intensity=self.intensity_thresh)
+
+        pts_per_squared, bad = self.trackIsBad(filtered_points)
+        if bad:
+            return
+
+        # The tiles are always written, the output file is the only copy of the result
+        self.output_file = f"{self.output_dir}/CLEAN_{self.pcd_name}"
+        cleaned_points, agreement = cleanTiled(self.pcd_file,
+                                               self.output_file,
+                                               intensity_thresh=self.intensity_thresh,
+                                               knn=self.knn,
+                                               nSigma=self.nSigma,
+                                               tile_size=self.tile_size,
+                                               halo=self.tile_halo,
+                                               workers=self.tile_workers,
+                                               backend=self.backend,
+                                               sor_mode=self.sor_mode)
+        self.reportSor(agreement)
+
+        self.recordClean(t0, pts_per_squared, cleaned_points)
+
+    def cleanArrays(self, t0):
+        """
+        Version of clean for the "numpy" backend: the intensity mask, ground separation and SOR
+        filter run on NumPy arrays (cleanBackends) and the records of the cleaned points are
+        written straight from the LAS file. If CloudComPy is installed, the cleaned cloud is also
+        handed to the next stage in memory (handOver); otherwise the next stage reads the output file.
+        """
+        if self.verbose:
+            announce(f"Cleaning {self.pcd_name} (numpy backend)")
+
+        # The intensity mask is applied while reading, only XYZ and the record positions are kept
+        columns, header = readPoints(self.pcd_file,
+                                     fields=('X', 'Y', 'Z', 'index'),
+                                     min_intensity=self.intensity_thresh)
+
+        pts_per_squared, bad = self.trackIsBad(len(columns['index']))
+        if bad:
+            return
+
+        xyz = np.column_stack([columns.pop('X'), columns.pop('Y'), columns.pop('Z')])
+
+        # Ground separation, from the CSF cache when possible
+        highZ = self.cachedHighZ(len(xyz))
+        if highZ is None:
+            lowZ, highZ = groundSplit(xyz)
+            if self.csf_cache:
+                self.csfCache.save(self.csfParams(), highZ)
+
+        kept, agreement = cleanPoints(xyz, knn=self.knn, nSigma=self.nSigma, workers=-1, sor_mode=self.sor_mode,
+                                      highZ=highZ)
+        self.reportSor(agreement)
+
+        if len(kept) == 0:
+            raise Exception(f"Error: No points left after cleaning {self.pcd_name}")
+
+        # The result only exists as a file, so it is always written
+        self.output_file = f"{self.output_dir}/CLEAN_{self.pcd_name}"
+        keptXYZ = xyz[kept]
+        bounds = (keptXYZ[:, 0].min(), keptXYZ[:, 0].max(), keptXYZ[:, 1].min(),
+                  keptXYZ[:, 1].max(), keptXYZ[:, 2].min(), keptXYZ[:, 2].max())
+        recordIndex = columns['index'][kept]
+        self.save(lambda path: writeLasFile(self.pcd_file, path, [memmapRecords(self.pcd_file, header)[recordIndex]],
+                                            len(recordIndex), bounds),
+                  self.output_file, len(recordIndex) * (8 + header['point_record_length']))
+
+        if cc is not None:
+            self.handOver(recordIndex, header)
+
+        self.recordClean(t0, pts_per_squared, len(kept))
+
 
 # ----------------------------------------------------------------------------------------------------------------------
 # Main
@@ -195,6 +566,33 @@ def main():
                         help='Should the cleaned point clouds be saved to their own folder.',
                         action='store_true')
 
+    parser.add_argument('--export_coord_sf', action='store_true',
+                        help='Add X / Y / Z coordinate scalar fields to the cleaned point cloud.')
+
+    parser.add_argument('--pushdown', action='store_true',
+                        help='Drop points below the intensity threshold while reading the LAS file (only XYZ + intensity are loaded).')
+
+    parser.add_argument('--tile_size', type=float, default=None,
+                        help='Clean the track in square tiles of this size (meters) when it does not fit in memory.')
+
+    parser.add_argument('--tile_halo', type=float, default=1.0,
+                        help='Overlap (meters) read around each tile.')
+
+    parser.add_argument('--tile_workers', type=int, default=1,
+                        help='Number of tiles to clean at the same time, each in its own process.')
+
+    parser.add_argument('--backend', type=str, default="cloudcompare", choices=CLEAN_BACKENDS,
+                        help='Library the cleaning filters run with (numpy does not need CloudComPy).')
+
+    parser.add_argument('--sor_mode', type=str, default="exact", choices=SOR_MODES,
+                        help='Exact (k-NN) or approximate (voxel occupancy) SOR filter; voxel reports its agreement with exact.')
+
+    parser.add_argument('--no_csf_cache', action='store_true',
+                        help='Always recompute the ground separation instead of reusing a cached one.')
+
+    parser.add_argument('--csf_cache_mb', type=int, default=CSF_CACHE_MAX_MB,
+                        help='Size limit (MB) of the CSF cache next to the LAS files, least recently used masks are removed.')
+
     args = parser.parse_args()
 
     try:
@@ -208,7 +606,16 @@ def main():
                                    knn=args.knn,
                                    nSigma=args.nSigma,
                                    verbose=args.verbose,
-                                   export=args.export)
+                                   export=args.export,
+                                   export_coord_sf=args.export_coord_sf,
+                                   pushdown=args.pushdown,
+                                   tile_size=args.tile_size,
+                                   tile_halo=args.tile_halo,
+                                   tile_workers=args.tile_workers,
+                                   backend=args.backend,
+                                   sor_mode=args.sor_mode,
+                                   csf_cache=not args.no_csf_cache,
+                                   csf_cache_mb=args.csf_cache_mb)
 
         # Load point cloud
         cloud_cleaner.load_pcd()
@@ -4,6 +4,32 @@ import argparse
 import traceback
 
 from cleanCloud import cleanCloud
+from batchProcess import runBatch
+from lasTriage import triageFiles
+from csfCache import CSF_CACHE_MAX_MB
+from asyncWriter import WRITE_BUDGET_MB
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Functions
+# -----------------------------------------------------------------------------------------------------------
+
+def cleanFile(pcd_file, params):
+    """
+    Cleans a single LAS file; module-level so it can be sent to a worker process.
+
+    Args:
+    - pcd_file (str): Path to the LAS file.
+    - params (dict): Keyword arguments for cleanCloud (everything except pcd_file).
+    """
+    # Create a cleanCloud instance
+    cloud_cleaner = cleanCloud(pcd_file=pcd_file, **params)
+
+    # Load point cloud
+    cloud_cleaner.load_pcd()
+
+    # Clean the cloud
+    cloud_cleaner.clean()
 
 
 # -----------------------------------------------------------------------------------------------------------
@@ -20,7 +46,19 @@ class cleanClouds:
                  knn=6,
                  nSigma=10,
                  verbose=False,
-                 export = True):
+                 export = True,
+                 workers=1,
+                 triage=True,
+                 pushdown=False,
+                 tile_size=None,
+                 tile_halo=1.0,
+                 tile_workers=1,
+                 backend="cloudcompare",
+                 sor_mode="exact",
+                 csf_cache=True,
+                 csf_cache_mb=CSF_CACHE_MAX_MB,
+                 async_writes=False,
+                 write_budget_mb=WRITE_BUDGET_MB):
 
         self.pcd_directory = pcd_dir
         self.output_dir = output_dir
@@ -32,29 +70,63 @@ class cleanClouds:
         # Params for SOR filter
         self.knn = knn
         self.nSigma = nSigma
+        # Number of worker processes, each LAS file is cleaned in its own process
+        self.workers = workers
+
+        # Reject sparse / tiny tracks from their LAS header before loading them
+        self.triage = triage
+        # Drop points below the intensity threshold while reading the LAS files
+        self.pushdown = pushdown
+        # Clean each track tile by tile (side in meters), see cleanCloud
+        self.tile_size = tile_size
+        self.tile_halo = tile_halo
+        self.tile_workers = tile_workers
+        # Library the cleaning filters run with, see cleanCloud
+        self.backend = backend
+        # Exact or approximate (voxel) SOR filter, see cleanCloud
+        self.sor_mode = sor_mode
+        # Reuse cached ground separations (CSF), see cleanCloud
+        self.csf_cache = csf_cache
+        self.csf_cache_mb = csf_cache_mb
+        # Write the cleaned files in the background while the next track is cleaned, see asyncWriter
+        self.async_writes = async_writes
+        self.write_budget_mb = write_budget_mb
+        self.triageDf = None
+
+        # Per-file success / failure of the last cleanDir
+        self.results = []
 
     def cleanDir(self):
 
         pcd_files = glob.glob(f"{self.pcd_directory}/**/*.las", recursive=True)
 
-        for pcd_file in pcd_files:
+        if self.triage:
+            pcd_files, self.triageDf = triageFiles(pcd_files,
+                                                   self.output_dir,
+                                                   density_thresh=self.density_thresh,
+                                                   min_point_thresh=self.min_point_thresh)
+
+        params = dict(output_dir=self.output_dir,
+                      intensity_thresh=self.intensity_thresh,
+                      density_thresh=self.density_thresh,
+                      min_point_thresh=self.min_point_thresh,
+                      knn=self.knn,
+                      nSigma=self.nSigma,
+                      verbose=self.verbose,
+                      export=self.export,
+                      pushdown=self.pushdown,
+                      tile_size=self.tile_size,
+                      tile_halo=self.tile_halo,
+                      tile_workers=self.tile_workers,
+                      backend=self.backend,
+                      sor_mode=self.sor_mode,
+                      csf_cache=self.csf_cache,
+                      csf_cache_mb=self.csf_cache_mb,
+                      async_writes=self.async_writes,
+                      write_budget_mb=self.write_budget_mb)
+
+        self.results = runBatch(cleanFile, pcd_files, args=(params,), workers=self.workers)
 
-            # Create a cleanCloud instance
-            cloud_cleaner = cleanCloud(pcd_file=pcd_file,
-                                       output_dir=self.output_dir,
-                                       intensity_thresh=self.intensity_thresh,
-                                       density_thresh=self.density_thresh,
-                                       min_point_thresh=self.min_point_thresh,
-                                       knn = self.knn,
-                                       nSigma=self.nSigma,
-                                       verbose=self.verbose,
-                                       export = self.export)
-
-            # Load point cloud
-            cloud_cleaner.load_pcd()
-
-            # Clean the cloud
-            cloud_cleaner.clean()
         print("Done.")
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -99,30 +171,70 @@ def main():
                                         help='Should the cleaned point clouds be saved to their own folder.',
                                         action='store_true')
 
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of LAS files to clean at the same time, each in its own process.')
+
+    parser.add_argument('--no_triage', action='store_true',
+                        help='Load every LAS file, even those whose header shows they are too sparse or small.')
+
+    parser.add_argument('--pushdown', action='store_true',
+                        help='Drop points below the intensity threshold while reading the LAS files (only XYZ + intensity are loaded).')
+
+    parser.add_argument('--tile_size', type=float, default=None,
+                        help='Clean each track in square tiles of this size (meters) when it does not fit in memory.')
+
+    parser.add_argument('--tile_halo', type=float, default=1.0,
+                        help='Overlap (meters) read around each tile.')
+
+    parser.add_argument('--tile_workers', type=int, default=1,
+                        help='Number of tiles to clean at the same time, each in its own process.')
+
+    parser.add_argument('--backend', type=str, default="cloudcompare", choices=["cloudcompare", "numpy"],
+                        help='Library the cleaning filters run with (numpy does not need CloudComPy).')
+
+    parser.add_argument('--sor_mode', type=str, default="exact", choices=["exact", "voxel"],
+                        help='Exact (k-NN) or approximate (voxel occupancy) SOR filter; voxel reports its agreement with exact.')
+
+    parser.add_argument('--no_csf_cache', action='store_true',
+                        help='Always recompute the ground separation instead of reusing a cached one.')
+
+    parser.add_argument('--csf_cache_mb', type=int, default=CSF_CACHE_MAX_MB,
+                        help='Size limit (MB) of the CSF cache next to the LAS files, least recently used masks are removed.')
+
+    parser.add_argument('--async_writes', action='store_true',
+                        help='Write the output files in the background while the next LAS file is processed.')
+
+    parser.add_argument('--write_budget_mb', type=int, default=WRITE_BUDGET_MB,
+                        help='Size (MB) of the outputs that may wait to be written before processing waits for them.')
+
     args = parser.parse_args()
 
     try:
-        pcd_files = glob.glob(f"{args.pcd_directory}/**/*.las", recursive=True)
-
-        for pcd_file in pcd_files:
-
-            # Create a cleanCloud instance
-            cloud_cleaner = cleanCloud(pcd_file=args.pcd_file,
-                                       output_dir=args.output_dir,
-                                       intensity_thresh=args.intensity_thresh,
-                                       density_thresh=args.density_thresh,
-                                       min_point_thresh=args.min_point_thresh,
-                                       knn = args.knn,
-                                       nSigma = args.nSigma,
-                                       verbose=args.verbose,
-                                       export = args.export)
-
-            # Load point cloud
-            cloud_cleaner.load_pcd()
-
-            # Clean the cloud
-            cloud_cleaner.clean()
-        print("Done.")
+        # Create a cleanClouds instance
+        cloud_cleaner = cleanClouds(pcd_dir=args.pcd_directory,
+                                    output_dir=args.output_dir,
+                                    intensity_thresh=args.intensity_thresh,
+                                    density_thresh=args.perimeter_thresh,
+                                    min_point_thresh=args.min_point_thresh,
+                                    knn=args.knn,
+                                    nSigma=args.nSigma,
+                                    verbose=args.verbose,
+                                    export=args.export,
+                                    workers=args.workers,
+                                    triage=not args.no_triage,
+                                    pushdown=args.pushdown,
+                                    tile_size=args.tile_size,
+                                    tile_halo=args.tile_halo,
+                                    tile_workers=args.tile_workers,
+                                    backend=args.backend,
+                                    sor_mode=args.sor_mode,
+                                    csf_cache=not args.no_csf_cache,
+                                    csf_cache_mb=args.csf_cache_mb,
+                                    async_writes=args.async_writes,
+                                    write_budget_mb=args.write_budget_mb)
+
+        # Clean the clouds
+        cloud_cleaner.cleanDir()
 
     except Exception as e:
         print(f"ERROR: {e}")
@@ -0,0 +1,100 @@
+import numpy as np
+
+import cloudComPy as cc
+
+from lasLoader import addScalarField, setScalarField, deleteScalarFields
+from voxelComponents import COMPONENT_SF
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Constants
+# -----------------------------------------------------------------------------------------------------------
+
+# Temporary scalar field holding the layer a view is selected from
+VIEW_SF = "View Selection"
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Classes
+# -----------------------------------------------------------------------------------------------------------
+
+class cloudLayers:
+    """
+    One cloud plus per-point layers (arrays with one value per point, e.g. component labels). The
+    clouds of a stage are views, value ranges of a layer, which are only copied out of the cloud
+    (materialized) when something needs them as clouds, e.g. the export.
+    """
+
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+        # Layer name -> array with one value per point of the cloud
+        self.layers = {}
+
+        # View name -> definition (layer, value range, name of the materialized cloud)
+        self.views = {}
+
+    def addLayer(self, name, values):
+        """
+        Adds (or replaces) a layer; values are in the order of the points of the cloud.
+        """
+        values = np.asarray(values)
+        assert len(values) == self.cloud.size(), f"Error: Layer {name} does not have one value per point"
+
+        self.layers[name] = values
+
+    def addView(self, name, layer, first, last, cloud_name=None, component_index=False):
+        """
+        Defines a view: the points with a value of the layer in [first, last].
+
+        Args:
+        - name (str): Name of the view.
+        - layer (str): Layer the points are selected from.
+        - first (float): Lowest selected value.
+        - last (float): Highest selected value.
+        - cloud_name (str): Name given to the materialized cloud.
+        - component_index (bool): The materialized cloud gets COMPONENT_SF = value - first, as
+          MergeEntities(createSFcloudIndex=True) of the component clouds would.
+        """
+        self.views[name] = dict(layer=layer, first=first, last=last,
+                                cloud_name=cloud_name if cloud_name else name,
+                                component_index=component_index)
+
+    def mask(self, name):
+        """
+        Boolean mask of the points of a view.
+        """
+        view = self.views[name]
+        values = self.layers[view['layer']]
+
+        return (values >= view['first']) & (values <= view['last'])
+
+    def size(self, name):
+        return int(np.count_nonzero(self.mask(name)))
+
+    def view(self, name):
+        """
+        Materializes a view as a new cloud (copy of the selected points and their scalar fields).
+
+        Returns:
+        - ccPointCloud: The view, None if it has no points.
+        """
+        view = self.views[name]
+        if self.size(name) == 0:
+            return None
+
+        sfIndex = addScalarField(self.cloud, VIEW_SF, self.layers[view['layer']])
+        self.cloud.setCurrentScalarField(sfIndex)
+
+        viewCloud = cc.filterBySFValue(view['first'], view['last'], self.cloud)
+
+        if view['component_index']:
+            values = viewCloud.getScalarField(viewCloud.getScalarFieldDic()[VIEW_SF]).toNpArrayCopy()
+            setScalarField(viewCloud, COMPONENT_SF, values - view['first'])
+
+        deleteScalarFields(viewCloud, [VIEW_SF])
+        deleteScalarFields(self.cloud, [VIEW_SF])
+
+        viewCloud.setName(view['cloud_name'])
+
+        return viewCloud
@@ -10,4 +10,24 @@ def announce(announcement: str):
     """
     print("\n###############################################")
     print(announcement)
-    print("###############################################\n")
\ No newline at end of file
+    print("###############################################\n")
+
+def peakMemoryMB():
+    """
+    Peak resident memory (RSS) of the current process in MB.
+    """
+    import psutil
+
+    info = psutil.Process().memory_info()
+
+    # Windows reports the peak working set directly
+    peak = getattr(info, 'peak_wset', None)
+    if peak is None:
+        import resource
+        import sys
+
+        # ru_maxrss is in kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak if sys.platform == "darwin" else peak * 1024
+
+    return peak / 2 ** 20
@@ -0,0 +1,159 @@
+import os
+import glob
+import json
+import hashlib
+
+import numpy as np
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Constants
+# -----------------------------------------------------------------------------------------------------------
+
+# Directory created next to the LAS files, holding one mask per (file content, parameters)
+CSF_CACHE_DIR = ".csf_cache"
+
+# Least recently used masks are removed once the directory is larger than this
+CSF_CACHE_MAX_MB = 256
+
+# Bumped when the way the masks are computed changes, so older entries are not reused
+CSF_CACHE_VERSION = 1
+
+# The fingerprint hashes the whole file, this many bytes at a time
+FINGERPRINT_BLOCK_SIZE = 64 * 2 ** 20
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Functions
+# -----------------------------------------------------------------------------------------------------------
+
+def fingerprint(pcd_file):
+    """
+    Content fingerprint of a LAS file: hash of its size, header (and VLRs) and every point record,
+    so any edit of the records (e.g. reclassified points, changed intensities) gives a new key.
+    Stays valid when the file is copied or renamed.
+
+    Reads every byte of the track on every run, even when the mask is then found in the cache; this is
+    still much cheaper than CSF, but not free on a slow drive.
+
+    Returns:
+    - str: Hex digest.
+    """
+    digest = hashlib.sha1(str(os.path.getsize(pcd_file)).encode())
+
+    with open(pcd_file, 'rb') as f:
+        while True:
+            block = f.read(FINGERPRINT_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Classes
+# -----------------------------------------------------------------------------------------------------------
+
+class csfCache:
+    """
+    Content-addressed cache of the ground separation (CSF) of a track. The high Z mask of the
+    intensity filtered points is stored as a bitmask (np.packbits) in CSF_CACHE_DIR next to the
+    LAS file, keyed by the file fingerprint and every parameter that changes the split.
+    """
+
+    def __init__(self, pcd_file, max_mb=CSF_CACHE_MAX_MB):
+        self.pcd_file = pcd_file
+        self.cache_dir = os.path.join(os.path.dirname(os.path.abspath(pcd_file)), CSF_CACHE_DIR)
+        self.max_bytes = max_mb * 2 ** 20
+
+        self.fingerprint = fingerprint(pcd_file)
+
+    def key(self, params):
+        """
+        Key of an entry: hash of the file fingerprint and the parameters (intensity threshold,
+        backend, CSF parameters).
+        """
+        content = json.dumps({'version': CSF_CACHE_VERSION, 'fingerprint': self.fingerprint, **params}, sort_keys=True)
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def path(self, params):
+        return os.path.join(self.cache_dir, self.key(params) + ".npz")
+
+    def load(self, params, point_count):
+        """
+        Returns the cached high Z mask, or None if there is no entry for these parameters.
+
+        Args:
+        - params (dict): Parameters of the split (JSON serializable).
+        - point_count (int): Number of points the mask must have.
+
+        Returns:
+        - np.ndarray: Boolean mask of the high Z points.
+        """
+        mask_path = self.path(params)
+        if not os.path.exists(mask_path):
+            return None
+
+        try:
+            with np.load(mask_path) as entry:
+                if int(entry['point_count']) != point_count:
+                    return None
+                highZ = np.unpackbits(entry['high_z'], count=point_count).astype(bool)
+
+            # Recently used entries are evicted last
+            os.utime(mask_path)
+
+        except Exception as e:
+            print(f"Warning: Could not read CSF cache entry {os.path.basename(mask_path)}\n{e}")
+            return None
+
+        return highZ
+
+    def save(self, params, highZ):
+        """
+        Stores the high Z mask and evicts the least recently used entries over the size limit. A
+        cache that cannot be written (e.g. read-only survey drive) only prints a warning.
+
+        Args:
+        - params (dict): Parameters of the split (JSON serializable).
+        - highZ (np.ndarray): Boolean mask of the high Z points.
+        """
+        mask_path = self.path(params)
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+            # Written under a temporary name (not matched by evict) so a partial file is never read back
+            temp_path = mask_path + ".tmp"
+            with open(temp_path, 'wb') as f:
+                np.savez(f, high_z=np.packbits(highZ), point_count=len(highZ))
+            os.replace(temp_path, mask_path)
+
+            self.evict()
+
+        except Exception as e:
+            print(f"Warning: Could not write CSF cache entry {os.path.basename(mask_path)}\n{e}")
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in max_mb. Only complete entries
+        (*.npz) are considered, the ones other workers are still writing (*.npz.tmp) are left alone.
+        """
+        entries = []
+        for entry in glob.glob(os.path.join(self.cache_dir, "*.npz")):
+            try:
+                stat = os.stat(entry)
+            except FileNotFoundError:
+                # Evicted by another worker
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+
+        total_size = 0
+        for _, size, entry in sorted(entries, reverse=True):
+            total_size += size
+            if total_size > self.max_bytes:
+                try:
+                    os.remove(entry)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,331 @@
+import os
+import concurrent.futures
+
+import numpy as np
+from scipy import ndimage
+from scipy.interpolate import LinearNDInterpolator
+from scipy.spatial import cKDTree
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Constants
+# -----------------------------------------------------------------------------------------------------------
+
+# Engines segmentCloud can create the DEM with
+DEM_ENGINES = ["numpy", "cloudcompare"]
+
+# Empty cell fill options of the numpy engine (KRIGING and FILL_CUSTOM_HEIGHT stay with cc.RasterizeToMesh)
+DEM_FILL_OPTIONS = ["LEAVE_EMPTY",
+                    "FILL_MINIMUM_HEIGHT",
+                    "FILL_MAXIMUM_HEIGHT",
+                    "FILL_AVERAGE_HEIGHT",
+                    "FILL_NEAREST",
+                    "INTERPOLATE_IDW",
+                    "INTERPOLATE_DELAUNAY"]
+
+# Height kept for the points falling in a cell (PROJ_MINIMUM_VALUE / PROJ_AVERAGE_VALUE)
+DEM_PROJECTIONS = ["min", "mean"]
+
+# The fill runs on square tiles of this many cells, each with a margin of filled cells around it
+TILE_CELLS = 256
+TILE_MARGIN = 64
+
+# Inverse distance weighting: number of filled cells used and power of the distance
+IDW_NEIGHBORS = 8
+IDW_POWER = 2
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Functions
+# -----------------------------------------------------------------------------------------------------------
+
+def binHeights(xyz, grid_step, origin=None, projection="min"):
+    """
+    Projects the points on a regular grid: every point falls in one cell and the cell keeps the
+    minimum (np.minimum.at) or the mean (np.bincount) height of its points.
+
+    Args:
+    - xyz (np.ndarray): (N, 3) coordinates.
+    - grid_step (float): Side of a cell (meters).
+    - origin (tuple): (x, y) corner of the grid, the points' minimum by default.
+    - projection (str): "min" or "mean".
+
+    Returns:
+    - np.ndarray: (rows, columns) heights, NaN for the cells without points; rows follow Y, columns X.
+    - tuple: (x, y) corner of the grid.
+    """
+    if origin is None:
+        origin = tuple(xyz[:, :2].min(axis=0))
+
+    columns = np.floor((xyz[:, 0] - origin[0]) / grid_step).astype(np.int64)
+    rows = np.floor((xyz[:, 1] - origin[1]) / grid_step).astype(np.int64)
+    shape = (int(rows.max()) + 1, int(columns.max()) + 1)
+    cells = rows * shape[1] + columns
+
+    counts = np.bincount(cells, minlength=shape[0] * shape[1])
+
+    if projection == "mean":
+        heights = np.bincount(cells, weights=xyz[:, 2], minlength=shape[0] * shape[1])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            heights = heights / counts
+    else:
+        heights = np.full(shape[0] * shape[1], np.inf)
+        np.minimum.at(heights, cells, xyz[:, 2].astype(np.float64))
+
+    heights[counts == 0] = np.nan
+
+    return heights.reshape(shape), origin
+
+
+def fillNearest(heights):
+    """
+    Every empty cell takes the height of the nearest filled cell.
+    """
+    empty = np.isnan(heights)
+    nearest = ndimage.distance_transform_edt(empty, return_distances=False, return_indices=True)
+
+    return heights[tuple(nearest)]
+
+
+def rimCells(empty):
+    """
+    Filled cells touching an empty cell (8-connectivity): the only filled cells the interpolations
+    of the empty cells need, instead of every filled cell of the grid.
+    """
+    return ndimage.binary_dilation(empty, structure=np.ones((3, 3), dtype=bool)) & ~empty
+
+
+def fillIdw(heights, neighbors=IDW_NEIGHBORS, power=IDW_POWER):
+    """
+    Every empty cell takes the inverse distance weighted height of the closest filled cells.
+    """
+    empty = np.isnan(heights)
+    rim = rimCells(empty)
+    emptyCells = np.argwhere(empty)
+
+    distances, index = cKDTree(np.argwhere(rim)).query(emptyCells, k=min(neighbors, int(np.sum(rim))))
+    distances = distances.reshape(len(emptyCells), -1)
+    index = index.reshape(len(emptyCells), -1)
+
+    weights = 1 / distances ** power
+    filled = heights.copy()
+    filled[empty] = np.sum(weights * heights[rim][index], axis=1) / np.sum(weights, axis=1)
+
+    return filled
+
+
+def fillDelaunay(heights):
+    """
+    Empty cells inside the triangulation of the filled cells are interpolated linearly over its
+    triangles; cells outside stay empty (as with INTERPOLATE_DELAUNAY in CloudCompare).
+    """
+    empty = np.isnan(heights)
+    rim = rimCells(empty)
+    rimIndex = np.argwhere(rim)
+    if len(rimIndex) < 3 or np.linalg.matrix_rank(rimIndex - rimIndex[0]) < 2:
+        return heights
+
+    filled = heights.copy()
+    filled[empty] = LinearNDInterpolator(rimIndex, heights[rim])(np.argwhere(empty))
+
+    return filled
+
+
+def fillTile(heights, fill, rows, columns):
+    """
+    Fills the empty cells of one tile of the grid, from the tile and a margin around it.
+
+    Returns:
+    - np.ndarray: Filled heights of the tile.
+    """
+    window = (slice(max(rows.start - TILE_MARGIN, 0), rows.stop + TILE_MARGIN),
+              slice(max(columns.start - TILE_MARGIN, 0), columns.stop + TILE_MARGIN))
+    tile = (slice(rows.start - window[0].start, rows.stop - window[0].start),
+            slice(columns.start - window[1].start, columns.stop - window[1].start))
+
+    windowHeights = heights[window]
+    if not np.any(np.isnan(windowHeights[tile])) or np.all(np.isnan(windowHeights)):
+        return windowHeights[tile]
+
+    if fill == "FILL_NEAREST":
+        return fillNearest(windowHeights)[tile]
+    if fill == "INTERPOLATE_IDW":
+        return fillIdw(windowHeights)[tile]
+
+    return fillDelaunay(windowHeights)[tile]
+
+
+def fillEmptyCells(heights, fill="INTERPOLATE_DELAUNAY", workers=None):
+    """
+    Fills the empty (NaN) cells of a grid of heights. The constant fills use the whole grid; the
+    interpolations run on tiles (TILE_CELLS, with TILE_MARGIN cells of context) in parallel.
+
+    Args:
+    - heights (np.ndarray): (rows, columns) heights, NaN for the empty cells.
+    - fill (str): One of DEM_FILL_OPTIONS.
+    - workers (int): Threads filling the tiles, every core by default.
+
+    Returns:
+    - np.ndarray: Filled heights.
+    """
+    assert fill in DEM_FILL_OPTIONS, f"Error: fill must be one of {DEM_FILL_OPTIONS}"
+
+    empty = np.isnan(heights)
+    if fill == "LEAVE_EMPTY" or not np.any(empty) or np.all(empty):
+        return heights
+
+    if fill == "FILL_MINIMUM_HEIGHT":
+        return np.where(empty, np.nanmin(heights), heights)
+    if fill == "FILL_MAXIMUM_HEIGHT":
+        return np.where(empty, np.nanmax(heights), heights)
+    if fill == "FILL_AVERAGE_HEIGHT":
+        return np.where(empty, np.nanmean(heights), heights)
+
+    tiles = [(slice(row, min(row + TILE_CELLS, heights.shape[0])),
+              slice(column, min(column + TILE_CELLS, heights.shape[1])))
+             for row in range(0, heights.shape[0], TILE_CELLS)
+             for column in range(0, heights.shape[1], TILE_CELLS)]
+
+    filled = np.empty_like(heights)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for (rows, columns), tileHeights in zip(tiles, executor.map(lambda tile: fillTile(heights, fill, *tile), tiles)):
+            filled[rows, columns] = tileHeights
+
+    return filled
+
+
+def rasterize(xyz, grid_step, fill="INTERPOLATE_DELAUNAY", projection="min", workers=None):
+    """
+    Digital elevation model of the points: heights binned on a regular grid, empty cells filled.
+
+    Args:
+    - xyz (np.ndarray): (N, 3) coordinates.
+    - grid_step (float): Side of a cell (meters).
+    - fill (str): One of DEM_FILL_OPTIONS.
+    - projection (str): "min" or "mean" height of the points of a cell.
+    - workers (int): Threads filling the tiles, every core by default.
+
+    Returns:
+    - demRaster: The DEM.
+    """
+    assert projection in DEM_PROJECTIONS, f"Error: projection must be one of {DEM_PROJECTIONS}"
+
+    heights, origin = binHeights(xyz, grid_step, projection=projection)
+
+    return demRaster(fillEmptyCells(heights, fill, workers), origin, grid_step)
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Classes
+# -----------------------------------------------------------------------------------------------------------
+
+class demRaster:
+    """
+    Regular grid of heights: cell (row, column) covers [x0 + column * step, x0 + (column + 1) * step)
+    by [y0 + row * step, y0 + (row + 1) * step) and its height is NaN if the cell is empty.
+    """
+
+    def __init__(self, heights, origin, grid_step):
+        self.heights = heights
+        self.origin = origin
+        self.grid_step = grid_step
+
+    @property
+    def shape(self):
+        return self.heights.shape
+
+    def cellIndex(self, xy):
+        """
+        Row and column of the cells the (x, y) positions fall in (may be outside the grid).
+        """
+        columns = np.floor((xy[:, 0] - self.origin[0]) / self.grid_step).astype(np.int64)
+        rows = np.floor((xy[:, 1] - self.origin[1]) / self.grid_step).astype(np.int64)
+
+        return rows, columns
+
+    def heightAt(self, xy):
+        """
+        Height of the cells the (x, y) positions fall in, NaN outside the grid or in empty cells.
+        """
+        rows, columns = self.cellIndex(xy)
+        inside = (rows >= 0) & (rows < self.shape[0]) & (columns >= 0) & (columns < self.shape[1])
+
+        heights = np.full(len(xy), np.nan)
+        heights[inside] = self.heights[rows[inside], columns[inside]]
+
+        return heights
+
+    def bilinearHeightAt(self, xy):
+        """
+        Height of the DEM at the (x, y) positions, interpolated bilinearly between the centers of the
+        four surrounding cells (one vectorized gather per corner, no spatial index). Empty corners
+        are left out of the weights; positions beyond the outer cell centers take the edge values.
+
+        Args:
+        - xy (np.ndarray): (N, 2) positions.
+
+        Returns:
+        - np.ndarray: Heights, NaN where no surrounding cell is filled.
+        """
+        # Position in cells, relative to the center of the first cell
+        u = (xy[:, 0] - self.origin[0]) / self.grid_step - 0.5
+        v = (xy[:, 1] - self.origin[1]) / self.grid_step - 0.5
+
+        columns = np.clip(np.floor(u).astype(np.int64), 0, max(self.shape[1] - 2, 0))
+        rows = np.clip(np.floor(v).astype(np.int64), 0, max(self.shape[0] - 2, 0))
+        fu = np.clip(u - columns, 0, 1)
+        fv = np.clip(v - rows, 0, 1)
+        nextColumns = np.minimum(columns + 1, self.shape[1] - 1)
+        nextRows = np.minimum(rows + 1, self.shape[0] - 1)
+
+        total = np.zeros(len(xy))
+        weights = np.zeros(len(xy))
+        for cornerRows, cornerColumns, cornerWeights in [(rows, columns, (1 - fu) * (1 - fv)),
+                                                         (rows, nextColumns, fu * (1 - fv)),
+                                                         (nextRows, columns, (1 - fu) * fv),
+                                                         (nextRows, nextColumns, fu * fv)]:
+            cornerHeights = self.heights[cornerRows, cornerColumns]
+            filled = ~np.isnan(cornerHeights)
+            total[filled] += cornerWeights[filled] * cornerHeights[filled]
+            weights[filled] += cornerWeights[filled]
+
+        heights = np.full(len(xy), np.nan)
+        weighted = weights > 0
+        heights[weighted] = total[weighted] / weights[weighted]
+
+        # Only filled corners with a zero weight (e.g. exactly on the line of an empty cell center)
+        heights[~weighted] = self.heightAt(xy[~weighted])
+
+        return heights
+
+    def nearestHeightAt(self, xy):
+        """
+        Height of the filled cell whose center is the closest to each (x, y) position, wherever the
+        position is (empty cell, outside the grid).
+
+        Args:
+        - xy (np.ndarray): (N, 2) positions.
+
+        Returns:
+        - np.ndarray: Heights, NaN only if no cell is filled.
+        """
+        cellCenters = self.cellCenters()
+        if len(cellCenters) == 0 or len(xy) == 0:
+            return np.full(len(xy), np.nan)
+
+        _, nearest = cKDTree(cellCenters[:, :2]).query(xy)
+
+        return cellCenters[nearest, 2]
+
+    def cellCenters(self):
+        """
+        Centers of the filled cells, at their height.
+
+        Returns:
+        - np.ndarray: (N, 3) coordinates.
+        """
+        rows, columns = np.nonzero(~np.isnan(self.heights))
+
+        return np.column_stack([self.origin[0] + (columns + 0.5) * self.grid_step,
+                                self.origin[1] + (rows + 0.5) * self.grid_step,
+                                self.heights[rows, columns]])
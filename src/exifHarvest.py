@@ -0,0 +1,165 @@
+import os
+import re
+import concurrent.futures
+
+import exifread
+import numpy as np
+import pandas as pd
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Constants
+# -----------------------------------------------------------------------------------------------------------
+
+# Image extensions that are harvested
+IMAGE_EXTENSIONS = (".jpg", ".tif")
+
+# GPS altitude is the last tag needed; exifread stops parsing once it has been read
+EXIF_STOP_TAG = 'GPSAltitude'
+
+# Threads reading images at the same time; EXIF parsing is mostly waiting on (network) I/O
+EXIF_WORKERS = 16
+
+# Columns of the harvested table
+EXIF_COLUMNS = ['file_path', 'file_name', 'time_string', 'latitude', 'longitude', 'altitude']
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Functions
+# -----------------------------------------------------------------------------------------------------------
+
+def readImageExif(imageLoc):
+    """
+    Reads the EXIF tags of an image; MakerNotes and thumbnails are skipped and parsing stops
+    after the GPS altitude. The file is closed before returning.
+    """
+    with open(imageLoc, 'rb') as f:
+        return exifread.process_file(f, stop_tag=EXIF_STOP_TAG, details=False, extract_thumbnail=False)
+
+
+def _get_if_exist(data, key):
+    if key in data:
+        return data[key]
+
+    return None
+
+
+def _convert_to_degress(value):
+    """
+    Helper function to convert the GPS coordinates stored in the EXIF to degress in float format
+    :param value:
+    :type value: exifread.utils.Ratio
+    :rtype: float
+    """
+    d = float(value.values[0].num) / float(value.values[0].den)
+    m = float(value.values[1].num) / float(value.values[1].den)
+    s = float(value.values[2].num) / float(value.values[2].den)
+
+    return d + (m / 60.0) + (s / 3600.0)
+
+
+def replace_date_colons(date_time_str):
+    # Check if the date is already in the correct format (YYYY-MM-DD)
+    if re.match(r'\d{4}-\d{2}-\d{2}', date_time_str[:10]):
+        return date_time_str
+
+    # If not, replace the colons in the date part with hyphens
+    modified_date_time_str = re.sub(r'(\d{4}):(\d{2}):(\d{2})', r'\1-\2-\3', date_time_str)
+    return modified_date_time_str
+
+
+def exifTimeString(exif_data):
+    """
+    Returns the (UTC) capture time stored in the EXIF tags as an ISO string, or None if the image
+    has no capture time.
+    """
+    dateOriginal = _get_if_exist(exif_data, 'EXIF DateTimeOriginal')
+    if dateOriginal is None:
+        return None
+
+    secOriginal = _get_if_exist(exif_data, 'EXIF SubSecTimeOriginal')
+
+    # Sub-seconds are optional, only append them if the image has them
+    date_sec_og = str(dateOriginal)
+    if secOriginal is not None:
+        date_sec_og += str(secOriginal)[1:]
+
+    return replace_date_colons(date_sec_og)
+
+
+def exifLocation(exif_data):
+    """
+    Returns the latitude, longitude and altitude stored in the EXIF tags; NaN where missing.
+    """
+    lat = np.nan
+    lon = np.nan
+    altitude = np.nan
+
+    gps_latitude = _get_if_exist(exif_data, 'GPS GPSLatitude')
+    gps_latitude_ref = _get_if_exist(exif_data, 'GPS GPSLatitudeRef')
+    gps_longitude = _get_if_exist(exif_data, 'GPS GPSLongitude')
+    gps_longitude_ref = _get_if_exist(exif_data, 'GPS GPSLongitudeRef')
+
+    if gps_latitude and gps_latitude_ref and gps_longitude and gps_longitude_ref:
+        lat = _convert_to_degress(gps_latitude)
+        if gps_latitude_ref.values[0] != 'N':
+            lat = 0 - lat
+
+        lon = _convert_to_degress(gps_longitude)
+        if gps_longitude_ref.values[0] != 'E':
+            lon = 0 - lon
+
+    gps_altitude_ref = _get_if_exist(exif_data, 'GPS GPSAltitudeRef')
+    gps_altitude = _get_if_exist(exif_data, 'GPS GPSAltitude')
+
+    if gps_altitude and gps_altitude_ref:
+        alt = gps_altitude.values[0]
+        altitude = alt.num / alt.den
+        if gps_altitude_ref.values[0] == 1: altitude *= -1
+
+    return lat, lon, altitude
+
+
+def harvestImage(imageLoc):
+    """
+    Reads the time and location of a single image in one pass over its EXIF tags.
+
+    Returns:
+    - list: [file_path, file_name, time_string, latitude, longitude, altitude]; time_string is None
+      if the image could not be read or has no capture time.
+    """
+    try:
+        exif_data = readImageExif(imageLoc)
+        time_string = exifTimeString(exif_data)
+        lat, lon, altitude = exifLocation(exif_data)
+
+    except Exception as e:
+        print(f"Warning: Could not read EXIF of {os.path.basename(imageLoc)}\n{e}")
+        time_string, lat, lon, altitude = None, np.nan, np.nan, np.nan
+
+    return [imageLoc, os.path.basename(imageLoc), time_string, lat, lon, altitude]
+
+
+def listImages(imgdirectory):
+    """
+    Paths of the images directly inside a directory.
+    """
+    return [os.path.join(imgdirectory, file) for file in sorted(os.listdir(imgdirectory))
+            if file.endswith(IMAGE_EXTENSIONS)]
+
+
+def harvestExif(imgfilePaths, workers=EXIF_WORKERS):
+    """
+    Reads the time and location of many images concurrently with a thread pool.
+
+    Args:
+    - imgfilePaths (list): Paths of the images.
+    - workers (int): Number of threads.
+
+    Returns:
+    - DataFrame: One row per image, columns EXIF_COLUMNS (same order as imgfilePaths).
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        imagesData = list(executor.map(harvestImage, imgfilePaths))
+
+    return pd.DataFrame(imagesData, columns=EXIF_COLUMNS)
@@ -6,9 +6,12 @@ import argparse
 import os
 import traceback
 import utm
-import exifread
 
 from common import announce
+from imageTimeSort import trackFiles
+from exifHarvest import readImageExif, exifLocation, harvestExif, EXIF_WORKERS, IMAGE_EXTENSIONS
+from metadataCache import metadataCache
+from tableIO import writeTable
 
 import pandas as pd
 
@@ -18,69 +21,11 @@ def getImgUTM(filename):
     return utm.from_latlon(loc[0], loc[1]), loc[2]
 
 
-def _convert_to_degress(value):
-    """
-    Helper function to convert the GPS coordinates stored in the EXIF to degress in float format
-    :param value:
-    :type value: exifread.utils.Ratio
-    :rtype: float
-    """
-    d = float(value.values[0].num) / float(value.values[0].den)
-    m = float(value.values[1].num) / float(value.values[1].den)
-    s = float(value.values[2].num) / float(value.values[2].den)
-
-    return d + (m / 60.0) + (s / 3600.0)
-
-def get_image_exif(imageLoc):
-    f = open(imageLoc, 'rb')
-
-    # Return Exif tags
-    return exifread.process_file(f)
-
-def _get_if_exist(data, key):
-    if key in data:
-        return data[key]
-
-    return None
-
-
 def get_image_location(filename):
     """
-    Returns the latitude and longitude, if available, from the provided exif_data (obtained through get_exif_data above)
+    Returns the latitude, longitude and altitude, if available, from the EXIF of an image
     """
-    exif_data = get_image_exif(filename)
-
-    lat = None
-    lon = None
-
-    gps_latitude = _get_if_exist(exif_data, 'GPS GPSLatitude')
-    gps_latitude_ref = _get_if_exist(exif_data, 'GPS GPSLatitudeRef')
-    gps_longitude = _get_if_exist(exif_data, 'GPS GPSLongitude')
-    gps_longitude_ref = _get_if_exist(exif_data, 'GPS GPSLongitudeRef')
-
-
-
-
-    if gps_latitude and gps_latitude_ref and gps_longitude and gps_longitude_ref:
-        lat = _convert_to_degress(gps_latitude)
-        if gps_latitude_ref.values[0] != 'N':
-            lat = 0 - lat
-
-        lon = _convert_to_degress(gps_longitude)
-        if gps_longitude_ref.values[0] != 'E':
-            lon = 0 - lon
-
-    gps_altitude_ref = _get_if_exist(exif_data, 'GPS GPSAltitudeRef')
-    gps_altitude = _get_if_exist(exif_data, 'GPS GPSAltitude')
-    print("altitude: " + str(gps_altitude))
-
-    if gps_altitude and gps_altitude_ref:
-        alt = gps_altitude.values[0]
-        altitude = alt.num / alt.den
-        if gps_altitude_ref.values[0] == 1: altitude *= -1
-
-    #print("altitude" + altitude)
-    return lat, lon, altitude
+    return exifLocation(readImageExif(filename))
 
 
 
@@ -93,8 +38,14 @@ def get_image_location(filename):
 # -----------------------------------------------------------------------------------------------------------
 
 class imageLocation:
-    def __init__(self, input_dir,  output_dir):
+    def __init__(self, input_dir,  output_dir, workers=EXIF_WORKERS, exif_df=None, use_cache=True):
         self.imagesDf = None
+        # Threads reading the EXIF of the images
+        self.workers = workers
+        # Only read images that are new or changed since the last run (metadata.sqlite in output_dir)
+        self.use_cache = use_cache
+        # Table already harvested by exifHarvest (e.g. processIMGdir.imagesDf); images in it are not read again
+        self.exifDf = exif_df
         print("\n\n")
         announce("Start of New Object")
         self.input_dir = input_dir
@@ -118,40 +69,45 @@ class imageLocation:
         imgdirectory = self.input_dir
         outputDirectory = self.output_dir
 
-        imagesData = []
-        imgfileList = os.listdir(imgdirectory)
         output_base_dir = outputDirectory
         os.makedirs(output_base_dir, exist_ok=True)
 
-        img_csv = True
+        # A track sorted in "manifest" mode lists its images instead of containing them
+        imgfilePaths = trackFiles(imgdirectory, "image", IMAGE_EXTENSIONS)
 
-        if img_csv == True:
-            for file in imgfileList:
-                if file.endswith(".jpg") or file.endswith(".tif"):
-                    print("Processing file:", file)
+        # Only read the images that are not in an already harvested table
+        known = pd.DataFrame(columns=['file_path', 'latitude', 'longitude', 'altitude'])
+        if self.exifDf is not None:
+            known = self.exifDf.loc[self.exifDf['file_path'].isin(imgfilePaths), known.columns]
 
-                    valTime = getImgUTM((os.path.join(imgdirectory, file)))
+        knownPaths = set(known['file_path'])
+        missing = [file_path for file_path in imgfilePaths if file_path not in knownPaths]
+        print(f"Reading the EXIF of {len(missing)} images")
 
-                    #print(valTime)
+        if self.use_cache:
+            with metadataCache(output_base_dir) as cache:
+                harvestedDf = cache.harvestImages(missing, workers=self.workers)
+        else:
+            harvestedDf = harvestExif(missing, workers=self.workers)
 
-                    imagesData.append([valTime[0], (os.path.join(imgdirectory, file)), file, valTime[1]])
+        exifDf = pd.concat([known, harvestedDf[known.columns]], ignore_index=True)
+        exifDf = exifDf.astype({'latitude': 'float64', 'longitude': 'float64', 'altitude': 'float64'})
+        exifDf = exifDf.set_index('file_path').loc[imgfilePaths].reset_index()
 
-                    # new_row = pd.DataFrame(
-                    # {'x': [vals[0]], 'y': [vals[1]],
-                    #   'file_path': [(os.path.join(imgdirectory, file))], 'file_name': [file]})
+        located = exifDf['latitude'].notna() & exifDf['longitude'].notna()
+        if not located.all():
+            print(f"Warning: {(~located).sum()} images have no GPS location and are skipped")
 
-                    # pd.concat([imagesDf, new_row], ignore_index=False)
-            imagesDf = pd.DataFrame(imagesData, columns=['location', 'file_path', 'file_name', 'm_above_sealevel'])
+        imagesDf = exifDf[located].reset_index(drop=True)
+        imagesDf.insert(1, 'file_name', [os.path.basename(file_path) for file_path in imagesDf['file_path']])
 
-            imagesDf.to_csv(os.path.join(output_base_dir, "images.csv"))
-        else:
-            # imagesDf = pd.read_csv(os.path.join(output_base_dir, "images.csv"))
-            csv_path = r"Z:\NCCOS-temp\Swann\data\experimental\output\images.csv"
-            imagesDf = pd.read_csv(csv_path)
+        # Explicit UTM columns instead of a (easting, northing, zone number, zone letter) tuple
+        utmData = [utm.from_latlon(lat, lon) for lat, lon in imagesDf[['latitude', 'longitude']].itertuples(index=False)]
+        utmDf = pd.DataFrame(utmData, columns=['easting', 'northing', 'zone_number', 'zone_letter'])
+        imagesDf = pd.concat([utmDf, imagesDf], axis=1)
 
-            print("00803409324")
-            print(imagesDf.head(5))
-            imagesDf.to_csv(os.path.join(output_base_dir, "images1.csv"))
+        # Own table name, images is the time table of processIMGdir in the same output directory
+        writeTable(imagesDf, output_base_dir, "image_locations")
 
         self.imagesDf = imagesDf
 
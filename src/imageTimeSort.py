@@ -12,9 +12,30 @@ import argparse
 
 import numpy as np
 
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, reflink falls back to a copy
+    fcntl = None
+
 from lasTimeTagging import processLASdir as lasProcess
 
 from imageTimeTagging import processIMGdir as imgProcess
+from tableIO import readTable
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Constants
+# -----------------------------------------------------------------------------------------------------------
+
+# How sorted files are placed in "Sorted Images/<track>/"
+OUTPUT_MODES = ["copy", "hardlink", "symlink", "reflink", "manifest"]
+
+# Per-track index written by the "manifest" output mode (and read by imageLocation / lasRender)
+MANIFEST_NAME = "manifest.csv"
+
+# Linux ioctl that shares the data blocks of two files (btrfs, XFS, ...)
+FICLONE = 0x40049409
 
 
 # -----------------------------------------------------------------------------------------------------------
@@ -34,18 +55,146 @@ def is_within_box_Time(image_time, box, secsOffset):
     return box['Tstart'] - secsOffset <= image_time <= box['Tend'] + secsOffset
 
 
+def reflinkFile(src, dst):
+    """
+    Creates a copy-on-write clone of src at dst where the filesystem supports it,
+    otherwise falls back to a regular copy.
+    """
+    if fcntl is not None:
+        try:
+            with open(src, 'rb') as f_src, open(dst, 'wb') as f_dst:
+                fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+            return
+        except OSError:
+            pass
+
+    shutil.copy(src, dst)
+
+
+def placeFile(src, dst, output_mode="copy"):
+    """
+    Places a file in the sorted output directory using the requested output mode;
+    hardlinks fall back to a copy when src and dst are on different filesystems.
+
+    Args:
+    - src (str): File to place.
+    - dst (str): Destination path.
+    - output_mode (str): "copy", "hardlink", "symlink" or "reflink".
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+    if output_mode == "copy":
+        shutil.copy(src, dst)
+    elif output_mode == "hardlink":
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy(src, dst)
+    elif output_mode == "symlink":
+        os.symlink(os.path.abspath(src), dst)
+    elif output_mode == "reflink":
+        reflinkFile(src, dst)
+    else:
+        raise Exception(f"Error: Unknown output mode '{output_mode}', options are {OUTPUT_MODES}")
+
+
+def readManifest(track_dir):
+    """
+    Reads the manifest of a sorted track directory, or returns None if it has none.
+
+    Returns:
+    - DataFrame: One row per file ('kind' is "las" or "image") with 'file_name' and 'file_path'.
+    """
+    manifest_file = os.path.join(track_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_file):
+        return None
+
+    return pd.read_csv(manifest_file)
+
+
+def trackFiles(track_dir, kind, extensions):
+    """
+    Paths of the LAS files ("las") or images ("image") of a sorted track directory: from its manifest
+    if it was sorted in "manifest" mode, otherwise the files placed in it.
+
+    Args:
+    - track_dir (str): Directory of the track in "Sorted Images".
+    - kind (str): "las" or "image".
+    - extensions (tuple): Extensions of the files to return, e.g. (".las",).
+
+    Returns:
+    - list: Paths of the files.
+    """
+    manifestDf = readManifest(track_dir)
+    if manifestDf is None:
+        file_paths = [os.path.join(track_dir, file) for file in sorted(os.listdir(track_dir))]
+    else:
+        file_paths = manifestDf.loc[manifestDf['kind'] == kind, 'file_path'].tolist()
+
+    return [file_path for file_path in file_paths if file_path.endswith(extensions)]
+
+
+def matchImagesToTracks(tracks_df, images_df, secsOffset):
+    """
+    Assigns images to tracks by sorting the image times once and binary-searching the
+    (padded) time range of every track, O((T + I) log I) instead of one pass over all
+    images per track. Same bounds as is_within_box_Time (inclusive, padded by secsOffset).
+
+    Args:
+    - tracks_df (DataFrame): Tracks with 'Tstart' and 'Tend' columns.
+    - images_df (DataFrame): Images with a 'time' column.
+    - secsOffset (float): Seconds added before the start and after the end of each track.
+
+    Returns:
+    - DataFrame: One row per (track, image) match, with the track and image index labels.
+    """
+    image_times = images_df['time'].to_numpy(dtype=np.float64)
+    order = np.argsort(image_times, kind='stable')
+    sorted_times = image_times[order]
+
+    # First and one-past-last sorted image within each padded track range
+    lower = np.searchsorted(sorted_times, tracks_df['Tstart'].to_numpy(dtype=np.float64) - secsOffset, side='left')
+    upper = np.searchsorted(sorted_times, tracks_df['Tend'].to_numpy(dtype=np.float64) + secsOffset, side='right')
+    counts = np.maximum(upper - lower, 0)
+
+    # Expand each [lower, upper) range into the positions of its images
+    track_positions = np.repeat(np.arange(len(tracks_df)), counts)
+    starts = np.repeat(lower - np.cumsum(counts) + counts, counts)
+    image_positions = order[starts + np.arange(counts.sum())]
+
+    assignments = pd.DataFrame({'track_index': tracks_df.index.to_numpy()[track_positions],
+                                'image_index': images_df.index.to_numpy()[image_positions],
+                                'box_file_name': tracks_df['box_file_name'].to_numpy()[track_positions],
+                                'file_name': images_df['file_name'].to_numpy()[image_positions],
+                                'file_path': images_df['file_path'].to_numpy()[image_positions],
+                                'time': image_times[image_positions]})
+
+    return assignments
+
+
 # -----------------------------------------------------------------------------------------------------------
 # Classes
 # -----------------------------------------------------------------------------------------------------------
 
 class IMGsort:
-    def __init__(self, tracks_df, images_df, output_dir):
+    def __init__(self, tracks_df, images_df, output_dir, secs_offset=4, output_mode="copy"):
         print("\n\n")
         announce("Start of New Object")
         self.tracksDf = tracks_df
         self.imagesDf = images_df
         self.outputDirectory = output_dir
 
+        # How files are placed in the sorted directories: copy, hardlink, symlink, reflink or manifest
+        assert output_mode in OUTPUT_MODES, f"Error: output_mode must be one of {OUTPUT_MODES}"
+        self.outputMode = output_mode
+
+        # Images taken up to this many seconds before / after a track are assigned to it
+        self.secsOffset = secs_offset
+
+        # Which image was assigned to which track
+        self.assignmentsDf = None
+
     @classmethod  # https://www.programiz.com/python-programming/methods/built-in/classmethod
     def fromArgs(cls, args):
 
@@ -56,13 +205,14 @@ class IMGsort:
 
 
 
-        tracks_df = pd.read_csv(tracks_df_csv)
-        images_df = pd.read_csv(images_df_csv)
+        tracks_df = readTable(tracks_df_csv)
+        images_df = readTable(images_df_csv)
 
 
         return cls(tracks_df=tracks_df,
                    images_df=images_df,
-                   output_dir=output_directory)
+                   output_dir=output_directory,
+                   output_mode=args.output_mode)
 
     def IMGsort(self):
         boxes_df = self.tracksDf
@@ -76,26 +226,43 @@ class IMGsort:
 
         output_base_dir = sortedOutputDirectory
         os.makedirs(output_base_dir, exist_ok=True)
-        for _, box in boxes_df.iterrows():
-            box_file_name = box['box_file_name']
-            box_dir = os.path.join(output_base_dir, box_file_name)
 
-            os.makedirs(box_dir, exist_ok=True)
+        # Match every image to every track in one pass
+        self.assignmentsDf = matchImagesToTracks(boxes_df, images_df, self.secsOffset)
+        self.assignmentsDf.to_csv(os.path.join(outputDirectory, "assignments.csv"))
 
-            shutil.copy(box['box_file_path'], os.path.join(box_dir, box_file_name))
+        # Images of each track, grouped once instead of filtering the assignments per track
+        imagesByBox = {box_file_name: images for box_file_name, images in
+                       self.assignmentsDf.groupby('box_file_name', sort=False)}
 
         for _, box in boxes_df.iterrows():
             box_file_name = box['box_file_name']
             box_dir = os.path.join(output_base_dir, box_file_name)
 
-            secsOffset = 4
-
-            images_in_box = images_df[
-                images_df.apply(lambda img: is_within_box_Time(img['time'], box, secsOffset), axis=1)]
+            os.makedirs(box_dir, exist_ok=True)
 
-            for _, image in images_in_box.iterrows():
-                shutil.copy(image['file_path'], os.path.join(box_dir, image['file_name']))
-        # print(tracksDf)
+            if self.outputMode == "manifest":
+                # Index the track's files instead of copying them
+                images_in_box = imagesByBox.get(box_file_name, self.assignmentsDf.iloc[:0])
+
+                manifestDf = pd.concat([pd.DataFrame({'kind': ["las"],
+                                                      'file_name': [box_file_name],
+                                                      'file_path': [os.path.abspath(box['box_file_path'])],
+                                                      'time': [np.nan]}),
+                                        pd.DataFrame({'kind': "image",
+                                                      'file_name': images_in_box['file_name'],
+                                                      'file_path': images_in_box['file_path'].map(os.path.abspath),
+                                                      'time': images_in_box['time']})],
+                                       ignore_index=True)
+
+                manifestDf.to_csv(os.path.join(box_dir, MANIFEST_NAME), index=False)
+            else:
+                placeFile(box['box_file_path'], os.path.join(box_dir, box_file_name), self.outputMode)
+
+        if self.outputMode != "manifest":
+            for _, image in self.assignmentsDf.iterrows():
+                box_dir = os.path.join(output_base_dir, image['box_file_name'])
+                placeFile(image['file_path'], os.path.join(box_dir, image['file_name']), self.outputMode)
 
     def add(self):
         announce("Input DIR: " + self.input_dir)
@@ -120,9 +287,11 @@ def main():
     """
 
     parser = argparse.ArgumentParser(description='Process and classify point clouds.')
-    parser.add_argument('--tracks_df', type=str, help='Directory containing the LAS files.')
+    parser.add_argument('--tracks_df', type=str, help='Tracks table written by processLASdir (tracks.parquet / tracks.csv).')
     parser.add_argument('--output_dir', type=str, default='.', help='Directory to save the processed files.')
-    parser.add_argument('--images_df', type=str, default='.', help='Directory to save the processed files.')
+    parser.add_argument('--images_df', type=str, default='.', help='Images table written by processIMGdir (images.parquet / images.csv).')
+    parser.add_argument('--output_mode', type=str, default='copy', choices=OUTPUT_MODES,
+                        help='How sorted files are placed: copy, hardlink, symlink, reflink or manifest (index only).')
 
     args = parser.parse_args()
     print(args)
@@ -155,7 +324,7 @@ def main():
                             output_dir=r"C:\Users\Alexander.Swann\Desktop\testingDATA\newoutput")
         images.run()
 
-        imgSort = IMGsort(tracks.tracksDf, images.imagesDf, tracks.output_dir)
+        imgSort = IMGsort(tracks.tracksDf, images.imagesDf, tracks.output_dir, output_mode=args.output_mode)
         imgSort.run()
 
         print("All Done.\n")
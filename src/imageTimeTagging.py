@@ -4,18 +4,18 @@
 
 import time
 
-import exifread
 import os
 import pandas as pd
-import subprocess
 import traceback
 import argparse
 
-from astropy.time import Time
-import re
-
 import numpy as np
 
+from timeConversion import isoToUnix
+from exifHarvest import listImages, harvestExif, EXIF_WORKERS
+from metadataCache import metadataCache
+from tableIO import writeTable
+
 # -----------------------------------------------------------------------------------------------------------
 # Functions
 # -----------------------------------------------------------------------------------------------------------
@@ -28,50 +28,18 @@ def announce(announcement: str):
     print(announcement)
     print("###############################################\n")
 
-def getImgTIME(filename):
-    exif_data = get_image_exif(filename)
-
-    dateOriginal = str(_get_if_exist(exif_data, 'EXIF DateTimeOriginal'))
-    secOriginal = str(_get_if_exist(exif_data, 'EXIF SubSecTimeOriginal'))
-
-    date_sec_og = dateOriginal + secOriginal[1:]
-
-    imgTime = replace_date_colons(date_sec_og)
-
-    img_t_in = Time(imgTime, format='iso', scale='utc')
-    img_t_out = Time(img_t_in, format='unix')
-
-    return img_t_out.to_value('unix', subfmt='float')
-
-def get_image_exif(imageLoc):
-    f = open(imageLoc, 'rb')
-
-    # Return Exif tags
-    return exifread.process_file(f)
-
-def _get_if_exist(data, key):
-    if key in data:
-        return data[key]
-
-    return None
-
-def replace_date_colons(date_time_str):
-    # Check if the date is already in the correct format (YYYY-MM-DD)
-    if re.match(r'\d{4}-\d{2}-\d{2}', date_time_str[:10]):
-        return date_time_str
-
-    # If not, replace the colons in the date part with hyphens
-    modified_date_time_str = re.sub(r'(\d{4}):(\d{2}):(\d{2})', r'\1-\2-\3', date_time_str)
-    return modified_date_time_str
-
 
 # -----------------------------------------------------------------------------------------------------------
 # Classes
 # -----------------------------------------------------------------------------------------------------------
 
 class processIMGdir:
-    def __init__(self, input_dir,  output_dir):
+    def __init__(self, input_dir,  output_dir, workers=EXIF_WORKERS, use_cache=True):
         self.imagesDf = None
+        # Threads reading the EXIF of the images
+        self.workers = workers
+        # Only read images that are new or changed since the last run (metadata.sqlite in output_dir)
+        self.use_cache = use_cache
         print("\n\n")
         announce("Start of New Object")
         self.input_dir = input_dir
@@ -95,38 +63,22 @@ class processIMGdir:
         imgdirectory = self.input_dir
         outputDirectory = self.output_dir
 
-        imagesData = []
-        imgfileList = os.listdir(imgdirectory)
         output_base_dir = outputDirectory
         os.makedirs(output_base_dir, exist_ok=True)
 
-        img_csv = True
-
-        if img_csv == True:
-            for file in imgfileList:
-                if file.endswith(".jpg") or file.endswith(".tif"):
-                    print("Processing file:", file)
-
-                    valTime = getImgTIME((os.path.join(imgdirectory, file)))
-
-                    imagesData.append([valTime, (os.path.join(imgdirectory, file)), file])
-
-                    # new_row = pd.DataFrame(
-                    # {'x': [vals[0]], 'y': [vals[1]],
-                    #   'file_path': [(os.path.join(imgdirectory, file))], 'file_name': [file]})
-
-                    # pd.concat([imagesDf, new_row], ignore_index=False)
-            imagesDf = pd.DataFrame(imagesData, columns=['time', 'file_path', 'file_name'])
+        imgfilePaths = listImages(imgdirectory)
+        print(f"Reading the EXIF of {len(imgfilePaths)} images")
 
-            imagesDf.to_csv(os.path.join(output_base_dir, "images.csv"))
+        # Time and location are read in the same pass, imageLocation can reuse this table
+        if self.use_cache:
+            with metadataCache(output_base_dir) as cache:
+                imagesDf = cache.harvestImages(imgfilePaths, workers=self.workers)
         else:
-            # imagesDf = pd.read_csv(os.path.join(output_base_dir, "images.csv"))
-            csv_path = r"Z:\NCCOS-temp\Swann\data\experimental\output\images.csv"
-            imagesDf = pd.read_csv(csv_path)
+            imagesDf = harvestExif(imgfilePaths, workers=self.workers)
+        imagesDf.insert(0, 'time', isoToUnix(imagesDf['time_string'].tolist()))
+        imagesDf = imagesDf.drop(columns=['time_string'])
 
-            print("00803409324")
-            print(imagesDf.head(5))
-            imagesDf.to_csv(os.path.join(output_base_dir, "images1.csv"))
+        writeTable(imagesDf, output_base_dir, "images")
 
         self.imagesDf = imagesDf
 
@@ -0,0 +1,194 @@
+import os
+
+import numpy as np
+
+# CloudComPy is optional so the cleaning stage can be imported without it (numpy backend)
+try:
+    import cloudComPy as cc
+
+    # import CloudCompare.cloudComPy as cc
+except ImportError:
+    cc = None
+
+from lasReader import readPoints
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Constants
+# -----------------------------------------------------------------------------------------------------------
+
+# Names CloudCompare gives the LAS attributes when it loads a file; stages look the scalar fields up by name
+SCALAR_FIELD_NAMES = {'intensity': 'Intensity',
+                      'gps_time': 'Gps Time',
+                      'classification': 'Classification'}
+
+# Coordinates are shifted to multiples of this value so they fit in the float32 coordinates of a cloud
+GLOBAL_SHIFT_STEP = 1000.0
+
+# Position of every point in its cloud, split over two float32 scalar fields (exact up to 2^24 each)
+POINT_INDEX_SF = ("Point Index Low", "Point Index High")
+POINT_INDEX_SPLIT = 2 ** 24
+
+# Temporary scalar field marking the points kept by maskedCloud
+MASK_SF = "Point Mask"
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Functions
+# -----------------------------------------------------------------------------------------------------------
+
+def globalShift(header):
+    """
+    Shift added to the real coordinates of a LAS file so the local (float32) coordinates stay small,
+    following the CloudCompare convention (local = global + shift).
+    """
+    return tuple(-np.floor(header[f'min_{axis}'] / GLOBAL_SHIFT_STEP) * GLOBAL_SHIFT_STEP for axis in 'xyz')
+
+
+def loadPointCloud(pcd_file, fields=('intensity',), min_intensity=None, bbox=None, time_window=None,
+                   chunk_size=10_000_000):
+    """
+    Loads a LAS file into a point cloud with column and predicate pushdown: only the requested
+    attributes are turned into scalar fields and only the points that pass the predicates are
+    allocated. Used in place of cc.loadPointCloud when most of the points would be filtered anyway.
+
+    Args:
+    - pcd_file (str): Path to the LAS file.
+    - fields (tuple): Attributes to load as scalar fields, besides X / Y / Z (intensity, gps_time, classification).
+    - min_intensity (int): Keep points with intensity >= min_intensity.
+    - bbox (tuple): Keep points inside (min_x, max_x, min_y, max_y), in real coordinates.
+    - time_window (tuple): Keep points with (start GPS time <= gps_time <= end GPS time), as stored in the file.
+    - chunk_size (int): Number of points read at a time.
+
+    Returns:
+    - ccPointCloud: The loaded cloud, with its global shift set.
+    """
+    columns, header = readPoints(pcd_file,
+                                 fields=('X', 'Y', 'Z') + tuple(fields),
+                                 min_intensity=min_intensity,
+                                 bbox=bbox,
+                                 time_window=time_window,
+                                 chunk_size=chunk_size)
+
+    return cloudFromColumns(os.path.basename(pcd_file), columns, header, fields)
+
+
+def cloudFromColumns(name, columns, header, fields=('intensity',)):
+    """
+    Builds a point cloud from the arrays returned by readPoints; X / Y / Z become the (shifted)
+    coordinates and every other requested column becomes a scalar field. Columns are consumed.
+
+    Args:
+    - name (str): Name of the cloud.
+    - columns (dict): Arrays returned by readPoints (X, Y, Z and the fields).
+    - header (dict): Header returned by readLasHeader.
+    - fields (tuple): Columns to turn into scalar fields.
+
+    Returns:
+    - ccPointCloud: The cloud, with its global shift set.
+    """
+    shift = globalShift(header)
+
+    xyz = np.empty((len(columns['X']), 3), dtype=np.float32)
+    for index, axis in enumerate('XYZ'):
+        xyz[:, index] = columns.pop(axis) + shift[index]
+
+    cloud = cc.ccPointCloud(name)
+    cloud.coordsFromNPArray_copy(xyz)
+    cloud.setGlobalShift(*shift)
+    xyz = None
+
+    for field in fields:
+        addScalarField(cloud, SCALAR_FIELD_NAMES.get(field, field), columns.pop(field))
+
+    return cloud
+
+
+def addScalarField(cloud, name, values):
+    """
+    Adds a scalar field to a cloud from an array (converted to float32).
+    """
+    sfIndex = cloud.addScalarField(name)
+    scalarField = cloud.getScalarField(sfIndex)
+    scalarField.fromNpArrayCopy(np.asarray(values, dtype=np.float32))
+    scalarField.computeMinAndMax()
+
+    return sfIndex
+
+
+def setScalarField(cloud, name, values):
+    """
+    Sets the values of a scalar field of a cloud, adding the field if the cloud does not have it.
+    """
+    scalarFieldDictionary = cloud.getScalarFieldDic()
+    if name not in scalarFieldDictionary:
+        return addScalarField(cloud, name, values)
+
+    scalarField = cloud.getScalarField(scalarFieldDictionary[name])
+    scalarField.fromNpArrayCopy(np.asarray(values, dtype=np.float32))
+    scalarField.computeMinAndMax()
+
+    return scalarFieldDictionary[name]
+
+
+def deleteScalarFields(cloud, names):
+    """
+    Removes the scalar fields of a cloud with these names, if present.
+    """
+    for name in names:
+        scalarFieldDictionary = cloud.getScalarFieldDic()
+        if name in scalarFieldDictionary:
+            cloud.deleteScalarField(scalarFieldDictionary[name])
+
+
+def addPointIndex(cloud):
+    """
+    Stores the position of every point in POINT_INDEX_SF, so the points of clouds derived from
+    this one (e.g. by CSF) can be traced back to it.
+    """
+    index = np.arange(cloud.size())
+    addScalarField(cloud, POINT_INDEX_SF[0], index % POINT_INDEX_SPLIT)
+    addScalarField(cloud, POINT_INDEX_SF[1], index // POINT_INDEX_SPLIT)
+
+
+def pointIndex(cloud):
+    """
+    Reads the positions stored by addPointIndex.
+
+    Returns:
+    - np.ndarray: Position of every point of the cloud in the cloud addPointIndex was called on.
+    """
+    scalarFieldDictionary = cloud.getScalarFieldDic()
+    low, high = [np.rint(cloud.getScalarField(scalarFieldDictionary[name]).toNpArrayCopy()).astype(np.int64)
+                 for name in POINT_INDEX_SF]
+
+    return high * POINT_INDEX_SPLIT + low
+
+
+def entityBytes(entity):
+    """
+    Approximate memory held by a cloud (coordinates and float32 scalar fields) or a mesh (triangles
+    and their vertices), e.g. to budget the clouds waiting to be written.
+    """
+    if isinstance(entity, cc.ccMesh):
+        return entity.size() * 12 + entityBytes(entity.getAssociatedCloud())
+
+    return entity.size() * (12 + 4 * entity.getNumberOfScalarFields())
+
+
+def maskedCloud(cloud, mask):
+    """
+    Extracts the points of a cloud selected by a boolean mask, through a temporary scalar field.
+
+    Returns:
+    - ccPointCloud: The selected points.
+    """
+    sfIndex = addScalarField(cloud, MASK_SF, mask)
+    cloud.setCurrentScalarField(sfIndex)
+
+    selectedCloud = cc.filterBySFValue(1, 1, cloud)
+
+    deleteScalarFields(selectedCloud, [MASK_SF])
+    deleteScalarFields(cloud, [MASK_SF])
+
+    return selectedCloud
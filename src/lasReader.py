@@ -0,0 +1,349 @@
+import os
+import struct
+
+import numpy as np
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Constants
+# -----------------------------------------------------------------------------------------------------------
+
+# Public header block fields shared by LAS 1.0 - 1.4: (name, struct format, byte offset)
+HEADER_FIELDS = [('file_signature', '4s', 0),
+                 ('global_encoding', 'H', 6),
+                 ('version_major', 'B', 24),
+                 ('version_minor', 'B', 25),
+                 ('header_size', 'H', 94),
+                 ('offset_to_point_data', 'I', 96),
+                 ('number_of_vlrs', 'I', 100),
+                 ('point_format', 'B', 104),
+                 ('point_record_length', 'H', 105),
+                 ('legacy_point_count', 'I', 107),
+                 ('x_scale', 'd', 131), ('y_scale', 'd', 139), ('z_scale', 'd', 147),
+                 ('x_offset', 'd', 155), ('y_offset', 'd', 163), ('z_offset', 'd', 171),
+                 ('max_x', 'd', 179), ('min_x', 'd', 187),
+                 ('max_y', 'd', 195), ('min_y', 'd', 203),
+                 ('max_z', 'd', 211), ('min_z', 'd', 219)]
+
+# LAS 1.4 stores the 64-bit point count after the EVLR fields
+POINT_COUNT_14_OFFSET = 247
+
+# Size of the public header that has to be read to get every field above
+HEADER_READ_SIZE = 375
+
+# Byte offset of each attribute within a point record, for the legacy (0-5) and new (6-10) point formats
+LEGACY_FIELDS = {'X': ('<i4', 0), 'Y': ('<i4', 4), 'Z': ('<i4', 8),
+                 'intensity': ('<u2', 12), 'classification': ('u1', 15), 'gps_time': ('<f8', 20)}
+
+NEW_FIELDS = {'X': ('<i4', 0), 'Y': ('<i4', 4), 'Z': ('<i4', 8),
+              'intensity': ('<u2', 12), 'classification': ('u1', 16), 'gps_time': ('<f8', 22)}
+
+# Point formats that carry a GPS time
+GPS_TIME_FORMATS = [1, 3, 4, 5, 6, 7, 8, 9, 10]
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Functions
+# -----------------------------------------------------------------------------------------------------------
+
+def readLasHeader(pcd_file):
+    """
+    Reads the public header block of a LAS file without touching the point records.
+
+    Args:
+    - pcd_file (str): Path to the LAS file.
+
+    Returns:
+    - dict: Header values (point format, record length, point count, scales, offsets, bounding box, ...).
+    """
+    with open(pcd_file, 'rb') as f:
+        raw = f.read(HEADER_READ_SIZE)
+
+    if len(raw) < 227 or raw[0:4] != b"LASF":
+        raise Exception(f"Error: {os.path.basename(pcd_file)} is not a LAS file")
+
+    header = {name: struct.unpack_from(f"<{fmt}", raw, offset)[0] for name, fmt, offset in HEADER_FIELDS}
+
+    # Bit 7 (and 6) of the point format are set by LASzip for compressed (LAZ) point records
+    header['compressed'] = header['point_format'] >= 128
+    header['point_format'] = header['point_format'] & 0x3F
+
+    header['point_count'] = header['legacy_point_count']
+    if (header['version_major'], header['version_minor']) >= (1, 4) and len(raw) >= POINT_COUNT_14_OFFSET + 8:
+        point_count_14 = struct.unpack_from("<Q", raw, POINT_COUNT_14_OFFSET)[0]
+        if point_count_14 > 0:
+            header['point_count'] = point_count_14
+
+    header['file_size'] = os.path.getsize(pcd_file)
+
+    return header
+
+
+def pointDtype(header, fields=None):
+    """
+    Builds a NumPy structured dtype for the point records of a LAS file; only the requested
+    fields are named, the remaining bytes of each record are skipped.
+
+    Args:
+    - header (dict): Header returned by readLasHeader.
+    - fields (list): Attributes to expose (default all known attributes of the point format).
+
+    Returns:
+    - np.dtype: dtype whose itemsize equals the point record length.
+    """
+    layout = LEGACY_FIELDS if header['point_format'] < 6 else NEW_FIELDS
+
+    if fields is None:
+        fields = [name for name in layout if name != 'gps_time' or header['point_format'] in GPS_TIME_FORMATS]
+
+    for name in fields:
+        if name not in layout:
+            raise Exception(f"Error: Unknown LAS attribute '{name}'")
+        if name == 'gps_time' and header['point_format'] not in GPS_TIME_FORMATS:
+            raise Exception(f"Error: Point format {header['point_format']} does not store GPS time")
+
+    return np.dtype({'names': list(fields),
+                     'formats': [layout[name][0] for name in fields],
+                     'offsets': [layout[name][1] for name in fields],
+                     'itemsize': header['point_record_length']})
+
+
+def memmapPoints(pcd_file, header=None, fields=None):
+    """
+    Memory-maps the point data block of a LAS file; each field is a strided view into the file,
+    nothing is read until it is used.
+
+    Args:
+    - pcd_file (str): Path to the LAS file.
+    - header (dict): Header returned by readLasHeader (read from the file if not provided).
+    - fields (list): Attributes to expose.
+
+    Returns:
+    - np.memmap: Structured (read-only) array with one record per point.
+    """
+    if header is None:
+        header = readLasHeader(pcd_file)
+
+    if header['compressed']:
+        raise Exception(f"Error: {os.path.basename(pcd_file)} is compressed (LAZ), decompress it first")
+
+    dtype = pointDtype(header, fields)
+
+    # Guard against a truncated file, only map the records that are actually there
+    available = (header['file_size'] - header['offset_to_point_data']) // dtype.itemsize
+    count = int(min(header['point_count'], available))
+
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+
+    return np.memmap(pcd_file, dtype=dtype, mode='r', offset=header['offset_to_point_data'], shape=(count,))
+
+
+def lasGpsTimeRange(pcd_file, chunk_size=10_000_000):
+    """
+    Gets the minimum and maximum GPS time of a LAS file straight from its point records.
+
+    Args:
+    - pcd_file (str): Path to the LAS file.
+    - chunk_size (int): Number of points scanned at a time.
+
+    Returns:
+    - list: [min GPS time, max GPS time] as stored in the file.
+    """
+    points = memmapPoints(pcd_file, fields=['gps_time'])
+
+    if len(points) == 0:
+        raise Exception(f"Error: {os.path.basename(pcd_file)} has no points")
+
+    gps_time = points['gps_time']
+
+    t_min, t_max = np.inf, -np.inf
+    for start in range(0, len(gps_time), chunk_size):
+        chunk = gps_time[start:start + chunk_size]
+        t_min = min(t_min, chunk.min())
+        t_max = max(t_max, chunk.max())
+
+    return [float(t_min), float(t_max)]
+
+
+def readPoints(pcd_file, fields=('X', 'Y', 'Z', 'intensity'), min_intensity=None, bbox=None, time_window=None,
+               chunk_size=10_000_000):
+    """
+    Streams the point records of a LAS file in chunks and only keeps the requested attributes of
+    the points that pass the predicates; rejected points are never copied out of the file.
+
+    Args:
+    - pcd_file (str): Path to the LAS file.
+    - fields (tuple): Attributes to return; X / Y / Z are returned scaled (real coordinates, float64)
+      and 'index' returns the position of each point record in the file.
+    - min_intensity (int): Keep points with intensity >= min_intensity.
+    - bbox (tuple): Keep points inside (min_x, max_x, min_y, max_y), in real coordinates.
+    - time_window (tuple): Keep points with (start GPS time <= gps_time <= end GPS time), as stored in the file.
+    - chunk_size (int): Number of points scanned at a time.
+
+    Returns:
+    - dict: One array per field, for the kept points only.
+    - dict: Header returned by readLasHeader.
+    """
+    header = readLasHeader(pcd_file)
+
+    # Attributes needed to evaluate the predicates, read even if they are not returned
+    needed = [name for name in fields if name != 'index']
+    for name, predicate in [('intensity', min_intensity), ('X', bbox), ('Y', bbox), ('gps_time', time_window)]:
+        if predicate is not None and name not in needed:
+            needed.append(name)
+
+    points = memmapPoints(pcd_file, header=header, fields=needed)
+
+    # Compare the bounding box against the raw integer coordinates so nothing is scaled before filtering
+    if bbox is not None:
+        min_x, max_x, min_y, max_y = bbox
+        raw_x = (np.ceil((min_x - header['x_offset']) / header['x_scale']),
+                 np.floor((max_x - header['x_offset']) / header['x_scale']))
+        raw_y = (np.ceil((min_y - header['y_offset']) / header['y_scale']),
+                 np.floor((max_y - header['y_offset']) / header['y_scale']))
+
+    chunks = {name: [] for name in fields}
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start:start + chunk_size]
+
+        keep = np.ones(len(chunk), dtype=bool)
+        if min_intensity is not None:
+            keep &= chunk['intensity'] >= min_intensity
+        if bbox is not None:
+            keep &= (chunk['X'] >= raw_x[0]) & (chunk['X'] <= raw_x[1])
+            keep &= (chunk['Y'] >= raw_y[0]) & (chunk['Y'] <= raw_y[1])
+        if time_window is not None:
+            keep &= (chunk['gps_time'] >= time_window[0]) & (chunk['gps_time'] <= time_window[1])
+
+        for name in fields:
+            if name == 'index':
+                chunks[name].append(np.flatnonzero(keep) + start)
+                continue
+
+            values = chunk[name][keep]
+            if name in ('X', 'Y', 'Z'):
+                axis = name.lower()
+                values = values * header[f'{axis}_scale'] + header[f'{axis}_offset']
+            chunks[name].append(values)
+
+    columns = {name: (np.concatenate(values) if values else
+                      np.zeros(0, dtype=np.int64 if name == 'index' else points.dtype[name]))
+               for name, values in chunks.items()}
+
+    return columns, header
+
+
+def readPointsAt(pcd_file, index, fields=('X', 'Y', 'Z', 'intensity'), header=None):
+    """
+    Reads the requested attributes of the point records at the given positions only (e.g. the
+    points of one tile found by an earlier pass), instead of scanning the whole file.
+
+    Args:
+    - pcd_file (str): Path to the LAS file.
+    - index (np.ndarray): Sorted positions of the point records in the file.
+    - fields (tuple): Attributes to return; X / Y / Z are returned scaled (real coordinates, float64).
+    - header (dict): Header returned by readLasHeader (read from the file if not provided).
+
+    Returns:
+    - dict: One array per field, in the order of index.
+    - dict: Header returned by readLasHeader.
+    """
+    if header is None:
+        header = readLasHeader(pcd_file)
+
+    points = memmapPoints(pcd_file, header=header, fields=list(fields))[index]
+
+    columns = {}
+    for name in fields:
+        values = points[name]
+        if name in ('X', 'Y', 'Z'):
+            axis = name.lower()
+            values = values * header[f'{axis}_scale'] + header[f'{axis}_offset']
+        columns[name] = np.ascontiguousarray(values)
+
+    return columns, header
+
+
+def writeLasFile(template_file, output_file, record_parts, point_count, bounds):
+    """
+    Writes a LAS file from raw point records, reusing the header and VLRs of the file the records
+    were taken from; only the point count, the bounding box and the offsets are updated.
+
+    Args:
+    - template_file (str): LAS file the records come from.
+    - output_file (str): Path of the LAS file to write.
+    - record_parts (list): Raw point records appended in order; each part is an array returned by
+      memmapRecords (or a subset of it) or the path of a file holding raw records.
+    - point_count (int): Total number of records in the parts.
+    - bounds (tuple): (min_x, max_x, min_y, max_y, min_z, max_z) of the points, in real coordinates.
+    """
+    header = readLasHeader(template_file)
+
+    with open(template_file, 'rb') as f:
+        raw = bytearray(f.read(header['offset_to_point_data']))
+
+    # Legacy point count (only valid below 2^32 points) and points by return, which are not tracked
+    struct.pack_into("<I", raw, 107, point_count if point_count < 2 ** 32 else 0)
+    struct.pack_into("<5I", raw, 111, 0, 0, 0, 0, 0)
+
+    min_x, max_x, min_y, max_y, min_z, max_z = bounds
+    struct.pack_into("<6d", raw, 179, max_x, min_x, max_y, min_y, max_z, min_z)
+
+    if (header['version_major'], header['version_minor']) >= (1, 4) and header['header_size'] >= 375:
+        # No waveform / extended VLRs are written after the points; 64-bit point count, by return unknown
+        struct.pack_into("<QQ", raw, 227, 0, 0)
+        struct.pack_into("<I", raw, 243, 0)
+        struct.pack_into("<Q", raw, POINT_COUNT_14_OFFSET, point_count)
+        struct.pack_into("<15Q", raw, 255, *([0] * 15))
+
+    with open(output_file, 'wb') as out:
+        out.write(raw)
+        for part in record_parts:
+            if isinstance(part, np.ndarray):
+                part.tofile(out)
+                continue
+
+            with open(part, 'rb') as f:
+                while True:
+                    block = f.read(64 * 2 ** 20)
+                    if not block:
+                        break
+                    out.write(block)
+
+
+def memmapRecords(pcd_file, header=None):
+    """
+    Memory-maps the point data block of a LAS file as raw (opaque) records, e.g. to copy a subset
+    of the points to another file without decoding them.
+
+    Returns:
+    - np.memmap: Array of np.void records, one per point.
+    """
+    if header is None:
+        header = readLasHeader(pcd_file)
+
+    if header['compressed']:
+        raise Exception(f"Error: {os.path.basename(pcd_file)} is compressed (LAZ), decompress it first")
+
+    available = (header['file_size'] - header['offset_to_point_data']) // header['point_record_length']
+    count = int(min(header['point_count'], available))
+
+    dtype = np.dtype((np.void, header['point_record_length']))
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+
+    return np.memmap(pcd_file, dtype=dtype, mode='r', offset=header['offset_to_point_data'], shape=(count,))
+
+
+def countPoints(pcd_file, min_intensity=None, chunk_size=10_000_000):
+    """
+    Counts the points of a LAS file with intensity >= min_intensity without loading them.
+    """
+    if min_intensity is None:
+        return int(readLasHeader(pcd_file)['point_count'])
+
+    intensity = memmapPoints(pcd_file, fields=['intensity'])['intensity']
+
+    return int(sum(np.count_nonzero(intensity[start:start + chunk_size] >= min_intensity)
+                   for start in range(0, len(intensity), chunk_size)))
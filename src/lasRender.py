@@ -13,6 +13,9 @@ import cloudComPy as cc
 
 import pandas as pd
 from common import announce
+from tableIO import readTable
+from imageTimeSort import trackFiles
+from imageLocation import imageLocation
 
 
 # -----------------------------------------------------------------------------------------------------------
@@ -23,8 +26,22 @@ class lasRender:
     def __init__(self,
                  bin_file,
                  image_dir,
-                 output_dir, img_info):
-        self.img_info = img_info
+                 output_dir, img_info=None):
+        # Sorted track directory (Sorted Images/<track>) holding, or listing in its manifest, the LAS and images
+        self.image_dir = image_dir
+
+        # LAS file of the track, resolved through the manifest when the track was sorted in "manifest" mode
+        self.las_files = trackFiles(image_dir, "las", (".las",)) if image_dir and os.path.isdir(image_dir) else []
+
+        # Image table (DataFrame from imageLocation, or the path of its image_locations table); read from the
+        # track directory if not provided
+        if img_info is None:
+            images = imageLocation(input_dir=image_dir, output_dir=output_dir)
+            images.run()
+            img_info = images.imagesDf
+        elif isinstance(img_info, str):
+            img_info = readTable(img_info)
+        self.img_info = img_info.reset_index(drop=True)
         self.output_dir = output_dir
         # Input PCD (las) file, checks
         self.bin_file = bin_file
@@ -40,6 +57,11 @@ class lasRender:
         assert os.path.exists(self.bin_file), "Error: PCD file doesn't exist"
         assert self.bin_name.lower().endswith(".bin"), "Error: PCD file is not a 'bin' file"
 
+        # The BIN files are named after the LAS file without its dots (segmentCloud.pcd_basename)
+        las_basenames = ["".join(os.path.basename(las_file).split(".")[:-1]) for las_file in self.las_files]
+        if self.las_files and not any(las_basename in self.bin_basename for las_basename in las_basenames):
+            print(f"Warning: {self.bin_name} does not come from the track of {os.path.basename(self.las_files[0])}")
+
 
     def render(self):
 
@@ -110,13 +132,13 @@ class lasRender:
 
 
         for i in range(len(self.img_info)):
-            print((self.img_info['location'][i][0] + xshift, self.img_info['location'][i][1] + yshift))
+            print((self.img_info['easting'][i] + xshift, self.img_info['northing'][i] + yshift))
             #cc.setCustomView((0., math.cos(i * alphaRad), -math.sin(i * alphaRad)), (0., math.sin(i * alphaRad), math.cos(i * alphaRad)))
             cc.setViewerPerspectiveView()
             cc.setCustomView((-0.30, 0.0, -1.0), (-1.0, 0.0, 0.0))
 
-            cc.setCameraPos((self.img_info['location'][i][0] + xshift, self.img_info['location'][i][1] + yshift, -self.img_info['m_above_sealevel'][i] + 5))
-            #cc.setCameraPos((self.img_info['location'][i][0] +i, self.img_info['location'][i][1]+j, 100))
+            cc.setCameraPos((self.img_info['easting'][i] + xshift, self.img_info['northing'][i] + yshift, -self.img_info['altitude'][i] + 5))
+            #cc.setCameraPos((self.img_info['easting'][i] +i, self.img_info['northing'][i]+j, 100))
 
             img_name =  ".".join( (self.img_info['file_name'][i]) .split(".")[:-1] )+ "_pcd.png"
             print(img_name)
@@ -6,15 +6,15 @@ import time
 
 import os
 import pandas as pd
-import subprocess
 import traceback
 import argparse
 
-from astropy.time import Time
-import re
-
 import numpy as np
 
+from timeConversion import gpsToUnix
+from metadataCache import metadataCache, readTracks
+from tableIO import writeTable
+
 # -----------------------------------------------------------------------------------------------------------
 # Functions
 # -----------------------------------------------------------------------------------------------------------
@@ -27,26 +27,12 @@ def announce(announcement: str):
     print(announcement)
     print("###############################################\n")
 
-def getLasInfo(loc, file):
-    result = subprocess.run([loc, file, "-stdout"], shell=True, capture_output=True, text=True)
-    return result.stdout
-
-def TIMEparse_lasinfo_report(report):
-    min_pattern = re.compile(r'gps_time\s+([\d\.]+)\s+([\d\.]+)')
-    min_match = min_pattern.search(report)
-    min_values = list(map(float, min_match.groups()))
-
-    startTime = min_values[0] + 1000000000
-    endTime = min_values[1] + 1000000000
-
-    sec = [startTime, endTime]
-    las_t_in = Time(sec, format='gps')
-    las_t_out = Time(las_t_in, format='iso', scale='utc')
-    print(las_t_out)
-
-    las_t_out2 = Time(las_t_out, format='unix')
-
-    return las_t_out2.to_value('unix', subfmt='float')
+def TIMEconvert_gps_range(min_values):
+    """
+    Converts a [start, end] range of adjusted standard GPS times to unix times; also accepts
+    an (N, 2) array of ranges so a whole directory is converted in one pass.
+    """
+    return gpsToUnix(min_values, adjusted=True)
 
 
 # -----------------------------------------------------------------------------------------------------------
@@ -54,8 +40,12 @@ def TIMEparse_lasinfo_report(report):
 # -----------------------------------------------------------------------------------------------------------
 
 class processLASdir:
-    def __init__(self, input_dir,  output_dir):
+    def __init__(self, input_dir,  output_dir, use_cache=True):
         self.tracksDf = None
+        # Only read tracks that are new or changed since the last run (metadata.sqlite in output_dir)
+        self.use_cache = use_cache
+        # Track index (header values and GPS time range of every track)
+        self.indexDf = None
         print("\n\n")
         announce("Start of New Object")
         self.input_dir = input_dir
@@ -83,36 +73,36 @@ class processLASdir:
 
         print("Files and directories in '", directory, "' :")
         print(fileList)
-        tracksData = []
-
-        for file in fileList:
-            if file.endswith(".las"):
-                print("Processing file:", file)
+        pcd_files = [os.path.join(directory, file) for file in fileList if file.endswith(".las")]
 
-                lasinfo = r".\build\lasinfo.exe"
-                print(lasinfo)
-                lasinfo_report = getLasInfo(lasinfo, (os.path.join(directory, file)))
-
-                # print(lasinfo_report)
+        output_base_dir = outputDirectory
+        os.makedirs(output_base_dir, exist_ok=True)
 
-                min_vals = TIMEparse_lasinfo_report(lasinfo_report)
-                print(min_vals[0], min_vals[1])
+        # Header values and GPS time ranges are read straight from the LAS files (no lasinfo.exe)
+        if self.use_cache:
+            with metadataCache(output_base_dir) as cache:
+                indexDf = cache.indexTracks(pcd_files)
+        else:
+            indexDf = readTracks(pcd_files)
 
-                # #new_row = pd.DataFrame(
-                #     {'min_x': [min_vals[0]], 'min_y': [min_vals[1]], 'max_x': [max_vals[0]], 'max_y': [max_vals[1]],
-                #      'box_file_name': [file], 'box_file_path': [(os.path.join(directory, file))]})
-                tracksData.append([min_vals[0], min_vals[1], file, (os.path.join(directory, file))])
-                # print(new_row)
+        for file, gps_start, gps_end in indexDf[['file_name', 'gps_start', 'gps_end']].itertuples(index=False):
+            print(file, gps_start, gps_end)
 
-                # pd.concat([tracksDf, new_row], ignore_index=False)
+        untimed = indexDf['gps_start'].isna()
+        if untimed.any():
+            print(f"Warning: Skipping tracks without GPS time: {indexDf.loc[untimed, 'file_name'].tolist()}")
+            indexDf = indexDf[~untimed].reset_index(drop=True)
 
-        tracksDf = pd.DataFrame(tracksData, columns=['Tstart', 'Tend', 'box_file_name', 'box_file_path'])
+        # Convert the GPS times of every track to unix times in a single pass
+        unixRanges = TIMEconvert_gps_range(indexDf[['gps_start', 'gps_end']].to_numpy(dtype=np.float64))
 
-        output_base_dir = outputDirectory
-        os.makedirs(output_base_dir, exist_ok=True)
+        tracksDf = pd.DataFrame({'box_file_name': indexDf['file_name'], 'box_file_path': indexDf['file_path']})
+        tracksDf.insert(0, 'Tstart', unixRanges[:, 0])
+        tracksDf.insert(1, 'Tend', unixRanges[:, 1])
 
-        tracksDf.to_csv(os.path.join(output_base_dir, "tracks.csv"))
+        writeTable(tracksDf, output_base_dir, "tracks")
 
+        self.indexDf = indexDf
         self.tracksDf = tracksDf
 
 
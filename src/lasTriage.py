@@ -0,0 +1,100 @@
+import os
+import shutil
+
+import pandas as pd
+
+from common import announce
+from lasReader import readLasHeader
+from metadataCache import metadataCache, CACHE_NAME
+from tableIO import writeTable
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Functions
+# -----------------------------------------------------------------------------------------------------------
+
+def triageLas(pcd_file, density_thresh=7000, min_point_thresh=100000, header=None):
+    """
+    Decides from the LAS public header alone whether a track can pass cleaning. The header point
+    count is an upper bound of the points left after the intensity filter, and the header bounding
+    box is the extent cleanCloud uses for the density, so a rejected track would also be rejected
+    by cleanCloud.clean().
+
+    Args:
+    - pcd_file (str): Path to the LAS file.
+    - density_thresh (float): Minimum points per meter squared.
+    - min_point_thresh (int): Minimum number of points.
+    - header (dict): Header values of the track (e.g. metadataCache.trackInfo), read from the file if not provided.
+
+    Returns:
+    - dict: Triage result (file, point_format, point_count, area, points_per_squared, accepted, reason).
+    """
+    if header is None:
+        header = readLasHeader(pcd_file)
+
+    area_total = (header['max_x'] - header['min_x']) * (header['max_y'] - header['min_y'])
+    pts_per_squared = header['point_count'] / area_total if area_total > 0 else float('inf')
+
+    reason = ""
+    if header['point_count'] < min_point_thresh:
+        reason = f"{header['point_count']} points < {min_point_thresh}"
+    elif pts_per_squared < density_thresh:
+        reason = f"{pts_per_squared:.1f} points per m^2 < {density_thresh}"
+
+    return {'file': pcd_file,
+            'point_format': header['point_format'],
+            'point_count': header['point_count'],
+            'area': area_total,
+            'points_per_squared': pts_per_squared,
+            'accepted': reason == "",
+            'reason': reason}
+
+
+def triageFiles(pcd_files, output_dir, density_thresh=7000, min_point_thresh=100000):
+    """
+    Triages every LAS file from its header before anything is loaded. Rejected files are copied to
+    the trash directory used by cleanCloud (cleaned/badFiles/BAD_<name>); files whose header cannot
+    be read are accepted so the full cleaning reports the problem. Tracks in the track index of
+    output_dir (metadata.sqlite, written by processLASdir) are triaged without opening them.
+
+    Args:
+    - pcd_files (list): Paths to the LAS files.
+    - output_dir (str): Directory where all output goes.
+    - density_thresh (float): Minimum points per meter squared.
+    - min_point_thresh (int): Minimum number of points.
+
+    Returns:
+    - list: Paths of the accepted files (same order as pcd_files).
+    - DataFrame: Triage result of every file.
+    """
+    cache = metadataCache(output_dir) if os.path.exists(os.path.join(output_dir, CACHE_NAME)) else None
+
+    results = []
+    for pcd_file in pcd_files:
+        try:
+            header = cache.trackInfo(pcd_file) if cache is not None else None
+            results.append(triageLas(pcd_file, density_thresh, min_point_thresh, header=header))
+        except Exception as e:
+            results.append({'file': pcd_file, 'accepted': True, 'reason': f"header not read: {e}"})
+
+    if cache is not None:
+        cache.close()
+
+    triageDf = pd.DataFrame(results, columns=['file', 'point_format', 'point_count', 'area',
+                                              'points_per_squared', 'accepted', 'reason'])
+
+    rejectedDf = triageDf[~triageDf['accepted']]
+    announce(f"Triage: {len(triageDf) - len(rejectedDf)} accepted, {len(rejectedDf)} rejected from the LAS header")
+
+    if len(rejectedDf) > 0:
+        trash_dir = f"{output_dir}/cleaned/badFiles"
+        os.makedirs(trash_dir, exist_ok=True)
+
+        for pcd_file, reason in rejectedDf[['file', 'reason']].itertuples(index=False):
+            trash_file = f"{trash_dir}/BAD_{os.path.basename(pcd_file)}"
+            shutil.copyfile(pcd_file, trash_file)
+            print(f"Warning: {os.path.basename(pcd_file)} rejected ({reason}), output as {os.path.basename(trash_file)}")
+
+    writeTable(triageDf, f"{output_dir}/cleaned", "triage")
+
+    return triageDf.loc[triageDf['accepted'], 'file'].tolist(), triageDf
@@ -0,0 +1,237 @@
+import os
+import sqlite3
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+from exifHarvest import harvestExif, EXIF_COLUMNS, EXIF_WORKERS
+from lasReader import readLasHeader, lasGpsTimeRange, GPS_TIME_FORMATS
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Constants
+# -----------------------------------------------------------------------------------------------------------
+
+# Name of the cache database, written in the output directory
+CACHE_NAME = "metadata.sqlite"
+
+# Files are re-read when their modification time (ns) or size differs from the cached values
+IMAGE_TABLE = """
+CREATE TABLE IF NOT EXISTS images (
+    file_path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    file_name TEXT,
+    time_string TEXT,
+    latitude REAL,
+    longitude REAL,
+    altitude REAL
+)
+"""
+
+# GPS times are stored as read from the file (adjusted standard GPS time); NULL if the point format has none
+TRACK_TABLE = """
+CREATE TABLE IF NOT EXISTS tracks (
+    file_path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    file_name TEXT,
+    point_format INTEGER,
+    point_count INTEGER,
+    min_x REAL, max_x REAL,
+    min_y REAL, max_y REAL,
+    min_z REAL, max_z REAL,
+    gps_start REAL,
+    gps_end REAL
+)
+"""
+
+# Columns of the track index
+TRACK_COLUMNS = ['file_path', 'file_name', 'point_format', 'point_count',
+                 'min_x', 'max_x', 'min_y', 'max_y', 'min_z', 'max_z', 'gps_start', 'gps_end']
+
+# Threads indexing LAS files at the same time
+TRACK_WORKERS = 4
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Functions
+# -----------------------------------------------------------------------------------------------------------
+
+def _statFile(file_path):
+    stat = os.stat(file_path)
+    return [file_path, stat.st_mtime_ns, stat.st_size]
+
+
+def statFiles(file_paths, workers=EXIF_WORKERS):
+    """
+    Gets the modification time (ns) and size of many files; stat calls are threaded since they
+    are slow on network shares.
+
+    Returns:
+    - DataFrame: columns file_path, mtime_ns, size (same order as file_paths).
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        stats = list(executor.map(_statFile, file_paths))
+
+    return pd.DataFrame(stats, columns=['file_path', 'mtime_ns', 'size'])
+
+
+def readTrack(pcd_file):
+    """
+    Reads the index values of a LAS track: header values and the GPS time range of its points.
+
+    Returns:
+    - list: Values in the order of TRACK_COLUMNS.
+    """
+    header = readLasHeader(pcd_file)
+
+    gps_range = [np.nan, np.nan]
+    if header['point_format'] in GPS_TIME_FORMATS and header['point_count'] > 0:
+        gps_range = lasGpsTimeRange(pcd_file)
+
+    return [pcd_file, os.path.basename(pcd_file), header['point_format'], header['point_count'],
+            header['min_x'], header['max_x'], header['min_y'], header['max_y'],
+            header['min_z'], header['max_z'], gps_range[0], gps_range[1]]
+
+
+def readTracks(pcd_files, workers=TRACK_WORKERS):
+    """
+    Reads the index values of many LAS tracks with a thread pool. A track that cannot be read is
+    reported and gets NaN values (no point format) instead of stopping the others.
+
+    Returns:
+    - DataFrame: One row per track, columns TRACK_COLUMNS (same order as pcd_files).
+    """
+    def tryReadTrack(pcd_file):
+        try:
+            return readTrack(pcd_file)
+        except Exception as e:
+            print(f"Warning: Could not index {os.path.basename(pcd_file)}\n{e}")
+            return [pcd_file, os.path.basename(pcd_file)] + [np.nan] * (len(TRACK_COLUMNS) - 2)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        tracksData = list(executor.map(tryReadTrack, pcd_files))
+
+    return pd.DataFrame(tracksData, columns=TRACK_COLUMNS)
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Classes
+# -----------------------------------------------------------------------------------------------------------
+
+class metadataCache:
+    """
+    On-disk (SQLite) cache of per-file metadata keyed by path, modification time and size, so
+    re-scans only have to read new or changed files. Holds the image EXIF table and the LAS
+    track index.
+    """
+
+    def __init__(self, cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, CACHE_NAME)
+
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.execute(IMAGE_TABLE)
+        self.connection.execute(TRACK_TABLE)
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _read(self, table):
+        return pd.read_sql_query(f"SELECT * FROM {table}", self.connection)
+
+    def _write(self, table, df):
+        columns = list(df.columns)
+        self.connection.executemany(
+            f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+        self.connection.commit()
+
+    def harvestImages(self, imgfilePaths, workers=EXIF_WORKERS):
+        """
+        Returns the EXIF table of the images, only reading the images that are new or changed
+        since they were cached. Images whose EXIF could not be read (no time string) are not
+        cached, so a transient read error is retried on the next run.
+
+        Args:
+        - imgfilePaths (list): Paths of the images.
+        - workers (int): Number of threads reading EXIF.
+
+        Returns:
+        - DataFrame: One row per image, columns EXIF_COLUMNS (same order as imgfilePaths).
+        """
+        statsDf = statFiles(imgfilePaths, workers=workers)
+
+        # Failed reads (and the missing times an older version cached as "None") are read again too
+        imagesDf = self._read("images")
+        imagesDf = imagesDf[imagesDf['time_string'].notna() & (imagesDf['time_string'] != "None")]
+
+        cachedDf = statsDf.merge(imagesDf, on=['file_path', 'mtime_ns', 'size'], how='inner')
+        cachedPaths = set(cachedDf['file_path'])
+
+        changedDf = statsDf[~statsDf['file_path'].isin(cachedPaths)]
+        print(f"Metadata cache: {len(cachedPaths)} images cached, {len(changedDf)} new or changed")
+
+        if len(changedDf) > 0:
+            harvestedDf = harvestExif(changedDf['file_path'].tolist(), workers=workers)
+            harvestedDf = changedDf.merge(harvestedDf, on='file_path', how='left')
+            self._write("images", harvestedDf[harvestedDf['time_string'].notna()])
+
+            cachedDf = pd.concat([cachedDf, harvestedDf], ignore_index=True)
+
+        return cachedDf.set_index('file_path').loc[imgfilePaths].reset_index()[EXIF_COLUMNS]
+
+    def indexTracks(self, pcd_files, workers=TRACK_WORKERS):
+        """
+        Returns the track index of the LAS files, only reading the files that are new or changed
+        since they were indexed. Tracks that cannot be read are not cached (they are read again
+        next time) and have NaN values.
+
+        Args:
+        - pcd_files (list): Paths of the LAS files.
+        - workers (int): Number of threads reading (and checking) LAS files.
+
+        Returns:
+        - DataFrame: One row per track, columns TRACK_COLUMNS (same order as pcd_files).
+        """
+        statsDf = statFiles(pcd_files, workers=workers)
+
+        cachedDf = statsDf.merge(self._read("tracks"), on=['file_path', 'mtime_ns', 'size'], how='inner')
+        cachedPaths = set(cachedDf['file_path'])
+
+        changedDf = statsDf[~statsDf['file_path'].isin(cachedPaths)]
+        print(f"Track index: {len(cachedPaths)} tracks unchanged, {len(changedDf)} new or changed")
+
+        if len(changedDf) > 0:
+            indexedDf = changedDf.merge(readTracks(changedDf['file_path'].tolist(), workers=workers),
+                                        on='file_path', how='left')
+            self._write("tracks", indexedDf[indexedDf['point_format'].notna()])
+
+            cachedDf = pd.concat([cachedDf, indexedDf], ignore_index=True)
+
+        return cachedDf.set_index('file_path').loc[pcd_files].reset_index()[TRACK_COLUMNS]
+
+    def trackInfo(self, pcd_file):
+        """
+        Looks up a track in the index without opening the LAS file (only its size and
+        modification time are checked), e.g. to triage it from its header values.
+
+        Returns:
+        - dict: Index values of the track (TRACK_COLUMNS), or None if it is not indexed or has changed.
+        """
+        _, mtime_ns, size = _statFile(pcd_file)
+
+        row = self.connection.execute(
+            f"SELECT {', '.join(TRACK_COLUMNS)} FROM tracks WHERE file_path = ? AND mtime_ns = ? AND size = ?",
+            (pcd_file, mtime_ns, size)).fetchone()
+
+        return None if row is None else dict(zip(TRACK_COLUMNS, row))
@@ -0,0 +1,59 @@
+import os
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Classes
+# -----------------------------------------------------------------------------------------------------------
+
+class pipelineContext:
+    """
+    Carries the in-memory point clouds of a single LAS track from one stage to the next
+    (clean -> segment -> export), so later stages never have to re-read or re-write the LAS file.
+    """
+
+    def __init__(self, pcd_file):
+        # Input PCD (las) file the clouds were loaded from
+        self.pcd_file = pcd_file
+        self.pcd_name = os.path.basename(pcd_file)
+        self.pcd_basename = "".join(self.pcd_name.split(".")[:-1])
+
+        # Clouds handed between stages
+        self.originalPointCloud = None
+        self.cleanedPointCloud = None
+
+        # Status of the track: None (not cleaned), "clean", or "bad"
+        self.status = None
+
+        # Per-stage information (timings, point counts, output files, ...)
+        self.metadata = {}
+
+    @classmethod
+    def fromClouds(cls, pcd_file, originalPointCloud, cleanedPointCloud=None):
+        """
+        Wraps clouds that were loaded elsewhere; if no cleaned cloud is provided the original is used.
+        """
+        context = cls(pcd_file)
+        context.originalPointCloud = originalPointCloud
+        context.cleanedPointCloud = cleanedPointCloud if cleanedPointCloud is not None else originalPointCloud
+        context.status = "clean"
+
+        return context
+
+    def record(self, stage, **info):
+        """
+        Stores information about a stage, e.g. context.record("clean", minutes=1.2, output_file="...").
+        """
+        self.metadata.setdefault(stage, {}).update(info)
+
+    def isClean(self):
+        """
+        True if the track passed cleaning and both clouds are available in memory.
+        """
+        return self.status == "clean" and None not in [self.originalPointCloud, self.cleanedPointCloud]
+
+    def release(self):
+        """
+        Drops the references to the clouds so their memory can be freed; metadata is kept.
+        """
+        self.originalPointCloud = None
+        self.cleanedPointCloud = None
@@ -4,59 +4,117 @@ import argparse
 import os
 import psutil
 import pathlib
+import functools
 
 import numpy as np
 
 import cloudComPy as cc
 import cloudComPy.CSF
 
-from common import announce
+from common import announce, peakMemoryMB
+from pipelineContext import pipelineContext
+from lasLoader import addScalarField, setScalarField, addPointIndex, pointIndex, deleteScalarFields, entityBytes
+from lasLoader import POINT_INDEX_SF
+from voxelComponents import voxelComponents, COMPONENTS_ENGINES
+from cloudLayers import cloudLayers
+from demRaster import rasterize, DEM_ENGINES, DEM_FILL_OPTIONS
+from asyncWriter import backgroundWriter, waitForWrite, WRITE_BUDGET_MB
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Constants
+# -----------------------------------------------------------------------------------------------------------
+
+# Deepest octree level considered when selecting a level from a cell size
+MAX_OCTREE_LEVEL = 11
+
+# CloudCompare builds an octree on the cubical bounding box of the cloud enlarged by 1% (DgmOctree::build)
+OCTREE_BOX_ENLARGEMENT = 0.01
+
+# Ways the height of the seafloor points above the DEM is computed: bilinear lookup in the DEM raster, or
+# cloud-to-mesh distances to the DEM mesh
+HEIGHT_MODES = ["raster", "c2m"]
+
+# Scalar field holding the height above the DEM (named after the C2M output, whichever mode computes it)
+HEIGHT_SF = "C2M signed distances"
+
+# Layers export can write, in the order they are written
+EXPORT_LAYERS = ["original", "cleaned", "fish", "unsegmented", "ground", "aboveSeaFloor", "belowIntensity",
+                 "possibleCoral", "combined", "cropped", "allCoralAndNonCoral", "nonCoral", "bigCoral", "coral", "dem"]
+
+# Layers of the outputs of exportOption, unless export_layers is given
+LARGE_OUTPUT_LAYERS = EXPORT_LAYERS
+SMALL_OUTPUT_LAYERS = ["original", "fish", "ground", "coral", "dem"]
+
+# Triangles of the numpy DEM do not bridge empty cells: edges longer than this many grid steps are dropped
+DEM_MAX_EDGE_STEPS = 1.5
 
 
 # -----------------------------------------------------------------------------------------------------------
 # Functions
 # -----------------------------------------------------------------------------------------------------------
 
-# Define a function to determine octree level based on cell size
-def octreeLevel(octree, cellSize):
+def octreeSide(minCorner, maxCorner):
+    """
+    Side of the root cell of the octree CloudCompare builds on a bounding box.
     """
-    Determine the octree level based on cell size.
+    return max(maxCorner[axis] - minCorner[axis] for axis in range(3)) * (1 + OCTREE_BOX_ENLARGEMENT)
+
+
+def octreeLevel(side, cellSize):
+    """
+    Determine the octree level based on cell size: the deepest level whose cells are larger than
+    cellSize. The cell size at level n is side / 2**n, so the level is found in closed form
+    instead of asking the octree for the cell size of every level.
 
     Args:
-    - octree (Octree): Octree object to analyze.
+    - side (float): Side of the root cell of the octree (octreeSide).
     - cellSize (float): Maximum cell size threshold.
 
     Returns:
     - int: Selected octree level.
     """
-    for oct_elem in range(11, 0, -1):
-        if octree.getCellSize(oct_elem) > cellSize:
-            print(str(octree.getCellSize(oct_elem)) + " : " + str(oct_elem))
-            print(str(octree.getCellSize(oct_elem + 1)) + " : " + str(oct_elem + 1))
-            print(str(octree.getCellSize(oct_elem - 1)) + " : " + str(oct_elem - 1))
-            return oct_elem
+    level = min(MAX_OCTREE_LEVEL, int(np.ceil(np.log2(side / cellSize))) - 1) if side > cellSize else 1
+
+    # Rounding of log2 at exact powers of two
+    while level < MAX_OCTREE_LEVEL and side / 2 ** (level + 1) > cellSize:
+        level += 1
+    while level > 1 and side / 2 ** level <= cellSize:
+        level -= 1
+
+    return max(level, 1)
 
 
 # Define a function to filter out large clouds based on point count
-def filterLargeClouds(listOfClouds, maxPoints):
+def filterLargeClouds(componentSizes, maxPoints):
     """
     Filter out large clouds based on a maximum point count threshold.
 
     Args:
-    - listOfClouds (list): List of clouds to filter.
+    - componentSizes (list): Number of points of each component, by decreasing size.
     - maxPoints (int): Maximum number of points threshold.
 
     Returns:
-    - int: Index of the filtered cloud.
+    - int: Index of the first component with fewer points than maxPoints (-1 if there are no components).
     """
-    if len(listOfClouds[1]) == 0:
+    if len(componentSizes) == 0:
         return -1
 
-    for index in range(40):
-        print(index)
+    smallEnough = np.flatnonzero(np.asarray(componentSizes) < maxPoints)
+
+    return int(smallEnough[0]) if len(smallEnough) else len(componentSizes)
 
-        if listOfClouds[1][index].size() < maxPoints:
-            return index
+
+def showScalarField(entity, name, colorScale=None):
+    """
+    Makes a scalar field of a cloud the current and displayed one, optionally with a color scale.
+    """
+    sfIndex = entity.getScalarFieldDic()[name]
+    entity.setCurrentScalarField(sfIndex)
+    entity.setCurrentDisplayedScalarField(sfIndex)
+
+    if colorScale is not None:
+        entity.getScalarField(sfIndex).setColorScale(colorScale)
 
 
 def emptyCellFill(fill):
@@ -75,17 +133,72 @@ def emptyCellFill(fill):
     elif fill == "INTERPOLATE_DELAUNAY":
         return cc.EmptyCellFillOption.INTERPOLATE_DELAUNAY
 
+    raise Exception(f"Error: {fill} is not an empty cell fill option of RasterizeToMesh")
+
 
 # -----------------------------------------------------------------------------------------------------------
 # Classes
 # -----------------------------------------------------------------------------------------------------------
 
+class octreeManager:
+    """
+    Builds the octree of each cloud once (kept on the cloud, where ExtractConnectedComponents finds
+    it) and selects octree levels from bounding boxes, without building an octree for it.
+    """
+
+    def __init__(self, verbose=False):
+        # Level used by each step, e.g. {"fish": 9, "coral": 10, "c2m": 8}
+        self.levels = {}
+        # Grid of each step at its level: (min corner of the octree box, cell size)
+        self.grids = {}
+        self.verbose = verbose
+
+    def octree(self, cloud):
+        """
+        Returns the octree of a cloud, building it only if the cloud does not have one yet.
+        """
+        octree = cloud.getOctree()
+        if octree is None:
+            octree = cloud.computeOctree(progressCb=None, autoAddChild=True)
+
+        return octree
+
+    def level(self, name, cellSize, *entities):
+        """
+        Octree level whose cells are just larger than cellSize, for an octree built on the
+        bounding box of the entities (clouds or meshes).
+
+        Args:
+        - name (str): Step the level is used by (kept in self.levels).
+        - cellSize (float): Maximum cell size threshold.
+        - entities (ccHObject): Clouds / meshes the octree covers.
+
+        Returns:
+        - int: Selected octree level.
+        """
+        corners = [(entity.getOwnBB().minCorner(), entity.getOwnBB().maxCorner()) for entity in entities]
+        minCorner = [min(corner[0][axis] for corner in corners) for axis in range(3)]
+        maxCorner = [max(corner[1][axis] for corner in corners) for axis in range(3)]
+
+        side = octreeSide(minCorner, maxCorner)
+        self.levels[name] = octreeLevel(side, cellSize)
+
+        # The octree box is a cube centered on the bounding box
+        origin = [(minCorner[axis] + maxCorner[axis] - side) / 2 for axis in range(3)]
+        self.grids[name] = (origin, side / 2 ** self.levels[name])
+
+        if self.verbose:
+            print(f"Octree level for {name}: {self.levels[name]} (cell size {side / 2 ** self.levels[name]:.4f} m)")
+
+        return self.levels[name]
+
+
 class segmentCloud:
     def __init__(self,
                  pcd_file,
                  output_dir,
                  dem_grid_step=.07,
-                 empty_cell_fill_option="KRIGING",
+                 empty_cell_fill_option="INTERPOLATE_DELAUNAY",
                  pcd_above_seafloor_thresh=0.08,
                  intensity_threshold=320,
                  coral_cell_size=0.02,
@@ -94,7 +207,14 @@ class segmentCloud:
                  fish_cell_size=0.06,
                  fish_min_comp_size=10,
                  exportOption="small_output",
-                 verbose=True):
+                 verbose=True,
+                 max_thread_count=None,
+                 components_engine="cloudcompare",
+                 dem_engine="numpy",
+                 height_mode="raster",
+                 export_layers=None,
+                 async_writes=False,
+                 write_budget_mb=WRITE_BUDGET_MB):
 
         # Input PCD (las) file, checks
         self.possible_coral_cloud = None
@@ -119,33 +239,41 @@ class segmentCloud:
         self.originalPointCloud = None
         self.cleanedPointCloud = None
 
+        # Clouds and metadata shared with the other stages of the pipeline
+        self.context = None
+
         self.extractionResult = None
 
         # TODO add short explanations for these
 
         self.groundPoints = None
-        self.unsegmentedPoints = None
-
-        self.belowIntensityThresholdCloud = None
 
         # TODO add short explanations for these
-        self.fishPoints = None
         self.totalfish = None
 
         # Represents the...
         self.seafloorDEM = None
+        # Grid of heights of the seafloor (numpy DEM engine)
+        self.demRaster = None
 
-        self.combinedCloud = None
         self.possibleCoralCloud = None
         self.yCoordSF = None
-        self.xCoordSF = None
+        # Bounding box (min corner, max corner) of the possible coral cloud
+        self.coralSectionBB = None
 
         self.croppedCloud = None
-        self.aboveSeaFloorCloud = None
 
-        self.nonCoralPoints = None
-        self.coralPoints = None
-        self.bigCoralPoints = None
+        # Component labels of the cleaned cloud (fish), potential coral tests of the ground points and component
+        # labels of the cropped cloud (coral). The other clouds of the stage (unsegmented / fish points, above the
+        # sea floor, below the intensity threshold, combined, coral / non coral / big coral points) are views of
+        # these layers, only copied out (and cached in viewClouds) when they are exported
+        self.fishLayers = None
+        self.groundLayers = None
+        self.coralLayers = None
+        self.viewClouds = {}
+
+        # First coral component small enough to be a coral (filterLargeClouds), -1 if there are no coral components
+        self.lowerBound = -1
 
         # TODO add short explanations for these
         # Used in separating fish
@@ -182,23 +310,58 @@ class segmentCloud:
 
         self.exportOption = exportOption
 
+        # Layers written to the outputs of exportOption instead of their default ones (e.g. fish, coral, ground, dem)
+        if export_layers is not None:
+            assert set(export_layers) <= set(EXPORT_LAYERS), f"Error: export_layers must be in {EXPORT_LAYERS}"
+        self.export_layers = export_layers
+
+        # Write the outputs in the background, while the next track is processed (waited for by runBatch)
+        self.async_writes = async_writes
+        self.write_budget_mb = write_budget_mb
+
         self.intensity_threshold = intensity_threshold
 
         self.verbose = verbose
 
+        # Threads used by the C2M distance computation; lowered when several tracks run in parallel
+        self.max_thread_count = max_thread_count if max_thread_count else psutil.cpu_count()
+
+        # Octrees and octree levels of the fish / coral segmentation and the C2M distances
+        self.octrees = octreeManager(verbose=verbose)
+
+        # Connected components with cc.ExtractConnectedComponents (component clouds traced back to the points)
+        # or with voxelComponents; both give one label per point
+        assert components_engine in COMPONENTS_ENGINES, f"Error: components_engine must be one of {COMPONENTS_ENGINES}"
+        self.components_engine = components_engine
+
+        # DEM from the numpy raster engine (demRaster) or cc.RasterizeToMesh; KRIGING and FILL_CUSTOM_HEIGHT
+        # always use RasterizeToMesh
+        assert dem_engine in DEM_ENGINES, f"Error: dem_engine must be one of {DEM_ENGINES}"
+        self.dem_engine = dem_engine
+
+        # Height above the DEM by raster lookup (needs the numpy DEM) or by C2M distances to the DEM mesh
+        assert height_mode in HEIGHT_MODES, f"Error: height_mode must be one of {HEIGHT_MODES}"
+        self.height_mode = height_mode
+
     def load_pcd(self, pcd=None):
         """
-        Loads the provided PCD (LAS) file provided; user can provide an opened
-        CC PCD if it's already stored in memory.
+        Loads the provided PCD (LAS) file provided; user can provide the pipelineContext
+        (or the cleanCloud that holds it) if the cleaned cloud is already stored in memory,
+        in which case the LAS file is not read again.
         """
         if pcd is None:
             # Load the original point cloud from file
-            self.originalPointCloud = cc.loadPointCloud(self.pcd_file)
-            self.originalPointCloud.setName("Original Point Cloud")
-            self.cleanedPointCloud = self.originalPointCloud
+            originalPointCloud = cc.loadPointCloud(self.pcd_file)
+            originalPointCloud.setName("Original Point Cloud")
+            self.context = pipelineContext.fromClouds(self.pcd_file, originalPointCloud)
+        elif isinstance(pcd, pipelineContext):
+            self.context = pcd
         else:
-            self.originalPointCloud = pcd.originalPointCloud
-            self.cleanedPointCloud = pcd.cleanedPointCloud
+            # e.g. a cleanCloud instance
+            self.context = pcd.context
+
+        self.originalPointCloud = self.context.originalPointCloud
+        self.cleanedPointCloud = self.context.cleanedPointCloud
 
         if None in [self.originalPointCloud, self.cleanedPointCloud]:
             raise Exception("Error: PCD file is empty")
@@ -216,85 +379,128 @@ class segmentCloud:
 
         https://www.simulation.openfields.fr/documentation/CloudComPy/html/cloudComPy.html#cloudComPy.ExtractConnectedComponents
 
+        The components are kept as a label layer of the cleaned cloud (0 is the seafloor, 1+ are fish, negative the
+        components that are too small); only the seafloor is copied out here, the other views at export.
         """
         # Select octree level for fish segmentation
-        octree = self.cleanedPointCloud.computeOctree(progressCb=None, autoAddChild=True)
-        selectedOctreeLevel = octreeLevel(octree, self.fish_cell_size)
+        selectedOctreeLevel = self.octrees.level("fish", self.fish_cell_size, self.cleanedPointCloud)
 
         if self.verbose:
-            print(selectedOctreeLevel)
             print(self.cleanedPointCloud)
 
-        # Extract connected components (fish points)
+        fishLabels, fishSizes, fishResiduals = self.componentLabels("fish", self.cleanedPointCloud,
+                                                                    self.fish_min_comp_size)
 
-        self.extractionResult = cc.ExtractConnectedComponents(clouds=[self.cleanedPointCloud],
-                                                              minComponentSize=self.fish_min_comp_size,
-                                                              octreeLevel=selectedOctreeLevel,
-                                                              randomColors=True)
-        # Subset extraction results
-        smallComponents = [self.extractionResult[1][0]]
-        allComponents = self.extractionResult[2] + smallComponents
+        # Extract the total amount of fish
+        self.totalfish = max(len(fishSizes) - 1, 0)
 
-        # TODO explain what these are
-        # Merge entities to form ground points V1 (these are...)
+        self.fishLayers = cloudLayers(self.cleanedPointCloud)
+        self.fishLayers.addLayer("fish", fishLabels)
 
-        # Merge entities to form the points that make up the seafloor
-        self.groundPoints = cc.MergeEntities(smallComponents, createSFcloudIndex=True)
-        self.groundPoints.setName("Ground Points")
+        # Points that make up the seafloor
+        self.fishLayers.addView("ground", "fish", 0, 0, "Ground Points", component_index=True)
 
-        # Merge entities to form the points that are not a part of the seafloor and are not fish
-        self.unsegmentedPoints = cc.MergeEntities(self.extractionResult[2], createSFcloudIndex=True)
-        self.unsegmentedPoints.setName("Not Fish or Part of Seafloor")
+        # Points that are not a part of the seafloor and are not fish
+        self.fishLayers.addView("unsegmented", "fish", -fishResiduals, -1, "Not Fish or Part of Seafloor",
+                                component_index=True)
 
-        # Merge entities to form the points that make up the fish
-        self.fishPoints = cc.MergeEntities(self.extractionResult[1][1:], createSFcloudIndex=True)
+        # Points that make up the fish
+        self.fishLayers.addView("fish", "fish", 1, len(fishSizes) - 1,
+                                f"Fish Points: "
+                                f"V1 | {self.totalfish} total fish | "
+                                f"Utilized Octree Level for fish segmentation: {selectedOctreeLevel}",
+                                component_index=True)
 
-        # Extract the total amount of fish
-        self.totalfish = len(self.extractionResult[1][1:])
+        # The DEM and the C2M distances need the seafloor as a cloud
+        self.groundPoints = self.layerView("ground")
 
         # If the total number of fish is 0, then set the V1 to the original point cloud If there are no fish the code
         # will error out later so if there are no fish we se the fish points to the original point cloud
         if self.totalfish < 1:
-            self.fishPoints = self.originalPointCloud
-
-        # Set the name
-        self.fishPoints.setName(f"Fish Points: "
-                                f"V1 | {self.totalfish} total fish | "
-                                f"Utilized Octree Level for fish segmentation: {selectedOctreeLevel}")
+            self.originalPointCloud.setName(self.fishLayers.views["fish"]["cloud_name"])
 
         #Print out the total number of fish
         if self.verbose:
             print(f"Total Fish Found: {self.totalfish}")
 
-        self.extractionResult = None
-        allComponents = None
-        smallComponents = None
-
     def createDEM(self):
         """
-        Creates a DEM using the seafloor points
+        Creates a DEM using the seafloor points. The numpy engine bins the points on a grid (minimum
+        height per cell), fills the empty cells and triangulates the filled cells into the mesh the
+        C2M distances are computed to; the cloudcompare engine (and KRIGING) uses RasterizeToMesh.
         """
-        # Create Digital Elevation Model (DEM) of seafloor
+        t0 = time.time()
 
-        self.seafloorDEM = cc.RasterizeToMesh(self.groundPoints,
-                                              gridStep=self.dem_grid_step,
-                                              emptyCellFillStrategy=emptyCellFill(self.empty_cell_fill_option),
-                                              projectionType=cc.ProjectionType.PROJ_MINIMUM_VALUE)
+        # Create Digital Elevation Model (DEM) of seafloor
+        if self.dem_engine == "numpy" and self.empty_cell_fill_option in DEM_FILL_OPTIONS:
+            self.demRaster = rasterize(self.groundPoints.toNpArrayCopy(),
+                                       self.dem_grid_step,
+                                       fill=self.empty_cell_fill_option,
+                                       projection="min",
+                                       workers=self.max_thread_count)
+            self.seafloorDEM = self.demMesh(self.demRaster)
+            dem_engine = "numpy"
+        else:
+            self.seafloorDEM = cc.RasterizeToMesh(self.groundPoints,
+                                                  gridStep=self.dem_grid_step,
+                                                  emptyCellFillStrategy=emptyCellFill(self.empty_cell_fill_option),
+                                                  projectionType=cc.ProjectionType.PROJ_MINIMUM_VALUE)
+            dem_engine = "cloudcompare"
 
         # Make the scalar fields visible so that it displays correctly when opened in cloud compare
         cc.ccMesh.showSF(self.seafloorDEM, True)
 
+        self.context.record("segment",
+                            dem_engine=dem_engine,
+                            dem_fill=self.empty_cell_fill_option,
+                            dem_seconds=np.around(time.time() - t0, 2))
+
+    def demMesh(self, raster):
+        """
+        Mesh of a demRaster: the centers of the filled cells (in the coordinates of the seafloor points,
+        with their global shift) triangulated in 2.5D, without bridging empty cells.
+
+        Args:
+        - raster (demRaster): The DEM.
+
+        Returns:
+        - ccMesh: The mesh, with the height of the vertices as scalar field.
+        """
+        cellCenters = raster.cellCenters()
+
+        demVertices = cc.ccPointCloud("Seafloor DEM vertices")
+        demVertices.coordsFromNPArray_copy(cellCenters.astype(np.float32))
+        demVertices.setGlobalShift(*self.groundPoints.getGlobalShift())
+        addScalarField(demVertices, "Height", cellCenters[:, 2])
+        cellCenters = None
+
+        seafloorDEM = cc.ccMesh.triangulate(demVertices,
+                                            cc.TRIANGULATION_TYPES.DELAUNAY_2D_AXIS_ALIGNED,
+                                            maxEdgeLength=DEM_MAX_EDGE_STEPS * raster.grid_step)
+        seafloorDEM.setName("Seafloor DEM")
+
+        return seafloorDEM
+
     def computeC2M(self):
         """
-        This function computes the distance in Meters from the DEM seafloor point cloud
+        This function computes the distance in Meters from the DEM seafloor point cloud. In the raster
+        height mode (with a numpy DEM) it is the height above the DEM at each point's XY
+        (rasterHeights); otherwise the C2M distances to the DEM mesh.
         """
-        # Calculate the "best" octree level
-        bestOctreeLevel = cc.DistanceComputationTools.determineBestOctreeLevel(self.groundPoints,
-                                                                               self.seafloorDEM)
+        t0 = time.time()
+
+        if self.height_mode == "raster" and self.demRaster is not None:
+            self.rasterHeights()
+            self.context.record("segment", height_mode="raster", height_seconds=np.around(time.time() - t0, 2))
+            return
+
+        # The distances do not depend on the octree level (only the speed does): cells about the size of
+        # the DEM triangles, on the box of the cloud and the mesh, instead of determineBestOctreeLevel
+        bestOctreeLevel = self.octrees.level("c2m", self.dem_grid_step, self.groundPoints, self.seafloorDEM)
 
         # Set the computation parameters before performing distance calculation
         computationParams = cc.Cloud2MeshDistancesComputationParams()
-        computationParams.maxThreadCount = psutil.cpu_count()
+        computationParams.maxThreadCount = self.max_thread_count
         computationParams.octreeLevel = bestOctreeLevel
         computationParams.signedDistances = True
 
@@ -303,51 +509,77 @@ class segmentCloud:
                                                                mesh=self.seafloorDEM,
                                                                params=computationParams)
 
-    def potentialCoralCloud(self):
-        """
-        This function creates two separate point clouds: one with all the points that are over specified height off
-        of the sea floor the other with all the points that are below a specified intensity value. These two point
-        clouds are combined and called the potential coral cloud. This is because when looking at the testing data it
-        looked like most of the points that were corals fell into one of these two categories.
+        self.context.record("segment", height_mode="c2m", height_seconds=np.around(time.time() - t0, 2))
 
+    def rasterHeights(self):
         """
+        Height of the seafloor points above the DEM: the point's Z minus the DEM bilinearly
+        interpolated at its XY, stored in the scalar field the C2M distances would be (HEIGHT_SF).
+        Points without a filled cell around them (LEAVE_EMPTY, or outside the triangulation of
+        INTERPOLATE_DELAUNAY) take the height of the nearest filled cell instead.
+        """
+        groundXYZ = self.groundPoints.toNpArrayCopy()
+        demHeights = self.demRaster.bilinearHeightAt(groundXYZ[:, :2])
 
-        # Create cloud with points greater than the selected amount above the sea floor default .08 meters
-        ground_points_base_dictionary = self.groundPoints.getScalarFieldDic()
-        c2mDistancesSF = self.groundPoints.getScalarField(ground_points_base_dictionary['C2M signed distances'])
-        self.groundPoints.setCurrentScalarField(ground_points_base_dictionary['C2M signed distances'])
+        missing = np.isnan(demHeights)
+        if np.any(missing):
+            demHeights[missing] = self.demRaster.nearestHeightAt(groundXYZ[missing, :2])
 
-        self.aboveSeaFloorCloud = cc.filterBySFValue(self.pcd_above_seafloor_thresh, c2mDistancesSF.getMax(),
-                                                     self.groundPoints)
-        self.aboveSeaFloorCloud.setName("greater than " + str(self.pcd_above_seafloor_thresh) + "m above sea floor")
+            if self.verbose:
+                print(f"{np.sum(missing)} ground points have no filled DEM cell around them, "
+                      f"they use the nearest filled cell")
 
-        above_sea_floor_dictionary = self.aboveSeaFloorCloud.getScalarFieldDic()
-        c2mDistancesSF2 = self.aboveSeaFloorCloud.getScalarField(above_sea_floor_dictionary['C2M signed distances'])
-        self.aboveSeaFloorCloud.setCurrentScalarField(above_sea_floor_dictionary['C2M signed distances'])
-        self.aboveSeaFloorCloud.setCurrentDisplayedScalarField(above_sea_floor_dictionary['C2M signed distances'])
+        heights = groundXYZ[:, 2] - demHeights
+        groundXYZ = None
+        demHeights = None
 
-        # Filter out the highest intensity values
-        intensitySF2 = self.groundPoints.getScalarField(ground_points_base_dictionary['Intensity'])
-        self.groundPoints.setCurrentScalarField(ground_points_base_dictionary['Intensity'])
+        setScalarField(self.groundPoints, HEIGHT_SF, heights)
 
-        self.belowIntensityThresholdCloud = cc.filterBySFValue(intensitySF2.getMin(), self.intensity_threshold,
-                                                               self.groundPoints)
-        self.belowIntensityThresholdCloud.setName("Below " + str(self.intensity_threshold) + " Intensity")
+        self.context.record("segment", height_fallback_points=int(np.sum(missing)))
 
-        below_intensity_threshold_dictionary = self.belowIntensityThresholdCloud.getScalarFieldDic()
-        intensitySF3 = self.belowIntensityThresholdCloud.getScalarField(
-            below_intensity_threshold_dictionary['Intensity'])
-        self.belowIntensityThresholdCloud.setCurrentScalarField(below_intensity_threshold_dictionary['Intensity'])
-        self.belowIntensityThresholdCloud.setCurrentDisplayedScalarField(
-            below_intensity_threshold_dictionary['Intensity'])
+    def potentialCoralCloud(self):
+        """
+        This function finds two sets of points: the points that are over specified height off of the sea floor and
+        the points that are below a specified intensity value. Together (without duplicates) they are called the
+        potential coral cloud. This is because when looking at the testing data it looked like most of the points
+        that were corals fell into one of these two categories.
 
-        # Combine clouds
-        self.possibleCoralCloud = cc.MergeEntities([self.aboveSeaFloorCloud, self.belowIntensityThresholdCloud],
-                                                   createSFcloudIndex=True)
-        self.possibleCoralCloud.setName("possible corals and other things above the sea floor")
+        Both tests run in one pass over the ground points and are kept as a layer of the ground points; only the
+        potential coral cloud is copied out (for the crop), the other clouds are views made at export.
+        """
+        ground_points_base_dictionary = self.groundPoints.getScalarFieldDic()
+        heights = self.groundPoints.getScalarField(ground_points_base_dictionary['C2M signed distances']).toNpArrayCopy()
+        intensity = self.groundPoints.getScalarField(ground_points_base_dictionary['Intensity']).toNpArrayCopy()
+
+        # Points greater than the selected amount above the sea floor (default .08 meters) and points below the
+        # intensity threshold, with the bounds filterBySFValue included
+        aboveSeaFloor = heights >= self.pcd_above_seafloor_thresh
+        belowIntensity = intensity <= self.intensity_threshold
+        heights = None
+        intensity = None
+
+        # 0: neither, 1: below the intensity threshold only, 2: both, 3: above the sea floor only; so that each
+        # set is a range of values
+        potentialCoral = np.zeros(len(aboveSeaFloor), dtype=np.int8)
+        potentialCoral[belowIntensity] = 1
+        potentialCoral[aboveSeaFloor] = 3
+        potentialCoral[aboveSeaFloor & belowIntensity] = 2
+
+        self.groundLayers = cloudLayers(self.groundPoints)
+        self.groundLayers.addLayer("potentialCoral", potentialCoral)
+        self.groundLayers.addView("aboveSeaFloor", "potentialCoral", 2, 3,
+                                  "greater than " + str(self.pcd_above_seafloor_thresh) + "m above sea floor")
+        self.groundLayers.addView("belowIntensity", "potentialCoral", 1, 2,
+                                  "Below " + str(self.intensity_threshold) + " Intensity")
+        self.groundLayers.addView("possibleCoral", "potentialCoral", 1, 3,
+                                  "possible corals and other things above the sea floor")
+        self.groundLayers.addView("combined", "potentialCoral", 0, 3, "everything combined", component_index=True)
+
+        if self.verbose:
+            print(f"Potential coral points: {self.groundLayers.size('possibleCoral')} "
+                  f"({np.sum(aboveSeaFloor)} above the sea floor, {np.sum(belowIntensity)} below the intensity threshold)")
 
-        self.combinedCloud = cc.MergeEntities([self.possibleCoralCloud, self.groundPoints], createSFcloudIndex=True)
-        self.combinedCloud.setName("everything combined")
+        self.possibleCoralCloud = self.layerView("possibleCoral")
 
     def cleanPotentialCoralCloud(self):
         """
@@ -358,10 +590,16 @@ class segmentCloud:
         points on the outer edge could be filtered out if we had a scan angle for each point.
         """
 
+        # Cropping filters on Y, so only the Y coordinate is exported (and only for this cloud)
         potential_coral_dictionary = self.possibleCoralCloud.getScalarFieldDic()
+        if 'Coord. Y' not in potential_coral_dictionary:
+            self.possibleCoralCloud.exportCoordToSF(False, True, False)
+            potential_coral_dictionary = self.possibleCoralCloud.getScalarFieldDic()
+
+        boundingBox = self.possibleCoralCloud.getOwnBB()
+        self.coralSectionBB = (boundingBox.minCorner(), boundingBox.maxCorner())
 
         self.yCoordSF = self.possibleCoralCloud.getScalarField(potential_coral_dictionary['Coord. Y'])
-        self.xCoordSF = self.possibleCoralCloud.getScalarField(potential_coral_dictionary['Coord. X'])
         self.possibleCoralCloud.setCurrentScalarField(potential_coral_dictionary['Coord. Y'])
 
         factor = .14 * abs((self.yCoordSF.getMin()) - (self.yCoordSF.getMax()))
@@ -377,6 +615,10 @@ class segmentCloud:
                                                self.possibleCoralCloud)
         self.croppedCloud.setName("Cropped")
 
+        # The coral stage only needs the crop; the potential coral cloud is copied out again if it is exported
+        self.viewClouds.pop("possibleCoral", None)
+        self.possibleCoralCloud = None
+
         cropped_cloud_dictionary = self.croppedCloud.getScalarFieldDic()
         if self.verbose:
             print(cropped_cloud_dictionary)
@@ -385,186 +627,260 @@ class segmentCloud:
 
     def segCoral(self):
         # Select octree level for coral segmentation
-        cropped_cloud_octree = self.croppedCloud.computeOctree(progressCb=None, autoAddChild=True)
-        coralOctreeLevel = octreeLevel(cropped_cloud_octree, self.coral_cell_size)
+        coralOctreeLevel = self.octrees.level("coral", self.coral_cell_size, self.croppedCloud)
 
-        # Extract coral points
-        coralExtractionResult = cc.ExtractConnectedComponents(clouds=[self.croppedCloud],
-                                                              minComponentSize=self.coral_min_comp_size,
-                                                              octreeLevel=coralOctreeLevel,
-                                                              randomColors=True,
-                                                              maxNumberComponents=100000)
+        # Extract coral points: one label per point, negative for the components that are too small
+        coralLabels, coralSizes, coralResiduals = self.componentLabels("coral", self.croppedCloud,
+                                                                       self.coral_min_comp_size,
+                                                                       maxNumberComponents=100000)
 
-        self.nonCoralPoints = cc.MergeEntities(coralExtractionResult[2], createSFcloudIndex=True)
-        self.nonCoralPoints.setName("Not Coral Points")
+        # The residual components come first in the merged view, as in MergeEntities(residual + components)
+        self.coralLayers = cloudLayers(self.croppedCloud)
+        self.coralLayers.addLayer("coral", coralLabels)
+        self.coralLayers.addView("nonCoral", "coral", -coralResiduals, -1, "Not Coral Points", component_index=True)
+        self.coralLayers.addView("allCoralAndNonCoral", "coral", -coralResiduals, len(coralSizes) - 1,
+                                 "All Coral + Non Coral points", component_index=True)
 
-        print("Section is " + str(self.yCoordSF.getMin()) + "m by " + str(self.yCoordSF.getMax()) + "m or " + str(
-            self.yCoordSF.getMax() - self.yCoordSF.getMin()) + "m wide")
+        minCorner, maxCorner = self.coralSectionBB
 
-        print("Section is " + str(self.xCoordSF.getMin()) + "m by " + str(self.xCoordSF.getMax()) + "m or " + str(
-            self.xCoordSF.getMax() - self.xCoordSF.getMin()) + "m long")
+        print("Section is " + str(minCorner[1]) + "m by " + str(maxCorner[1]) + "m or " + str(
+            maxCorner[1] - minCorner[1]) + "m wide")
 
-        print("Area of section is " + str(
-            (self.xCoordSF.getMax() - self.xCoordSF.getMin()) * (
-                    self.yCoordSF.getMax() - self.yCoordSF.getMin())) + "m^2")
+        print("Section is " + str(minCorner[0]) + "m by " + str(maxCorner[0]) + "m or " + str(
+            maxCorner[0] - minCorner[0]) + "m long")
 
-        self.combinedCoralPoints = coralExtractionResult[2] + coralExtractionResult[1]
-        self.allCoralAndNonCoralPoints = cc.MergeEntities(self.combinedCoralPoints, createSFcloudIndex=True)
-        self.allCoralAndNonCoralPoints.setName("All Coral + Non Coral points")
+        print("Area of section is " + str(
+            (maxCorner[0] - minCorner[0]) * (maxCorner[1] - minCorner[1])) + "m^2")
 
-        self.lowerBound = filterLargeClouds(coralExtractionResult, self.max_coral_pts)
+        self.lowerBound = filterLargeClouds(coralSizes, self.max_coral_pts)
 
         if self.lowerBound == -1:
             return
 
-        self.coralPoints = cc.MergeEntities(coralExtractionResult[1][self.lowerBound:], createSFcloudIndex=True)
-        self.coralPoints.setName("Coral Points : V1 | " + str(
-            len(coralExtractionResult[1][
-                self.lowerBound:])) + " total coral | Utilized Octree Level for coral segmentation: " + str(
-            coralOctreeLevel))
+        coral_count = len(coralSizes[self.lowerBound:])
+        big_coral_count = len(coralSizes[:self.lowerBound])
 
-        self.bigCoralPoints = cc.MergeEntities(coralExtractionResult[1][:self.lowerBound], createSFcloudIndex=True)
+        self.coralLayers.addView("coral", "coral", self.lowerBound, len(coralSizes) - 1,
+                                 "Coral Points : V1 | " + str(
+                                     coral_count) + " total coral | Utilized Octree Level for coral segmentation: " + str(
+                                     coralOctreeLevel),
+                                 component_index=True)
 
-        if len(coralExtractionResult[1][:self.lowerBound]) > 1:
-            self.bigCoralPoints.setName("Big Coral Points : V1 | " + str(
-                len(coralExtractionResult[1][
-                    :self.lowerBound])) + " total coral | Utilized Octree Level for coral segmentation: " + str(
-                coralOctreeLevel))
+        self.coralLayers.addView("bigCoral", "coral", 0, self.lowerBound - 1,
+                                 "Big Coral Points : V1 | " + str(
+                                     big_coral_count) + " total coral | Utilized Octree Level for coral segmentation: " + str(
+                                     coralOctreeLevel),
+                                 component_index=True)
 
         if self.verbose:
-            print(str(len(coralExtractionResult[1])) + " total coral")
+            print(str(len(coralSizes)) + " total coral")
 
-        coralExtractionResult = None
-        combinedCoralPoints = None
+    def componentLabels(self, name, cloud, min_comp_size, **kwargs):
+        """
+        Connected components of a cloud as one label per point, on the octree level selected for the
+        step. The numpy engine labels the points directly (voxelComponents); with CloudCompare the
+        component clouds of ExtractConnectedComponents are traced back to the points of the cloud
+        (addPointIndex) and released.
+
+        Args:
+        - name (str): Step the octree level was selected for ("fish" or "coral").
+        - cloud (ccPointCloud): Cloud to segment.
+        - min_comp_size (int): Smallest component that gets a label.
+        - kwargs: Other arguments of cc.ExtractConnectedComponents.
+
+        Returns:
+        - np.ndarray: Label of every point, in the order of ExtractConnectedComponents. The points of
+          the R components that are too small (residual) get r - R for the r-th of them, so they
+          stay apart in the Original cloud index of the residual views (-R - 1 for a point in neither).
+        - np.ndarray: Number of points of each component (sizes[label]).
+        - int: Number of residual components (R).
+        """
+        if self.components_engine == "numpy":
+            origin, cell_size = self.octrees.grids[name]
+            labels, sizes = voxelComponents(cloud.toNpArrayCopy(), cell_size, origin=origin, min_comp_size=1)
+
+            # Components are numbered by decreasing size, the residual ones come last
+            component_count = int(np.sum(sizes >= min_comp_size))
+            residual_count = len(sizes) - component_count
+            labels[labels >= component_count] -= len(sizes)
+            sizes = sizes[:component_count]
+        else:
+            self.octrees.octree(cloud)
+            addPointIndex(cloud)
 
-    def export(self):
-        # Export clouds and meshes
+            self.extractionResult = cc.ExtractConnectedComponents(clouds=[cloud],
+                                                                  minComponentSize=min_comp_size,
+                                                                  octreeLevel=self.octrees.levels[name],
+                                                                  randomColors=False,
+                                                                  **kwargs)
+
+            residual_count = len(self.extractionResult[2])
+
+            labels = np.full(cloud.size(), -residual_count - 1, dtype=np.int32)
+            for label, component in enumerate(self.extractionResult[1]):
+                labels[pointIndex(component)] = label
+            for residual, component in enumerate(self.extractionResult[2]):
+                labels[pointIndex(component)] = residual - residual_count
+            sizes = np.array([component.size() for component in self.extractionResult[1]], dtype=np.int64)
+
+            deleteScalarFields(cloud, POINT_INDEX_SF)
+            self.extractionResult = None
+
+        if self.verbose:
+            print(f"{len(sizes)} components of at least {min_comp_size} points ({name})")
+
+        return labels, sizes, residual_count
+
+    def layerView(self, name):
+        """
+        Cloud of a view of the fish or coral layers, copied out of the stage cloud on first use.
+
+        Args:
+        - name (str): View name (ground, unsegmented, fish, nonCoral, allCoralAndNonCoral, coral, bigCoral).
 
-        self.outputDirectory = self.output_dir
+        Returns:
+        - ccPointCloud: The view.
+        """
+        if name not in self.viewClouds:
+            if name == "fish" and self.totalfish < 1:
+                # No fish: the original point cloud stands in for the fish points
+                self.viewClouds[name] = self.originalPointCloud
+            else:
+                layers = [layers for layers in [self.fishLayers, self.groundLayers, self.coralLayers]
+                          if layers is not None and name in layers.views]
+                if len(layers) == 0:
+                    raise Exception(f"Error: No {name} view, segment the cloud first")
+
+                self.viewClouds[name] = layers[0].view(name)
 
-        self.cleanedPointCloud.setCurrentScalarField(0)
-        self.fishPoints.setCurrentScalarField(0)
-        self.unsegmentedPoints.setCurrentScalarField(0)
-        self.groundPoints.setCurrentScalarField(0)
+        return self.viewClouds[name]
+
+    def layerEntity(self, name):
+        """
+        Entity of an export layer; views are materialized here (layerView).
 
-        scalarFieldDictionary = self.groundPoints.getScalarFieldDic()
-        print(scalarFieldDictionary)
+        Returns:
+        - ccHObject: The cloud / mesh, None if the layer is not exported for this track.
+        """
+        entities = {"original": self.originalPointCloud,
+                    "cleaned": self.cleanedPointCloud,
+                    "ground": self.groundPoints,
+                    "cropped": self.croppedCloud,
+                    "dem": self.seafloorDEM}
+        if name in entities:
+            return entities[name]
+
+        # No coral components (segCoral stopped early); big corals are only written when there is more than one
+        if name == "coral" and self.lowerBound == -1:
+            return None
+        if name == "bigCoral" and self.lowerBound <= 1:
+            return None
+
+        return self.layerView(name)
+
+    def styleLayer(self, name, entity, output, defaultScale, highContrastScale):
+        """
+        Sets the scalar field shown by an exported layer, and its color scale, as the large or the small
+        output shows it.
+        """
+        if name in ["original", "dem"]:
+            return
 
+        if name not in ["aboveSeaFloor", "coral", "bigCoral"]:
+            entity.getScalarField(0).setColorScale(defaultScale)
+
+        if name in ["coral", "bigCoral"] or (output == "small" and name == "fish" and self.totalfish > 0):
+            showScalarField(entity, 'Original cloud index', highContrastScale)
+        elif output == "small" and name == "ground":
+            showScalarField(entity, 'C2M signed distances', highContrastScale)
+        elif name == "aboveSeaFloor":
+            showScalarField(entity, 'C2M signed distances')
+        elif name in ["belowIntensity", "cropped"]:
+            showScalarField(entity, 'Intensity')
+        elif output == "large":
+            entity.setCurrentScalarField(0)
+            entity.setCurrentDisplayedScalarField(0)
+
+    def saveLayers(self, layers, outputFile, output, keep=()):
+        """
+        Writes the requested layers (in the order of EXPORT_LAYERS) to one BIN file. Only these layers are
+        materialized and styled; the views are released once written, except the ones in keep.
+
+        Args:
+        - layers (list): Export layers to write (EXPORT_LAYERS).
+        - outputFile (str): Path to the BIN file.
+        - output (str): "large" or "small", how the layers are shown.
+        - keep (list): Layers written again by a later output.
+        """
         colorScalesManager = cc.ccColorScalesManager.GetUniqueInstance()
         defaultScale = colorScalesManager.getDefaultScale(cc.DEFAULT_SCALES.HSV_360_DEG)
         highContrastScale = colorScalesManager.getDefaultScale(cc.DEFAULT_SCALES.HIGH_CONTRAST)
 
-        self.cleanedPointCloud.getScalarField(0).setColorScale(defaultScale)
-        self.fishPoints.getScalarField(0).setColorScale(defaultScale)
-        self.unsegmentedPoints.getScalarField(0).setColorScale(defaultScale)
-        self.groundPoints.getScalarField(0).setColorScale(defaultScale)
-        self.belowIntensityThresholdCloud.getScalarField(0).setColorScale(defaultScale)
-        self.possibleCoralCloud.getScalarField(0).setColorScale(defaultScale)
-        self.combinedCloud.getScalarField(0).setColorScale(defaultScale)
-        self.croppedCloud.getScalarField(0).setColorScale(defaultScale)
-        if self.exportOption == "all" or self.exportOption == "large_output":
-            if self.lowerBound > 1:
-                self.bigCoralPoints.getScalarField(
-                    self.bigCoralPoints.getScalarFieldDic()['Original cloud index']).setColorScale(highContrastScale)
-            self.coralPoints.getScalarField(self.coralPoints.getScalarFieldDic()['Original cloud index']).setColorScale(
-                highContrastScale)
-            self.allCoralAndNonCoralPoints.getScalarField(0).setColorScale(defaultScale)
-            self.nonCoralPoints.getScalarField(0).setColorScale(defaultScale)
-
-            self.cleanedPointCloud.setCurrentDisplayedScalarField(0)
-            self.fishPoints.setCurrentDisplayedScalarField(0)
-            self.unsegmentedPoints.setCurrentDisplayedScalarField(0)
-            self.groundPoints.setCurrentDisplayedScalarField(0)
-            self.possibleCoralCloud.setCurrentDisplayedScalarField(0)
-            self.combinedCloud.setCurrentDisplayedScalarField(0)
-
-            if self.lowerBound > 1:
-                self.bigCoralPoints.setCurrentDisplayedScalarField(
-                    self.bigCoralPoints.getScalarFieldDic()['Original cloud index'])
-            self.coralPoints.setCurrentDisplayedScalarField(
-                self.coralPoints.getScalarFieldDic()['Original cloud index'])
-            self.allCoralAndNonCoralPoints.setCurrentDisplayedScalarField(0)
-            self.nonCoralPoints.setCurrentDisplayedScalarField(0)
-
-            lasOutputDirectory = os.path.join(self.outputDirectory, "lasFiles")
-            if not os.path.exists(lasOutputDirectory):
-                os.makedirs(lasOutputDirectory)
-
-            binOutputDirectory = os.path.join(self.outputDirectory, "binFiles")
-            if not os.path.exists(binOutputDirectory):
-                os.makedirs(binOutputDirectory)
+        entities_to_export = []
+        for name in [name for name in EXPORT_LAYERS if name in layers]:
+            entity = self.layerEntity(name)
+            if entity is None:
+                continue
 
+            self.styleLayer(name, entity, output, defaultScale, highContrastScale)
+            entities_to_export.append(entity)
+
+        if self.verbose:
+            for entity in entities_to_export:
+                print(entity.getName())
+
+        self.save(functools.partial(cc.SaveEntities, entities_to_export), outputFile,
+                  sum(entityBytes(entity) for entity in entities_to_export))
+        entities_to_export = None
+
+        for name in layers:
+            if name not in keep:
+                self.viewClouds.pop(name, None)
+
+    def save(self, save, output_file, size_bytes=0):
+        """
+        Writes an output with save(path); with async_writes it is written in the background
+        (asyncWriter), size_bytes being the memory its clouds hold until then.
+        """
+        if self.async_writes:
+            backgroundWriter(self.write_budget_mb).write(save, output_file, size_bytes=size_bytes, label=self.pcd_file)
+        else:
+            save(output_file)
+
+    def export(self):
+        """
+        Export clouds and meshes: the large output (every layer) and / or the small output (original cloud, fish,
+        ground, coral and DEM, plus the ground points as LAS), or only export_layers in each of them. Views are
+        only copied out of the stage clouds for the layers written.
+        """
+        large_layers = self.export_layers if self.export_layers else LARGE_OUTPUT_LAYERS
+        small_layers = self.export_layers if self.export_layers else SMALL_OUTPUT_LAYERS
+
+        if self.exportOption == "all" or self.exportOption == "large_output":
             outputFile = f"{self.binOutputDirectory}/LARGE_{self.pcd_basename}.bin"
 
-            if self.lowerBound > 1:
-
-                entities_to_export = [self.originalPointCloud,
-                                      self.cleanedPointCloud,
-                                      self.fishPoints,
-                                      self.unsegmentedPoints,
-                                      self.groundPoints,
-                                      self.aboveSeaFloorCloud,
-                                      self.belowIntensityThresholdCloud,
-                                      self.possibleCoralCloud,
-                                      self.combinedCloud,
-                                      self.croppedCloud,
-                                      self.allCoralAndNonCoralPoints,
-                                      self.nonCoralPoints,
-                                      self.bigCoralPoints,
-                                      self.coralPoints,
-                                      self.seafloorDEM]
-                for cloud in entities_to_export:
-                    print(cloud.getName())
-                    print(cloud.size())
-
-                large_export_result = cc.SaveEntities(entities_to_export, outputFile)
-            else:
-                print("hello6")
-                large_export_result = cc.SaveEntities(
-                    [self.originalPointCloud, self.cleanedPointCloud, self.fishPoints,
-                     self.unsegmentedPoints,
-                     self.groundPoints,
-                     self.aboveSeaFloorCloud, self.belowIntensityThresholdCloud, self.possibleCoralCloud,
-                     self.combinedCloud, self.croppedCloud,
-                     self.allCoralAndNonCoralPoints, self.nonCoralPoints, self.coralPoints, self.seafloorDEM],
-                    outputFile)
+            self.saveLayers(large_layers, outputFile, "large",
+                            keep=small_layers if self.exportOption == "all" else ())
 
-        if self.exportOption == "all" or self.exportOption == "small_output":
-            self.coralPoints.setCurrentDisplayedScalarField(
-                self.coralPoints.getScalarFieldDic()['Original cloud index'])
-            if self.totalfish > 0:
-                self.fishPoints.setCurrentDisplayedScalarField(
-                    self.fishPoints.getScalarFieldDic()['Original cloud index'])
-            self.groundPoints.setCurrentDisplayedScalarField(
-                self.groundPoints.getScalarFieldDic()['C2M signed distances'])
-
-            self.coralPoints.getScalarField(self.coralPoints.getScalarFieldDic()['Original cloud index']).setColorScale(
-                highContrastScale)
-            if self.totalfish > 0:
-                self.fishPoints.getScalarField(
-                    self.fishPoints.getScalarFieldDic()['Original cloud index']).setColorScale(
-                    highContrastScale)
-            self.groundPoints.getScalarField(
-                self.groundPoints.getScalarFieldDic()['C2M signed distances']).setColorScale(
-                highContrastScale)
-
-            lasOutputDirectory = os.path.join(self.outputDirectory, "lasFiles")
-            if not os.path.exists(lasOutputDirectory):
-                os.makedirs(lasOutputDirectory)
-
-            binOutputDirectory = os.path.join(self.outputDirectory, "binFiles")
-            if not os.path.exists(binOutputDirectory):
-                os.makedirs(binOutputDirectory)
+            self.context.record("segment", large_output_file=outputFile)
+
+            # The small output styles layers of the large one differently, so they must be written first
+            if self.exportOption == "all":
+                waitForWrite(outputFile)
 
+        if self.exportOption == "all" or self.exportOption == "small_output":
             smallOutputFile = f"{self.binOutputDirectory}/SMALL_{self.pcd_basename}.bin"
 
-            smalllasOutputFile = f"{self.lasOutputDirectory}/SMALL_{self.pcd_basename}.las"
+            self.saveLayers(small_layers, smallOutputFile, "small")
+
+            self.context.record("segment", small_output_file=smallOutputFile)
 
-            exportResult0 = cc.SaveEntities(
-                [self.originalPointCloud, self.fishPoints, self.groundPoints, self.coralPoints, self.seafloorDEM],
-                smallOutputFile)
-            exportlasResult0 = cc.SavePointCloud(self.groundPoints, smalllasOutputFile)
+            if "ground" in small_layers:
+                smalllasOutputFile = f"{self.lasOutputDirectory}/SMALL_{self.pcd_basename}.las"
+                self.save(functools.partial(cc.SavePointCloud, self.groundPoints), smalllasOutputFile,
+                          entityBytes(self.groundPoints))
 
+                self.context.record("segment", las_output_file=smalllasOutputFile)
 
     def segment(self):
         """
@@ -588,6 +904,12 @@ class segmentCloud:
         self.segCoral()
         self.export()
 
+        self.context.record("segment",
+                            total_fish=self.totalfish,
+                            octree_levels=dict(self.octrees.levels),
+                            minutes=np.around(((time.time() - t0) / 60), 2),
+                            peak_rss_mb=np.around(peakMemoryMB(), 1))
+
         print(f"Completed in {np.around(((time.time() - t0) / 60), 2)} minutes")
 
 
@@ -646,18 +968,30 @@ def main():
                         help='The Grid step used to create the DEM.')
 
     parser.add_argument('--empty_cell_fill_option', type=str, required=False,
-                        default="KRIGING",
-                        help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","INTERPOLATE_DELAUNAY","KRIGING"')
+                        default="INTERPOLATE_DELAUNAY",
+                        help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","FILL_NEAREST","INTERPOLATE_IDW","INTERPOLATE_DELAUNAY","KRIGING" (FILL_NEAREST and INTERPOLATE_IDW need the numpy DEM engine; KRIGING and FILL_CUSTOM_HEIGHT use CloudCompare, and are much slower)')
+
+    parser.add_argument('--dem_engine', type=str, default="numpy", choices=DEM_ENGINES,
+                        help='Create the DEM with the NumPy raster engine or with CloudCompare (RasterizeToMesh).')
+
+    parser.add_argument('--height_mode', type=str, default="raster", choices=HEIGHT_MODES,
+                        help='Height above the DEM by bilinear lookup in the DEM raster (numpy DEM engine) or by cloud-to-mesh distances.')
 
     # 'Other Optional Arguments'
 
     parser.add_argument('--exportOption', type=str, required=False,
                         default="small_output",
                         help='What should be outputed? Options are "small_output", "large_output", "all" ')
+    parser.add_argument('--export_layers', type=str, required=False,
+                        default=None,
+                        help=f'Comma separated layers to write instead of the default ones of the export option, e.g. "fish,coral,ground,dem". Layers: {",".join(EXPORT_LAYERS)}')
     parser.add_argument('--verbose', default=True,
                         help='Should Information be Printed to the Console.',
                         action='store_true')
 
+    parser.add_argument('--components_engine', type=str, default="cloudcompare", choices=COMPONENTS_ENGINES,
+                        help='Extract fish / coral components with CloudCompare or with the NumPy voxel engine (one label per point).')
+
     args = parser.parse_args()
 
     try:
@@ -675,7 +1009,11 @@ def main():
                                        coral_min_comp_size=args.coral_min_comp_size,
                                        max_coral_pts=args.max_coral_pts,
                                        exportOption=args.exportOption,
-                                       verbose=args.verbose)
+                                       export_layers=args.export_layers.split(",") if args.export_layers else None,
+                                       verbose=args.verbose,
+                                       components_engine=args.components_engine,
+                                       dem_engine=args.dem_engine,
+                                       height_mode=args.height_mode)
 
         # Load the cloud
         cloud_segmentor.load_pcd()
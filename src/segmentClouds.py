@@ -4,6 +4,83 @@ import argparse
 import traceback
 
 from segmentCloud import segmentCloud
+from cleanCloud import cleanCloud
+from batchProcess import runBatch, c2mThreadCount
+from asyncWriter import waitForWrite, WRITE_BUDGET_MB
+from common import announce
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Functions
+# -----------------------------------------------------------------------------------------------------------
+
+def segmentFile(pcd_file, params):
+    """
+    Segments a single (cleaned) LAS file; module-level so it can be sent to a worker process.
+
+    Args:
+    - pcd_file (str): Path to the LAS file.
+    - params (dict): Keyword arguments for segmentCloud (everything except pcd_file).
+    """
+    cloud_segmentor = segmentCloud(pcd_file=pcd_file, **params)
+
+    # Load the cloud
+    cloud_segmentor.load_pcd()
+
+    # Segment the cloud
+    cloud_segmentor.segment()
+
+
+def cleanSegmentFile(pcd_file, clean_params, segment_params):
+    """
+    Cleans and then segments a single raw LAS file; module-level so it can be sent to a worker process.
+
+    Args:
+    - pcd_file (str): Path to the LAS file.
+    - clean_params (dict): Keyword arguments for cleanCloud (everything except pcd_file).
+    - segment_params (dict): Keyword arguments for segmentCloud (everything except pcd_file).
+    """
+    cloud_cleaner = cleanCloud(pcd_file=pcd_file, **clean_params)
+
+    # Load the cloud from file
+    cloud_cleaner.load_pcd()
+
+    # Clean the cloud
+    cloud_cleaner.clean()
+
+    context = cloud_cleaner.context
+
+    if context.status == "clean" and not context.isClean():
+        # Tiled cleaning (or the numpy backend without CloudComPy) only leaves its result on disk
+        # (context.metadata["clean"]["handoff"]); the cleaned file may still be in the background writer
+        waitForWrite(cloud_cleaner.output_file)
+        segmentFile(cloud_cleaner.output_file, segment_params)
+        return
+
+    if context.status == "bad":
+        # Too sparse / small, cleanCloud already moved it to the trash folder
+        announce(f"Skipping {context.pcd_name}: considered bad while cleaning, "
+                 f"output as {os.path.basename(context.metadata['clean']['trash_file'])}")
+        return
+
+    if not context.isClean():
+        print(f"Error: {context.pcd_name} has no cleaned cloud to segment")
+        return
+
+    if cloud_cleaner.backend == "cloudcompare":
+        # Segmentation adds scalar fields to the cleaned cloud, which the background writer may still be saving
+        waitForWrite(cloud_cleaner.output_file)
+
+    cloud_segmentor = segmentCloud(pcd_file=pcd_file, **segment_params)
+
+    # Hand over the cleaned cloud that is already in memory, no second LAS parse
+    cloud_segmentor.load_pcd(pcd=context)
+
+    # Segment the cloud
+    cloud_segmentor.segment()
+
+    # Free the clouds before the next track is loaded
+    context.release()
 
 
 # -----------------------------------------------------------------------------------------------------------
@@ -15,7 +92,7 @@ class segmentClouds:
                  pcd_dir,
                  output_dir,
                  dem_grid_step=.07,
-                 empty_cell_fill_option = "KRIGING",
+                 empty_cell_fill_option = "INTERPOLATE_DELAUNAY",
                  pcd_above_seafloor_thresh=0.08,
                  intensity_threshold=320,
                  coral_cell_size=0.02,
@@ -24,7 +101,14 @@ class segmentClouds:
                  fish_cell_size=0.06,
                  fish_min_comp_size=10,
                  exportOption="small_output",
-                 verbose=True):
+                 verbose=True,
+                 workers=1,
+                 components_engine="cloudcompare",
+                 dem_engine="numpy",
+                 height_mode="raster",
+                 export_layers=None,
+                 async_writes=False,
+                 write_budget_mb=WRITE_BUDGET_MB):
 
         self.pcd_directory = pcd_dir
         self.output_dir = output_dir
@@ -65,30 +149,53 @@ class segmentClouds:
 
         self.verbose = verbose
 
+        # Number of worker processes, each LAS file is segmented in its own process
+        self.workers = workers
+
+        # Connected components with CloudCompare or the NumPy voxel engine, see segmentCloud
+        self.components_engine = components_engine
+
+        # DEM with the NumPy raster engine or RasterizeToMesh, see segmentCloud
+        self.dem_engine = dem_engine
+
+        # Height above the DEM by raster lookup or C2M distances, see segmentCloud
+        self.height_mode = height_mode
+
+        # Layers written instead of the default ones of exportOption, see segmentCloud
+        self.export_layers = export_layers
+
+        # Write the outputs in the background while the next file is segmented, see asyncWriter
+        self.async_writes = async_writes
+        self.write_budget_mb = write_budget_mb
+
+        # Per-file success / failure of the last cleanDir
+        self.results = []
+
     def cleanDir(self):
 
         pcd_files = glob.glob(f"{self.pcd_directory}/**/*.las", recursive=True)
 
-        for pcd_file in pcd_files:
-            cloud_segmentor = segmentCloud(pcd_file=pcd_file,
-                                           output_dir=self.output_dir,
-                                           dem_grid_step=self.dem_grid_step,
-                                           empty_cell_fill_option=self.empty_cell_fill_option,
-                                           pcd_above_seafloor_thresh=self.pcd_above_seafloor_thresh,
-                                           intensity_threshold=self.intensity_threshold,
-                                           coral_cell_size=self.coral_cell_size,
-                                           fish_cell_size=self.fish_cell_size,
-                                           fish_min_comp_size=self.fish_min_comp_size,
-                                           coral_min_comp_size=self.coral_min_comp_size,
-                                           max_coral_pts=self.max_coral_pts,
-                                           exportOption=self.exportOption,
-                                           verbose=self.verbose)
-
-            # Load the cloud
-            cloud_segmentor.load_pcd()
-
-            # Segment the cloud
-            cloud_segmentor.segment()
+        params = dict(output_dir=self.output_dir,
+                      dem_grid_step=self.dem_grid_step,
+                      empty_cell_fill_option=self.empty_cell_fill_option,
+                      pcd_above_seafloor_thresh=self.pcd_above_seafloor_thresh,
+                      intensity_threshold=self.intensity_threshold,
+                      coral_cell_size=self.coral_cell_size,
+                      fish_cell_size=self.fish_cell_size,
+                      fish_min_comp_size=self.fish_min_comp_size,
+                      coral_min_comp_size=self.coral_min_comp_size,
+                      max_coral_pts=self.max_coral_pts,
+                      exportOption=self.exportOption,
+                      export_layers=self.export_layers,
+                      verbose=self.verbose,
+                      max_thread_count=c2mThreadCount(self.workers),
+                      components_engine=self.components_engine,
+                      dem_engine=self.dem_engine,
+                      height_mode=self.height_mode,
+                      async_writes=self.async_writes,
+                      write_budget_mb=self.write_budget_mb)
+
+        self.results = runBatch(segmentFile, pcd_files, args=(params,), workers=self.workers)
 
         print("Done.")
 
@@ -102,8 +209,8 @@ def main():
     """
     parser = argparse.ArgumentParser(description='Segment point clouds.')
 
-    parser.add_argument('--pcd_file', type=str, required=True,
-                        help='Path to point cloud file (las).')
+    parser.add_argument('--pcd_directory', type=str, required=True,
+                        help='Path to directory of point cloud files (las).')
 
     parser.add_argument('--output_dir', type=str, default="./data/processed",
                         help='Directory to save the processed files.')
@@ -146,47 +253,66 @@ def main():
                         help='The Grid step used to create the DEM.')
 
     parser.add_argument('--empty_cell_fill_option', type=str, required=False,
-                        default="KRIGING",
-                        help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","INTERPOLATE_DELAUNAY","KRIGING"')
+                        default="INTERPOLATE_DELAUNAY",
+                        help='How should the values for empty spaces be filled. OPTIONS: "LEAVE_EMPTY", "FILL_MINIMUM_HEIGHT","FILL_MAXIMUM_HEIGHT","FILL_CUSTOM_HEIGHT","FILL_AVERAGE_HEIGHT","FILL_NEAREST","INTERPOLATE_IDW","INTERPOLATE_DELAUNAY","KRIGING" (FILL_NEAREST and INTERPOLATE_IDW need the numpy DEM engine; KRIGING and FILL_CUSTOM_HEIGHT use CloudCompare, and are much slower)')
+
+    parser.add_argument('--dem_engine', type=str, default="numpy", choices=["numpy", "cloudcompare"],
+                        help='Create the DEM with the NumPy raster engine or with CloudCompare (RasterizeToMesh).')
+
+    parser.add_argument('--height_mode', type=str, default="raster", choices=["raster", "c2m"],
+                        help='Height above the DEM by bilinear lookup in the DEM raster (numpy DEM engine) or by cloud-to-mesh distances.')
 
     # 'Other Optional Arguments'
 
     parser.add_argument('--exportOption', type=str, required=False,
                         default="small_output",
                         help='What should be outputed? Options are "small_output", "large_output", "all" ')
+    parser.add_argument('--export_layers', type=str, required=False,
+                        default=None,
+                        help='Comma separated layers to write instead of the default ones of the export option, e.g. "fish,coral,ground,dem".')
     parser.add_argument('--verbose', default=True,
                         help='Should Information be Printed to the Console.',
                         action='store_true')
 
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of LAS files to segment at the same time, each in its own process.')
+
+    parser.add_argument('--components_engine', type=str, default="cloudcompare", choices=["cloudcompare", "numpy"],
+                        help='Extract fish / coral components with CloudCompare or with the NumPy voxel engine (one label per point).')
+
+    parser.add_argument('--async_writes', action='store_true',
+                        help='Write the output files in the background while the next LAS file is processed.')
+
+    parser.add_argument('--write_budget_mb', type=int, default=WRITE_BUDGET_MB,
+                        help='Size (MB) of the outputs that may wait to be written before processing waits for them.')
+
     args = parser.parse_args()
 
     try:
-        pcd_files = glob.glob(f"{args.pcd_directory}/**/*.las", recursive=True)
-
-        for pcd_file in pcd_files:
-
-            # Create a cleanCloud instance
-            cloud_segmentor = segmentCloud(pcd_file=pcd_file,
-                                           output_dir=args.output_dir,
-                                           dem_grid_step=args.dem_grid_step,
-                                           empty_cell_fill_option=args.empty_cell_fill_option,
-                                           pcd_above_seafloor_thresh=args.pcd_above_seafloor_thresh,
-                                           intensity_threshold=args.intensity_threshold,
-                                           coral_cell_size=args.coral_cell_size,
-                                           fish_cell_size=args.fish_cell_size,
-                                           fish_min_comp_size=args.fish_min_comp_size,
-                                           coral_min_comp_size=args.coral_min_comp_size,
-                                           max_coral_pts=args.max_coral_pts,
-                                           exportOption=args.exportOption,
-                                           verbose=args.verbose)
-
-            # Load the cleaned cloud from file
-            cloud_segmentor.load_pcd()
-
-            # Segment the cloud
-            cloud_segmentor.segment()
-
-        print("Done.")
+        # Create a segmentClouds instance
+        cloud_segmentor = segmentClouds(pcd_dir=args.pcd_directory,
+                                        output_dir=args.output_dir,
+                                        dem_grid_step=args.dem_grid_step,
+                                        empty_cell_fill_option=args.empty_cell_fill_option,
+                                        pcd_above_seafloor_thresh=args.pcd_above_seafloor_thresh,
+                                        intensity_threshold=args.intensity_threshold,
+                                        coral_cell_size=args.coral_cell_size,
+                                        fish_cell_size=args.fish_cell_size,
+                                        fish_min_comp_size=args.fish_min_comp_size,
+                                        coral_min_comp_size=args.coral_min_comp_size,
+                                        max_coral_pts=args.max_coral_pts,
+                                        exportOption=args.exportOption,
+                                        export_layers=args.export_layers.split(",") if args.export_layers else None,
+                                        verbose=args.verbose,
+                                        workers=args.workers,
+                                        components_engine=args.components_engine,
+                                        dem_engine=args.dem_engine,
+                                        height_mode=args.height_mode,
+                                        async_writes=args.async_writes,
+                                        write_budget_mb=args.write_budget_mb)
+
+        # Segment the clouds
+        cloud_segmentor.cleanDir()
 
     except Exception as e:
         print(f"ERROR: {e}")
@@ -0,0 +1,106 @@
+import os
+
+import pandas as pd
+
+# pyarrow (in requirements.txt) writes the Parquet tables; without it they are written as CSV with the same
+# typed columns and a warning
+try:
+    import pyarrow
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Constants
+# -----------------------------------------------------------------------------------------------------------
+
+# Extensions the readers understand, in order of preference
+TABLE_EXTENSIONS = [".parquet", ".feather", ".csv"]
+
+# Types of the columns written by the pipeline, restored when a table is read back from CSV
+TABLE_DTYPES = {'Tstart': 'float64', 'Tend': 'float64',
+                'box_file_name': 'string', 'box_file_path': 'string',
+                'time': 'float64', 'file_path': 'string', 'file_name': 'string',
+                'latitude': 'float64', 'longitude': 'float64', 'altitude': 'float64',
+                'easting': 'float64', 'northing': 'float64', 'zone_number': 'Int64', 'zone_letter': 'string'}
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Functions
+# -----------------------------------------------------------------------------------------------------------
+
+def writeTable(df, output_dir, name):
+    """
+    Writes a table in a columnar format (Parquet) when pyarrow is available, CSV otherwise.
+
+    Args:
+    - df (DataFrame): Table to write; the index is not written.
+    - output_dir (str): Directory to write to.
+    - name (str): File name without extension (e.g. "tracks").
+
+    Returns:
+    - str: Path of the written file.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    df = df.reset_index(drop=True).astype({column: dtype for column, dtype in TABLE_DTYPES.items() if column in df})
+
+    if HAS_PYARROW:
+        table_path = os.path.join(output_dir, name + ".parquet")
+        df.to_parquet(table_path, index=False)
+    else:
+        print(f"Warning: pyarrow is not installed, {name} is written as CSV instead of Parquet")
+        table_path = os.path.join(output_dir, name + ".csv")
+        df.to_csv(table_path, index=False)
+
+    # Do not leave an older copy in another format that readTable could pick up instead
+    for extension in TABLE_EXTENSIONS:
+        stale_path = os.path.join(output_dir, name + extension)
+        if stale_path != table_path and os.path.exists(stale_path):
+            os.remove(stale_path)
+
+    return table_path
+
+
+def findTable(table_path):
+    """
+    Resolves a table path; a path without extension (or to a directory plus name) is matched
+    against TABLE_EXTENSIONS.
+    """
+    if os.path.splitext(table_path)[1].lower() in TABLE_EXTENSIONS:
+        return table_path
+
+    for extension in TABLE_EXTENSIONS:
+        if os.path.exists(table_path + extension):
+            return table_path + extension
+
+    raise Exception(f"Error: No table found for {table_path}")
+
+
+def readTable(table_path):
+    """
+    Reads a table written by writeTable (or an older CSV output) with typed columns.
+
+    Args:
+    - table_path (str): Path of the table, with or without extension.
+
+    Returns:
+    - DataFrame: The table.
+    """
+    table_path = findTable(table_path)
+    extension = os.path.splitext(table_path)[1].lower()
+
+    if extension == ".parquet":
+        return pd.read_parquet(table_path)
+
+    if extension == ".feather":
+        return pd.read_feather(table_path)
+
+    df = pd.read_csv(table_path)
+
+    # Older outputs were written with the DataFrame index as the first column
+    if 'Unnamed: 0' in df:
+        df = df.drop(columns=['Unnamed: 0'])
+
+    return df.astype({column: dtype for column, dtype in TABLE_DTYPES.items() if column in df})
@@ -0,0 +1,286 @@
+import os
+import shutil
+import tempfile
+import concurrent.futures
+
+import numpy as np
+
+# CloudComPy is only needed by the "cloudcompare" cleaning backend
+try:
+    import cloudComPy as cc
+    import cloudComPy.CSF
+
+    # import CloudCompare.cloudComPy as cc
+    # import CloudCompare.cloudComPy.CSF
+except ImportError:
+    cc = None
+
+from common import announce
+from lasReader import readLasHeader, readPointsAt, memmapPoints, memmapRecords, writeLasFile
+from lasLoader import cloudFromColumns
+from cleanBackends import cleanPoints, sorFilterMask
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Constants
+# -----------------------------------------------------------------------------------------------------------
+
+# Scalar field holding the position of each point within its tile, used to find the kept records
+TILE_INDEX_SF = "Tile Point Index"
+
+# Scalar fields are float32, which holds integers exactly up to 2^24
+MAX_TILE_POINTS = 2 ** 24
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Functions
+# -----------------------------------------------------------------------------------------------------------
+
+def tileGrid(header, tile_size):
+    """
+    Splits the XY bounding box of a track into square tiles.
+
+    Args:
+    - header (dict): Header returned by readLasHeader.
+    - tile_size (float): Side of a tile (meters).
+
+    Returns:
+    - list: (column, row, (min_x, max_x, min_y, max_y)) of every tile.
+    """
+    columns = max(1, int(np.ceil((header['max_x'] - header['min_x']) / tile_size)))
+    rows = max(1, int(np.ceil((header['max_y'] - header['min_y']) / tile_size)))
+
+    return [(column, row, (header['min_x'] + column * tile_size, header['min_x'] + (column + 1) * tile_size,
+                           header['min_y'] + row * tile_size, header['min_y'] + (row + 1) * tile_size))
+            for column in range(columns) for row in range(rows)]
+
+
+def tileCells(x, y, header, tile_size, columns, rows):
+    """
+    Column and row of the tile each point belongs to (points on the far edge go to the last tile).
+    """
+    column = np.clip(np.floor((x - header['min_x']) / tile_size).astype(np.int64), 0, columns - 1)
+    row = np.clip(np.floor((y - header['min_y']) / tile_size).astype(np.int64), 0, rows - 1)
+
+    return column, row
+
+
+def bucketTiles(pcd_file, header, tile_size, grid_shape, halo, index_files, min_intensity=None,
+                chunk_size=10_000_000):
+    """
+    Sorts the point records of a track into tiles in a single streaming pass: the positions of the
+    points of each tile and its halo (that pass the intensity filter) are appended to the index file
+    of the tile, so each tile then reads only its own records instead of scanning the whole file.
+
+    Args:
+    - pcd_file (str): Path to the LAS file.
+    - header (dict): Header returned by readLasHeader.
+    - tile_size (float): Side of a tile (meters).
+    - grid_shape (tuple): Number of (columns, rows) of the grid.
+    - halo (float): Width of the halo around each tile (meters).
+    - index_files (list): One file per tile of tileGrid (in its order), receiving sorted int64 positions.
+    - min_intensity (int): Keep points with intensity >= min_intensity.
+    - chunk_size (int): Number of points scanned at a time.
+
+    Returns:
+    - np.ndarray: Number of points (tile + halo) of every tile.
+    """
+    columns, rows = grid_shape
+    points = memmapPoints(pcd_file, header=header, fields=['X', 'Y', 'intensity'])
+
+    # Tiles away from the one a point falls in whose halo can still reach it
+    reach = int(np.ceil(halo / tile_size))
+    counts = np.zeros(len(index_files), dtype=np.int64)
+
+    for path in index_files:
+        open(path, 'wb').close()
+
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start:start + chunk_size]
+
+        index = np.arange(len(chunk))
+        if min_intensity is not None:
+            index = np.flatnonzero(chunk['intensity'] >= min_intensity)
+
+        x = chunk['X'][index] * header['x_scale'] + header['x_offset']
+        y = chunk['Y'][index] * header['y_scale'] + header['y_offset']
+        column, row = tileCells(x, y, header, tile_size, columns, rows)
+        index = index + start
+
+        tileIds, pointIds = [], []
+        for columnStep in range(-reach, reach + 1):
+            for rowStep in range(-reach, reach + 1):
+                neighbourColumn, neighbourRow = column + columnStep, row + rowStep
+                inside = ((neighbourColumn >= 0) & (neighbourColumn < columns) &
+                          (neighbourRow >= 0) & (neighbourRow < rows))
+
+                if columnStep != 0 or rowStep != 0:
+                    inside &= (x >= header['min_x'] + neighbourColumn * tile_size - halo)
+                    inside &= (x <= header['min_x'] + (neighbourColumn + 1) * tile_size + halo)
+                    inside &= (y >= header['min_y'] + neighbourRow * tile_size - halo)
+                    inside &= (y <= header['min_y'] + (neighbourRow + 1) * tile_size + halo)
+
+                # Same numbering as tileGrid (column major)
+                tileIds.append((neighbourColumn * rows + neighbourRow)[inside])
+                pointIds.append(index[inside])
+
+        tileIds, pointIds = np.concatenate(tileIds), np.concatenate(pointIds)
+        order = np.lexsort((pointIds, tileIds))
+        tileIds, pointIds = tileIds[order], pointIds[order]
+
+        chunkTiles, firsts, chunkCounts = np.unique(tileIds, return_index=True, return_counts=True)
+        for tileId, first, count in zip(chunkTiles, firsts, chunkCounts):
+            with open(index_files[tileId], 'ab') as f:
+                pointIds[first:first + count].tofile(f)
+            counts[tileId] += count
+
+    return counts
+
+
+def cleanTile(pcd_file, tile, tile_size, grid_shape, index_file, params, part_file):
+    """
+    Cleans one tile of a track (CSF, SOR) with a halo of neighbouring points around it, then writes
+    the raw records of the kept points inside the tile to a part file. Only the records listed in
+    the index file of the tile are read. Module-level so it can be sent to a worker process.
+
+    Args:
+    - pcd_file (str): Path to the LAS file.
+    - tile (tuple): (column, row, (min_x, max_x, min_y, max_y)) from tileGrid.
+    - tile_size (float): Side of a tile (meters).
+    - grid_shape (tuple): Number of (columns, rows) of the grid.
+    - index_file (str): Positions of the records of the tile and its halo, from bucketTiles.
+    - params (dict): knn, nSigma, backend and sor_mode.
+    - part_file (str): File the kept records are written to.
+
+    Returns:
+    - int: Number of kept points.
+    - list: (min_x, max_x, min_y, max_y, min_z, max_z) of the kept points, None if there are none.
+    - dict: Agreement counts of the voxel SOR (cleanBackends.sorAgreement), None in exact mode.
+    """
+    column, row, _ = tile
+
+    # Intensity filter and tile + halo crop were applied by bucketTiles
+    recordIndex = np.fromfile(index_file, dtype=np.int64)
+    columns, header = readPointsAt(pcd_file, recordIndex, fields=('X', 'Y', 'Z', 'intensity'))
+
+    count = len(recordIndex)
+    if count >= MAX_TILE_POINTS:
+        raise Exception(f"Error: Tile {column}, {row} has {count} points, use a smaller tile size")
+
+    # Halo points help the filters at the tile edges but belong to the neighbouring tiles
+    x, y, z = columns['X'].copy(), columns['Y'].copy(), columns['Z'].copy()
+    pointColumn, pointRow = tileCells(x, y, header, tile_size, *grid_shape)
+    inTile = (pointColumn == column) & (pointRow == row)
+
+    kept = np.zeros(0, dtype=np.int64)
+    agreement = None
+    if np.any(inTile) and params['backend'] == "numpy":
+        kept, agreement = cleanPoints(np.column_stack([x, y, z]), knn=params['knn'], nSigma=params['nSigma'],
+                                      sor_mode=params['sor_mode'])
+        kept = kept[inTile[kept]]
+
+    elif np.any(inTile):
+        columns[TILE_INDEX_SF] = np.arange(count)
+        tileCloud = cloudFromColumns(f"Tile {column} {row}", columns, header, fields=('intensity', TILE_INDEX_SF))
+
+        # Compute CSF (Conditional Sampling Framework) plugin for filtering lowest z values
+        clouds = cc.CSF.computeCSF(tileCloud)
+        lowZPoints, highZPoints = clouds[0:2]
+
+        if highZPoints.size() > 0 and params['sor_mode'] == "voxel":
+            # Approximate SOR on the coordinates of the high Z points
+            keep, agreement = sorFilterMask(highZPoints.toNpArrayCopy(), knn=params['knn'], nSigma=params['nSigma'],
+                                            sor_mode="voxel")
+
+            tileIndexSF = highZPoints.getScalarField(highZPoints.getScalarFieldDic()[TILE_INDEX_SF])
+            kept = np.rint(tileIndexSF.toNpArrayCopy()).astype(np.int64)[keep]
+            kept = np.sort(kept[inTile[kept]])
+
+        elif highZPoints.size() > 0:
+            # Remove statistical outliers using SOR filter
+            cloudReference = cc.CloudSamplingTools.sorFilter(knn=params['knn'], nSigma=params['nSigma'],
+                                                             cloud=highZPoints)
+            cleanedTile, res = highZPoints.partialClone(cloudReference)
+
+            tileIndexSF = cleanedTile.getScalarField(cleanedTile.getScalarFieldDic()[TILE_INDEX_SF])
+            kept = np.rint(tileIndexSF.toNpArrayCopy()).astype(np.int64)
+            kept = np.sort(kept[inTile[kept]])
+
+    # Copy the kept records as they are (every attribute of the original file is preserved)
+    memmapRecords(pcd_file, header)[recordIndex[kept]].tofile(part_file)
+
+    if len(kept) == 0:
+        return 0, None, agreement
+
+    return (len(kept), [x[kept].min(), x[kept].max(), y[kept].min(), y[kept].max(), z[kept].min(), z[kept].max()],
+            agreement)
+
+
+def cleanTiled(pcd_file, output_file, intensity_thresh=100, knn=6, nSigma=10, tile_size=25.0, halo=1.0, workers=1,
+               backend="cloudcompare", sor_mode="exact"):
+    """
+    Cleans a track tile by tile so memory is bounded by the tile size instead of the track size;
+    the records are sorted into tiles in one pass over the file (bucketTiles), then each tile only
+    reads its own records and the cleaned points are streamed to a single LAS file.
+
+    Args:
+    - pcd_file (str): Path to the LAS file.
+    - output_file (str): Path of the cleaned LAS file.
+    - intensity_thresh (float): Points below this intensity are removed.
+    - knn (int): Number of neighbors of the SOR filter.
+    - nSigma (float): Number of sigmas of the SOR filter.
+    - tile_size (float): Side of a tile (meters).
+    - halo (float): Width of the overlap read around each tile (meters).
+    - workers (int): Number of tiles cleaned at the same time, each in its own process.
+    - backend (str): "cloudcompare" (CSF / sorFilter) or "numpy" (cleanBackends).
+    - sor_mode (str): "exact" or "voxel" (approximate) SOR filter.
+
+    Returns:
+    - int: Number of points in the cleaned file.
+    - dict: Agreement counts of the voxel SOR summed over the tiles, None in exact mode.
+    """
+    header = readLasHeader(pcd_file)
+    tiles = tileGrid(header, tile_size)
+    grid_shape = (max(tile[0] for tile in tiles) + 1, max(tile[1] for tile in tiles) + 1)
+    params = dict(knn=knn, nSigma=nSigma, backend=backend, sor_mode=sor_mode)
+
+    announce(f"Tiled cleaning of {os.path.basename(pcd_file)}: {len(tiles)} tiles of {tile_size} m, {halo} m halo")
+
+    part_dir = tempfile.mkdtemp(prefix="tiles_", dir=os.path.dirname(os.path.abspath(output_file)))
+    part_files = [os.path.join(part_dir, f"tile_{column}_{row}.bin") for column, row, _ in tiles]
+    index_files = [os.path.join(part_dir, f"tile_{column}_{row}.index") for column, row, _ in tiles]
+
+    try:
+        bucketTiles(pcd_file, header, tile_size, grid_shape, halo, index_files, min_intensity=intensity_thresh)
+
+        if workers <= 1:
+            results = [cleanTile(pcd_file, tile, tile_size, grid_shape, index_file, params, part_file)
+                       for tile, index_file, part_file in zip(tiles, index_files, part_files)]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(cleanTile, pcd_file, tile, tile_size, grid_shape, index_file, params,
+                                           part_file)
+                           for tile, index_file, part_file in zip(tiles, index_files, part_files)]
+                results = [future.result() for future in futures]
+
+        point_count = sum(count for count, _, _ in results)
+        tileBounds = np.array([bounds for _, bounds, _ in results if bounds is not None])
+
+        agreement = None
+        if sor_mode == "voxel":
+            tileAgreements = [tileAgreement for _, _, tileAgreement in results if tileAgreement is not None]
+            agreement = {key: sum(tileAgreement[key] for tileAgreement in tileAgreements)
+                         for key in ['sample_points', 'agreeing_points', 'exact_removed', 'voxel_removed']}
+
+        if point_count == 0:
+            raise Exception(f"Error: No points left after cleaning {os.path.basename(pcd_file)}")
+
+        bounds = (tileBounds[:, 0].min(), tileBounds[:, 1].max(), tileBounds[:, 2].min(),
+                  tileBounds[:, 3].max(), tileBounds[:, 4].min(), tileBounds[:, 5].max())
+
+        writeLasFile(pcd_file, output_file, part_files, point_count, bounds)
+
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+
+    return point_count, agreement
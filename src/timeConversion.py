@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Constants
+# -----------------------------------------------------------------------------------------------------------
+
+# Unix time of the GPS epoch (1980-01-06 00:00:00 UTC)
+GPS_EPOCH_UNIX = 315964800
+
+# LAS files store adjusted standard GPS time (GPS time - 1e9)
+ADJUSTED_GPS_OFFSET = 1000000000
+
+# UTC dates at which a leap second took effect, with the GPS - UTC offset (seconds) from then on
+LEAP_SECONDS = [('1981-07-01', 1), ('1982-07-01', 2), ('1983-07-01', 3), ('1985-07-01', 4),
+                ('1988-01-01', 5), ('1990-01-01', 6), ('1991-01-01', 7), ('1992-07-01', 8),
+                ('1993-07-01', 9), ('1994-07-01', 10), ('1996-01-01', 11), ('1997-07-01', 12),
+                ('1999-01-01', 13), ('2006-01-01', 14), ('2009-01-01', 15), ('2012-07-01', 16),
+                ('2015-07-01', 17), ('2017-01-01', 18)]
+
+# The table above is known to be complete up to this date (expiry of the IERS leap second list after
+# Bulletin C 71); later times use astropy. When a later Bulletin C announces no new leap second, set the
+# LEAP_SECONDS_VALID_UNTIL environment variable to its expiry (e.g. '2027-06-28') instead of editing this
+LEAP_SECONDS_VALID_UNTIL = os.environ.get('LEAP_SECONDS_VALID_UNTIL', '2026-12-28')
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Functions
+# -----------------------------------------------------------------------------------------------------------
+
+def _unixSeconds(dates):
+    """
+    Unix seconds of UTC calendar dates ('YYYY-MM-DD').
+    """
+    return np.array(dates, dtype='datetime64[s]').astype(np.int64)
+
+
+# GPS seconds at which each leap second took effect, and the matching GPS - UTC offsets
+_LEAP_OFFSETS = np.array([offset for _, offset in LEAP_SECONDS], dtype=np.float64)
+_LEAP_GPS = _unixSeconds([date for date, _ in LEAP_SECONDS]) - GPS_EPOCH_UNIX + _LEAP_OFFSETS
+_VALID_UNTIL_GPS = float(_unixSeconds(LEAP_SECONDS_VALID_UNTIL) - GPS_EPOCH_UNIX + _LEAP_OFFSETS[-1])
+
+
+def gpsToUnix(gps_seconds, adjusted=True):
+    """
+    Converts GPS times to unix times in one vectorized pass, using the leap second table.
+
+    Args:
+    - gps_seconds (array-like): GPS times (any shape).
+    - adjusted (bool): True if the times are adjusted standard GPS times (GPS time - 1e9), as stored in LAS files.
+
+    Returns:
+    - np.ndarray: Unix times (float, same shape as the input).
+    """
+    gps = np.asarray(gps_seconds, dtype=np.float64)
+    if adjusted:
+        gps = gps + ADJUSTED_GPS_OFFSET
+
+    offsets = np.concatenate([[0.0], _LEAP_OFFSETS])[np.searchsorted(_LEAP_GPS, gps, side='right')]
+    unix = gps + GPS_EPOCH_UNIX - offsets
+
+    # Times after the end of the table may have an unknown leap second, let astropy handle those
+    recent = gps > _VALID_UNTIL_GPS
+    if np.any(recent):
+        print(f"Warning: {np.sum(recent)} times are after {LEAP_SECONDS_VALID_UNTIL} (end of the leap second table) "
+              f"and are converted with astropy, update LEAP_SECONDS_VALID_UNTIL if no leap second was announced")
+        from astropy.time import Time
+        unix[recent] = Time(gps[recent], format='gps').to_value('unix')
+
+    return unix
+
+
+def isoToUnix(iso_times):
+    """
+    Converts UTC ISO-like strings ('YYYY-MM-DD HH:MM:SS.ffffff') to unix times in one vectorized pass.
+
+    Args:
+    - iso_times (list): Time strings; strings that cannot be parsed become NaN (with a warning giving
+      their number), as do missing (None) times.
+
+    Returns:
+    - np.ndarray: Unix times (float).
+    """
+    if len(iso_times) == 0:
+        return np.zeros(0)
+
+    strings = pd.Series(iso_times, dtype=object)
+    times = pd.to_datetime(strings, format='ISO8601', utc=True, errors='coerce')
+
+    unparsed = times.isna() & strings.notna()
+    if unparsed.any():
+        print(f"Warning: {unparsed.sum()} of {len(strings)} times could not be parsed and are NaN, "
+              f"e.g. {strings[unparsed].iloc[0]!r}")
+
+    return ((times - pd.Timestamp(0, tz='UTC')) / pd.Timedelta(seconds=1)).to_numpy(dtype=np.float64)
@@ -0,0 +1,104 @@
+import os
+import itertools
+import concurrent.futures
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Constants
+# -----------------------------------------------------------------------------------------------------------
+
+# Engines segmentCloud can extract connected components with
+COMPONENTS_ENGINES = ["cloudcompare", "numpy"]
+
+# Scalar field MergeEntities(createSFcloudIndex=True) stores the index of the merged components in; the
+# export colours the component clouds by it
+COMPONENT_SF = "Original cloud index"
+
+# Half of the 26 neighbors of a voxel, each pair of touching voxels is found once
+NEIGHBOR_OFFSETS = [offset for offset in itertools.product((-1, 0, 1), repeat=3) if offset > (0, 0, 0)]
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Functions
+# -----------------------------------------------------------------------------------------------------------
+
+def neighborVoxels(voxelKeys, offset):
+    """
+    Pairs of occupied voxels separated by a key offset.
+
+    Returns:
+    - np.ndarray: Positions (in voxelKeys) of the voxels having the neighbor.
+    - np.ndarray: Positions of the neighbors.
+    """
+    neighborKeys = voxelKeys + offset
+    position = np.minimum(np.searchsorted(voxelKeys, neighborKeys), len(voxelKeys) - 1)
+    found = voxelKeys[position] == neighborKeys
+
+    return np.flatnonzero(found), position[found]
+
+
+def voxelComponents(xyz, cell_size, origin=None, min_comp_size=10, workers=None):
+    """
+    Connected components of the points over a sparse voxel grid, with the semantics of
+    cc.ExtractConnectedComponents: points in the same or in touching voxels (26-connectivity)
+    belong to the same component. The occupied voxels are hashed once (sorted int64 keys), their
+    adjacency is found with one vectorized lookup per neighbor offset and labelled in a single
+    pass (scipy.sparse.csgraph).
+
+    Args:
+    - xyz (np.ndarray): (N, 3) coordinates.
+    - cell_size (float): Side of a voxel (the octree cell size of the chosen level).
+    - origin (tuple): Corner the voxel grid is aligned to (e.g. the octree box), the points' minimum by default.
+    - min_comp_size (int): Components with fewer points are not labelled.
+    - workers (int): Threads running the neighbor lookups (one per offset), every core by default.
+
+    Returns:
+    - np.ndarray: int32 label of every point; components are numbered by decreasing size (0 is the
+      largest) and points of components smaller than min_comp_size get -1.
+    - np.ndarray: Number of points of each labelled component (sizes[label]).
+    """
+    if len(xyz) == 0:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64)
+
+    if origin is None:
+        origin = xyz.min(axis=0)
+
+    # Voxel indices start at 1 so the neighbors of the border voxels have valid keys
+    ijk = np.floor((xyz - np.asarray(origin)) / cell_size).astype(np.int64)
+    ijk -= ijk.min(axis=0) - 1
+    dims = ijk.max(axis=0) + 2
+    keys = (ijk[:, 0] * dims[1] + ijk[:, 1]) * dims[2] + ijk[:, 2]
+    ijk = None
+
+    voxelKeys, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+    keys = None
+
+    # The lookups of the different offsets are independent (and release the GIL)
+    offsets = [(di * dims[1] + dj) * dims[2] + dk for di, dj, dk in NEIGHBOR_OFFSETS]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        pairs = list(executor.map(lambda offset: neighborVoxels(voxelKeys, offset), offsets))
+
+    sources = np.concatenate([source for source, _ in pairs])
+    targets = np.concatenate([target for _, target in pairs])
+    pairs = None
+    adjacency = sparse.coo_matrix((np.ones(len(sources), dtype=np.int8), (sources, targets)),
+                                  shape=(len(voxelKeys), len(voxelKeys)))
+
+    component_count, voxelLabels = csgraph.connected_components(adjacency, directed=False)
+    pointComponents = voxelLabels[inverse]
+
+    # Number the components by decreasing size, as ExtractConnectedComponents orders its clouds
+    sizes = np.bincount(pointComponents, minlength=component_count)
+    order = np.argsort(-sizes, kind='stable')
+    labelled_count = int(np.sum(sizes >= min_comp_size))
+
+    rank = np.full(component_count, -1, dtype=np.int32)
+    rank[order[:labelled_count]] = np.arange(labelled_count, dtype=np.int32)
+
+    return rank[pointComponents], sizes[order[:labelled_count]]
+
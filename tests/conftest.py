@@ -0,0 +1,84 @@
+import os
+import sys
+import struct
+
+import numpy as np
+import pytest
+
+# The modules of src import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Functions
+# -----------------------------------------------------------------------------------------------------------
+
+def writeTestLas(las_file, xyz, intensity, gps_time=None, scale=0.001):
+    """
+    Writes a minimal LAS 1.2 file (point format 1, no VLRs) with these points.
+
+    Args:
+    - las_file (str): Path of the LAS file.
+    - xyz (np.ndarray): (N, 3) coordinates.
+    - intensity (np.ndarray): Intensity of every point.
+    - gps_time (np.ndarray): GPS time of every point, the point number by default.
+    - scale (float): Scale of the X / Y / Z integers.
+    """
+    offset = np.floor(xyz.min(axis=0))
+    minCorner, maxCorner = xyz.min(axis=0), xyz.max(axis=0)
+
+    header = bytearray(227)
+    header[0:4] = b"LASF"
+    header[24], header[25] = 1, 2
+    struct.pack_into("<H", header, 94, 227)
+    struct.pack_into("<I", header, 96, 227)
+    struct.pack_into("<B", header, 104, 1)
+    struct.pack_into("<H", header, 105, 28)
+    struct.pack_into("<I", header, 107, len(xyz))
+    struct.pack_into("<3d", header, 131, scale, scale, scale)
+    struct.pack_into("<3d", header, 155, *offset)
+    struct.pack_into("<6d", header, 179, maxCorner[0], minCorner[0], maxCorner[1], minCorner[1],
+                     maxCorner[2], minCorner[2])
+
+    records = np.zeros(len(xyz), dtype=np.dtype({'names': ['X', 'Y', 'Z', 'intensity', 'gps_time'],
+                                                  'formats': ['<i4', '<i4', '<i4', '<u2', '<f8'],
+                                                  'offsets': [0, 4, 8, 12, 20],
+                                                  'itemsize': 28}))
+    for index, axis in enumerate('XYZ'):
+        records[axis] = np.rint((xyz[:, index] - offset[index]) / scale)
+    records['intensity'] = intensity
+    records['gps_time'] = np.arange(len(xyz)) if gps_time is None else gps_time
+
+    with open(las_file, 'wb') as f:
+        f.write(header)
+        records.tofile(f)
+
+
+# -----------------------------------------------------------------------------------------------------------
+# Fixtures
+# -----------------------------------------------------------------------------------------------------------
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+@pytest.fixture
+def lasFile(tmp_path, rng):
+    """
+    LAS file of 2000 points over a 10 x 10 m seafloor, with random intensities and increasing GPS times.
+
+    Returns:
+    - str: Path of the LAS file.
+    - np.ndarray: (N, 3) coordinates (rounded to the scale of the file).
+    - np.ndarray: Intensity of every point.
+    """
+    xyz = np.round(np.column_stack([rng.uniform(100, 110, 2000),
+                                    rng.uniform(200, 210, 2000),
+                                    rng.uniform(-12, -11, 2000)]), 3)
+    intensity = rng.integers(0, 1000, 2000).astype(np.uint16)
+
+    las_file = str(tmp_path / "track.las")
+    writeTestLas(las_file, xyz, intensity, gps_time=1e8 + np.arange(2000) * 0.01)
+
+    return las_file, xyz, intensity
@@ -0,0 +1,59 @@
+import os
+import functools
+
+import pytest
+
+psutil = pytest.importorskip("psutil")
+
+from batchProcess import runBatch, c2mThreadCount
+from asyncWriter import backgroundWriter
+
+
+def writeOutput(text, output_file):
+    if "unwritable" in os.path.basename(output_file):
+        raise OSError("No space left on device")
+
+    with open(output_file, 'w') as f:
+        f.write(text)
+
+
+def processTrack(pcd_file, output_dir):
+    """
+    Stands in for cleanSegmentFile: fails on the "bad" tracks and writes one output in the background.
+    """
+    name = os.path.basename(pcd_file)
+    if name.startswith("bad"):
+        raise Exception(f"Error: {name} is corrupt")
+
+    output_file = os.path.join(output_dir, name.replace(".las", ".txt"))
+    backgroundWriter().write(functools.partial(writeOutput, name), output_file, label=pcd_file)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_run_batch(tmp_path, capsys, workers):
+    pcd_files = [str(tmp_path / name) for name in ("good.las", "bad.las", "unwritable.las")]
+
+    results = runBatch(processTrack, pcd_files, args=(str(tmp_path),), workers=workers)
+
+    # One bad track (or output) does not stop the rest of the batch
+    assert [result['file'] for result in results] == pcd_files
+    assert [result['status'] for result in results] == ["success", "failed", "failed"]
+    assert "bad.las is corrupt" in results[1]['error']
+    assert "No space left on device" in results[2]['error']
+
+    # The background writes of every worker are waited for before runBatch returns
+    assert (tmp_path / "good.txt").read_text() == "good.las"
+    assert not (tmp_path / "unwritable.txt").exists()
+
+    summary = capsys.readouterr().out
+    assert "Batch Summary: 1 succeeded, 2 failed" in summary
+    assert "SUCCESS" in summary and "good.las" in summary
+
+
+def test_c2m_thread_count(monkeypatch):
+    monkeypatch.setattr(psutil, "cpu_count", lambda: 8)
+
+    assert c2mThreadCount(1) == 8
+    assert c2mThreadCount(3) == 2
+    assert c2mThreadCount(16) == 1
+    assert c2mThreadCount(0) == 8
@@ -0,0 +1,50 @@
+import numpy as np
+
+from cleanBackends import intensityMask, sorMask, voxelSorMask, sorAgreement
+
+
+def seafloor(rng, count=20000):
+    """
+    Points on a gently sloping 20 x 20 m seafloor with a few centimeters of noise.
+    """
+    xy = rng.uniform(0, 20, (count, 2))
+    z = 0.05 * xy[:, 0] + rng.normal(0, 0.01, count)
+
+    return np.column_stack([xy, z])
+
+
+def test_intensity_mask():
+    np.testing.assert_array_equal(intensityMask([10, 100, 250], 100), [False, True, True])
+
+
+def test_sor_removes_outliers(rng):
+    xyz = seafloor(rng)
+    outliers = np.array([[5, 5, 3], [12, 3, -4], [18, 18, 6]], dtype=np.float64)
+
+    kept = sorMask(np.vstack([xyz, outliers]), knn=6, nSigma=3)
+
+    assert not np.any(kept[-3:])
+    assert np.mean(kept[:-3]) > 0.99
+
+
+def test_sor_small_cloud():
+    # Not enough points for the neighbor statistics, everything is kept
+    assert np.all(sorMask(np.zeros((5, 3)), knn=6))
+    assert np.all(voxelSorMask(np.zeros((5, 3)), knn=6))
+
+
+def test_voxel_sor_matches_exact(rng):
+    xyz = np.vstack([seafloor(rng), [[5, 5, 3], [12, 3, -4], [18, 18, 6]]])
+
+    exactMask = sorMask(xyz, knn=6, nSigma=3)
+    voxelMask = voxelSorMask(xyz, knn=6, nSigma=3)
+
+    # Isolated points are always removed by the approximate filter
+    assert not np.any(voxelMask[-3:])
+
+    assert np.mean(exactMask == voxelMask) > 0.95
+
+    # With every point sampled, the reported agreement is the agreement of the two masks
+    agreement = sorAgreement(xyz, voxelMask, knn=6, nSigma=3, sample_size=len(xyz))
+    assert agreement['sample_points'] == len(xyz)
+    assert agreement['agreeing_points'] == np.sum(exactMask == voxelMask)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+cc = pytest.importorskip("cloudComPy")
+
+from cloudLayers import cloudLayers, VIEW_SF
+from voxelComponents import COMPONENT_SF
+
+
+@pytest.fixture
+def layers():
+    cloud = cc.ccPointCloud("cloud")
+    cloud.coordsFromNPArray_copy(np.arange(30, dtype=np.float32).reshape(10, 3))
+
+    layers = cloudLayers(cloud)
+    layers.addLayer("component", [2, 2, 3, 3, 3, 4, -1, -1, 5, 5])
+
+    return layers
+
+
+def test_view_masks(layers):
+    layers.addView("small", "component", 3, 5)
+
+    np.testing.assert_array_equal(layers.mask("small"), [0, 0, 1, 1, 1, 1, 0, 0, 1, 1])
+    assert layers.size("small") == 6
+
+
+def test_layer_size(layers):
+    with pytest.raises(AssertionError):
+        layers.addLayer("short", [1, 2, 3])
+
+
+def test_view(layers):
+    layers.addView("small", "component", 3, 5, cloud_name="Small Components", component_index=True)
+
+    view = layers.view("small")
+
+    assert view.size() == 6
+    assert view.getName() == "Small Components"
+
+    # Numbered from the first component of the view, as MergeEntities(createSFcloudIndex=True)
+    componentIndex = view.getScalarField(view.getScalarFieldDic()[COMPONENT_SF]).toNpArrayCopy()
+    np.testing.assert_array_equal(np.sort(componentIndex), [0, 0, 0, 1, 2, 2])
+
+    # The temporary selection field is removed from both clouds
+    assert VIEW_SF not in view.getScalarFieldDic()
+    assert VIEW_SF not in layers.cloud.getScalarFieldDic()
+
+
+def test_empty_view(layers):
+    layers.addView("none", "component", 10, 20)
+
+    assert layers.view("none") is None
@@ -0,0 +1,66 @@
+import os
+import shutil
+
+import numpy as np
+
+from csfCache import csfCache, fingerprint, CSF_CACHE_DIR
+
+PARAMS = dict(intensity_thresh=100, backend="numpy", cloth_resolution=2.0, class_threshold=0.5)
+
+
+def test_round_trip(lasFile, rng):
+    las_file, xyz, _ = lasFile
+    highZ = rng.random(len(xyz)) > 0.7
+
+    cache = csfCache(las_file)
+    assert cache.load(PARAMS, len(xyz)) is None
+
+    cache.save(PARAMS, highZ)
+
+    np.testing.assert_array_equal(csfCache(las_file).load(PARAMS, len(xyz)), highZ)
+
+    # Other parameters or another number of points do not match the entry
+    assert cache.load(dict(PARAMS, intensity_thresh=200), len(xyz)) is None
+    assert cache.load(PARAMS, len(xyz) - 1) is None
+
+
+def test_copied_file_hits(lasFile, tmp_path):
+    las_file, xyz, _ = lasFile
+    csfCache(las_file).save(PARAMS, np.ones(len(xyz), dtype=bool))
+
+    copy_dir = tmp_path / "copy"
+    copy_dir.mkdir()
+    shutil.copy(las_file, copy_dir / "renamed.las")
+    shutil.copytree(tmp_path / CSF_CACHE_DIR, copy_dir / CSF_CACHE_DIR)
+
+    assert csfCache(str(copy_dir / "renamed.las")).load(PARAMS, len(xyz)) is not None
+
+
+def test_edited_file_misses(lasFile):
+    las_file, xyz, _ = lasFile
+    before = fingerprint(las_file)
+    csfCache(las_file).save(PARAMS, np.ones(len(xyz), dtype=bool))
+
+    # Same size, one changed byte in the middle of the point records
+    with open(las_file, 'r+b') as f:
+        f.seek(os.path.getsize(las_file) // 2)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    assert fingerprint(las_file) != before
+    assert csfCache(las_file).load(PARAMS, len(xyz)) is None
+
+
+def test_eviction(lasFile):
+    las_file, xyz, _ = lasFile
+    cache = csfCache(las_file, max_mb=0)
+
+    # An entry another worker is still writing
+    os.makedirs(cache.cache_dir)
+    writing = os.path.join(cache.cache_dir, "entry.npz.tmp")
+    open(writing, 'wb').close()
+
+    cache.save(PARAMS, np.ones(len(xyz), dtype=bool))
+
+    assert os.listdir(cache.cache_dir) == ["entry.npz.tmp"]
@@ -0,0 +1,89 @@
+import numpy as np
+
+from demRaster import binHeights, fillEmptyCells, rasterize, demRaster
+
+
+def plane(xy):
+    return 0.2 * xy[:, 0] - 0.1 * xy[:, 1] + 3
+
+
+def test_bin_heights():
+    xyz = np.array([[0.1, 0.1, 5.0], [0.4, 0.2, 3.0], [1.2, 0.3, 7.0], [1.7, 1.9, 1.0]])
+
+    heights, origin = binHeights(xyz, grid_step=1.0)
+    assert origin == (0.1, 0.1)
+    np.testing.assert_array_equal(heights, [[3.0, 7.0], [np.nan, 1.0]])
+
+    heights, _ = binHeights(xyz, grid_step=1.0, origin=(0, 0), projection="mean")
+    np.testing.assert_array_equal(heights, [[4.0, 7.0], [np.nan, 1.0]])
+
+
+def test_bilinear_height_on_plane(rng):
+    # The centers of the cells are on the plane, so the interpolation between them is exact
+    raster = demRaster(np.zeros((10, 20)), origin=(0.0, 0.0), grid_step=0.5)
+    raster.heights = plane(raster.cellCenters()[:, :2]).reshape(10, 20)
+
+    xy = rng.uniform([0.25, 0.25], [9.75, 4.75], (1000, 2))
+
+    np.testing.assert_allclose(raster.bilinearHeightAt(xy), plane(xy))
+
+
+def test_bilinear_height_edges_and_empty_cells():
+    raster = demRaster(np.array([[1.0, 2.0], [3.0, np.nan]]), origin=(0.0, 0.0), grid_step=1.0)
+
+    heights = raster.bilinearHeightAt(np.array([[0.5, 0.5],    # center of a cell
+                                                [1.0, 0.5],    # between two cells
+                                                [-3.0, 0.5],   # beyond the outer cell centers
+                                                [1.0, 1.0]]))  # next to the empty cell
+
+    np.testing.assert_allclose(heights, [1.0, 1.5, 1.0, 2.0])
+
+    empty = demRaster(np.full((2, 2), np.nan), origin=(0.0, 0.0), grid_step=1.0)
+    assert np.all(np.isnan(empty.bilinearHeightAt(np.array([[1.0, 1.0]]))))
+
+
+def test_height_at_outside():
+    raster = demRaster(np.array([[1.0, 2.0]]), origin=(0.0, 0.0), grid_step=1.0)
+
+    np.testing.assert_array_equal(raster.heightAt(np.array([[1.5, 0.5], [2.5, 0.5]])), [2.0, np.nan])
+
+
+def test_fill_empty_cells():
+    heights = np.arange(25, dtype=np.float64).reshape(5, 5)
+    heights[2, 2] = np.nan
+
+    assert np.isnan(fillEmptyCells(heights, "LEAVE_EMPTY")[2, 2])
+    assert fillEmptyCells(heights, "FILL_MINIMUM_HEIGHT")[2, 2] == 0
+    assert fillEmptyCells(heights, "FILL_NEAREST")[2, 2] in (7, 11, 13, 17)
+
+    # The heights are linear in the row and column, so are the interpolations
+    assert fillEmptyCells(heights, "INTERPOLATE_DELAUNAY")[2, 2] == 12
+    assert fillEmptyCells(heights, "INTERPOLATE_IDW")[2, 2] == 12
+
+
+def test_rasterize(rng):
+    xy = rng.uniform(0, 10, (20000, 2))
+    xyz = np.column_stack([xy, plane(xy)])
+
+    raster = rasterize(xyz, grid_step=0.5, projection="mean", workers=2)
+
+    assert raster.shape == (20, 20)
+    assert not np.any(np.isnan(raster.heights))
+    np.testing.assert_allclose(raster.bilinearHeightAt(xy[:100]), plane(xy[:100]), atol=0.05)
+
+
+def test_nearest_height():
+    raster = demRaster(np.array([[1.0, np.nan, np.nan], [np.nan, np.nan, 4.0]]), origin=(0.0, 0.0), grid_step=1.0)
+
+    heights = raster.nearestHeightAt(np.array([[0.5, 0.5],     # filled cell
+                                               [1.2, 0.5],     # empty cell, closer to the first one
+                                               [2.0, 1.9],     # empty cell, closer to the last one
+                                               [9.0, 9.0]]))   # outside the grid
+
+    np.testing.assert_array_equal(heights, [1.0, 1.0, 4.0, 4.0])
+
+    # The bilinear lookup has nothing to interpolate from here
+    assert np.isnan(raster.bilinearHeightAt(np.array([[1.5, 0.5]]))[0])
+
+    empty = demRaster(np.full((2, 2), np.nan), origin=(0.0, 0.0), grid_step=1.0)
+    assert np.isnan(empty.nearestHeightAt(np.array([[1.0, 1.0]]))[0])
@@ -0,0 +1,11 @@
+from exifHarvest import exifTimeString
+
+
+def test_exif_time_string():
+    assert exifTimeString({'EXIF DateTimeOriginal': "2023:11:14 22:13:20"}) == "2023-11-14 22:13:20"
+
+
+def test_exif_time_string_missing():
+    # No capture time is None (NaN once converted), not the string "None"
+    assert exifTimeString({}) is None
+    assert exifTimeString({'EXIF SubSecTimeOriginal': "250"}) is None
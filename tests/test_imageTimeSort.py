@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from imageTimeSort import matchImagesToTracks, readManifest, IMGsort
+
+
+def bruteForce(tracks_df, images_df, secsOffset):
+    """
+    (track, image) pairs of one pass over every image per track, as is_within_box_Time.
+    """
+    return sorted((track, image)
+                  for track, trackRow in tracks_df.iterrows()
+                  for image, imageRow in images_df.iterrows()
+                  if trackRow['Tstart'] - secsOffset <= imageRow['time'] <= trackRow['Tend'] + secsOffset)
+
+
+def test_matches_brute_force(rng):
+    starts = np.sort(rng.uniform(0, 1000, 30))
+    tracks_df = pd.DataFrame({'Tstart': starts,
+                              'Tend': starts + rng.uniform(5, 40, 30),
+                              'box_file_name': [f"track_{i}.las" for i in range(30)]},
+                             index=np.arange(100, 130))
+
+    times = rng.uniform(-10, 1050, 500)
+    images_df = pd.DataFrame({'time': times,
+                              'file_name': [f"image_{i}.jpg" for i in range(500)],
+                              'file_path': [f"images/image_{i}.jpg" for i in range(500)]})
+
+    assignments = matchImagesToTracks(tracks_df, images_df, secsOffset=4)
+
+    assert sorted(zip(assignments['track_index'], assignments['image_index'])) == bruteForce(tracks_df, images_df, 4)
+    np.testing.assert_array_equal(assignments['time'], times[assignments['image_index']])
+
+
+def test_padding_is_inclusive():
+    tracks_df = pd.DataFrame({'Tstart': [10.0], 'Tend': [20.0], 'box_file_name': ["track.las"]})
+    images_df = pd.DataFrame({'time': [5.9, 6.0, 15.0, 24.0, 24.1],
+                              'file_name': list("abcde"),
+                              'file_path': list("abcde")})
+
+    assignments = matchImagesToTracks(tracks_df, images_df, secsOffset=4)
+
+    assert list(assignments['file_name']) == ["b", "c", "d"]
+
+
+def test_no_images():
+    tracks_df = pd.DataFrame({'Tstart': [10.0], 'Tend': [20.0], 'box_file_name': ["track.las"]})
+    images_df = pd.DataFrame({'time': pd.Series([], dtype=float),
+                              'file_name': pd.Series([], dtype=object),
+                              'file_path': pd.Series([], dtype=object)})
+
+    assert len(matchImagesToTracks(tracks_df, images_df, secsOffset=4)) == 0
+
+
+def test_manifest_mode(tmp_path):
+    tracks_df = pd.DataFrame({'Tstart': [10.0, 100.0, 500.0], 'Tend': [20.0, 120.0, 510.0],
+                              'box_file_name': ["a.las", "b.las", "c.las"],
+                              'box_file_path': ["a.las", "b.las", "c.las"]})
+    images_df = pd.DataFrame({'time': [12.0, 110.0, 15.0, 300.0],
+                              'file_name': list("wxyz"),
+                              'file_path': list("wxyz")})
+
+    IMGsort(tracks_df, images_df, str(tmp_path), output_mode="manifest").IMGsort()
+
+    manifests = {track: readManifest(os.path.join(tmp_path, "Sorted Images", track))
+                 for track in ["a.las", "b.las", "c.las"]}
+
+    assert list(manifests["a.las"]['file_name']) == ["a.las", "w", "y"]
+    assert list(manifests["b.las"]['file_name']) == ["b.las", "x"]
+
+    # A track without images still lists its LAS file
+    assert list(manifests["c.las"]['kind']) == ["las"]
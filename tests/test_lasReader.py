@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from lasReader import readLasHeader, readPoints, readPointsAt, lasGpsTimeRange, countPoints
+
+
+def test_read_header(lasFile):
+    las_file, xyz, _ = lasFile
+
+    header = readLasHeader(las_file)
+
+    assert header['point_format'] == 1
+    assert header['point_count'] == len(xyz)
+    assert not header['compressed']
+    assert header['min_x'] == pytest.approx(xyz[:, 0].min())
+    assert header['max_z'] == pytest.approx(xyz[:, 2].max())
+
+
+def test_read_header_not_las(tmp_path):
+    not_las = tmp_path / "track.las"
+    not_las.write_bytes(b"\0" * 400)
+
+    with pytest.raises(Exception, match="is not a LAS file"):
+        readLasHeader(str(not_las))
+
+
+def test_read_points(lasFile):
+    las_file, xyz, intensity = lasFile
+
+    columns, _ = readPoints(las_file, chunk_size=300)
+
+    np.testing.assert_allclose(np.column_stack([columns['X'], columns['Y'], columns['Z']]), xyz, atol=1e-9)
+    np.testing.assert_array_equal(columns['intensity'], intensity)
+
+
+def test_read_points_predicates(lasFile):
+    las_file, xyz, intensity = lasFile
+    bbox = (102.0, 105.5, 201.0, 208.0)
+    time_window = (1e8 + 2, 1e8 + 15)
+
+    columns, _ = readPoints(las_file, fields=('index', 'X', 'gps_time'), min_intensity=500, bbox=bbox,
+                            time_window=time_window, chunk_size=300)
+
+    gps_time = 1e8 + np.arange(len(xyz)) * 0.01
+    expected = np.flatnonzero((intensity >= 500) &
+                              (xyz[:, 0] >= bbox[0]) & (xyz[:, 0] <= bbox[1]) &
+                              (xyz[:, 1] >= bbox[2]) & (xyz[:, 1] <= bbox[3]) &
+                              (gps_time >= time_window[0]) & (gps_time <= time_window[1]))
+
+    assert len(expected) > 0
+    np.testing.assert_array_equal(columns['index'], expected)
+    np.testing.assert_allclose(columns['X'], xyz[expected, 0], atol=1e-9)
+    np.testing.assert_array_equal(columns['gps_time'], gps_time[expected])
+
+    assert countPoints(las_file, min_intensity=500, chunk_size=300) == np.sum(intensity >= 500)
+
+
+def test_read_points_at(lasFile):
+    las_file, xyz, intensity = lasFile
+    index = np.array([0, 7, 8, 500, 1999])
+
+    columns, _ = readPointsAt(las_file, index)
+
+    np.testing.assert_allclose(columns['Z'], xyz[index, 2], atol=1e-9)
+    np.testing.assert_array_equal(columns['intensity'], intensity[index])
+
+
+def test_gps_time_range(lasFile):
+    las_file, xyz, _ = lasFile
+
+    assert lasGpsTimeRange(las_file, chunk_size=300) == pytest.approx([1e8, 1e8 + (len(xyz) - 1) * 0.01])
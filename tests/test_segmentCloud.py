@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("cloudComPy")
+
+from segmentCloud import segmentCloud, octreeManager, octreeLevel, octreeSide, filterLargeClouds, MAX_OCTREE_LEVEL
+
+
+class arrayCloud:
+    """
+    Stands in for a ccPointCloud in the numpy engine, which only needs its coordinates.
+    """
+
+    def __init__(self, xyz):
+        self.xyz = xyz
+
+    def size(self):
+        return len(self.xyz)
+
+    def toNpArrayCopy(self):
+        return self.xyz.copy()
+
+
+@pytest.mark.parametrize("side, cellSize", [(10.0, 0.02), (10.0, 0.06), (1.0, 0.25), (8.0, 1.0), (3.7, 0.3)])
+def test_octree_level(side, cellSize):
+    level = octreeLevel(side, cellSize)
+
+    # The deepest level whose cells are still larger than cellSize
+    assert side / 2 ** level > cellSize
+    assert side / 2 ** (level + 1) <= cellSize
+
+
+def test_octree_level_bounds():
+    assert octreeLevel(10.0, 20.0) == 1
+    assert octreeLevel(1000.0, 1e-6) == MAX_OCTREE_LEVEL
+
+
+def test_octree_side():
+    assert octreeSide((0, 0, 0), (4, 2, 1)) == pytest.approx(4.04)
+
+
+def test_filter_large_clouds():
+    assert filterLargeClouds([9000, 6000, 400, 20], 5000) == 2
+    assert filterLargeClouds([9000, 6000], 5000) == 2
+    assert filterLargeClouds([], 5000) == -1
+
+
+def test_component_labels_numpy(rng):
+    xyz = np.vstack([rng.normal((0, 0, 0), 0.05, (300, 3)),
+                     rng.normal((3, 0, 0), 0.05, (100, 3)),
+                     rng.normal((0, 3, 0), 0.01, (4, 3)),
+                     rng.normal((0, 6, 0), 0.01, (2, 3))])
+
+    segmentor = segmentCloud.__new__(segmentCloud)
+    segmentor.components_engine = "numpy"
+    segmentor.verbose = False
+    segmentor.octrees = octreeManager()
+    segmentor.octrees.grids["fish"] = (xyz.min(axis=0), 0.2)
+
+    labels, sizes, residual_count = segmentor.componentLabels("fish", arrayCloud(xyz), min_comp_size=10)
+
+    np.testing.assert_array_equal(sizes, [300, 100])
+
+    # The two residual components are numbered -2 and -1, so each keeps its own index in the residual views
+    assert residual_count == 2
+    np.testing.assert_array_equal(labels, np.repeat([0, 1, -2, -1], [300, 100, 4, 2]))
@@ -0,0 +1,81 @@
+import sys
+import importlib
+
+import numpy as np
+
+import timeConversion
+from timeConversion import gpsToUnix, isoToUnix, ADJUSTED_GPS_OFFSET, GPS_EPOCH_UNIX
+
+
+def test_gps_epoch():
+    assert gpsToUnix([0.0], adjusted=False)[0] == GPS_EPOCH_UNIX
+
+
+def test_leap_seconds():
+    # 2017-01-01 00:00:00 UTC, after the 18th leap second
+    unix = 1483228800
+    gps = unix - GPS_EPOCH_UNIX + 18
+
+    assert gpsToUnix([gps], adjusted=False)[0] == unix
+    assert gpsToUnix([gps + 10], adjusted=False)[0] == unix + 10
+
+    # Two GPS seconds earlier the offset was still 17 (23:59:59 UTC)
+    assert gpsToUnix([gps - 2], adjusted=False)[0] == unix - 1
+
+    # 1990-01-01 00:00:00 UTC, after the 6th leap second
+    assert gpsToUnix([631152000 - GPS_EPOCH_UNIX + 6], adjusted=False)[0] == 631152000
+
+
+def test_adjusted_gps_time():
+    gps = np.array([[1.2e9, 1.3e9], [1.4e9, 1.45e9]])
+
+    unix = gpsToUnix(gps - ADJUSTED_GPS_OFFSET)
+
+    assert unix.shape == gps.shape
+    np.testing.assert_array_equal(unix, gpsToUnix(gps, adjusted=False))
+
+
+def test_current_time_without_astropy(monkeypatch, capsys):
+    # Times of current surveys are converted with the leap second table, astropy is not needed
+    monkeypatch.setitem(sys.modules, "astropy.time", None)
+
+    unix = int(np.datetime64('2026-10-18T12:00:00', 's').astype(np.int64))
+    gps = unix - GPS_EPOCH_UNIX + 18
+
+    assert gpsToUnix([gps - ADJUSTED_GPS_OFFSET])[0] == unix
+    assert "Warning" not in capsys.readouterr().out
+
+
+def test_valid_until_from_environment(monkeypatch):
+    monkeypatch.setitem(sys.modules, "astropy.time", None)
+    monkeypatch.setenv("LEAP_SECONDS_VALID_UNTIL", "2030-01-01")
+
+    try:
+        importlib.reload(timeConversion)
+
+        unix = int(np.datetime64('2029-06-01T00:00:00', 's').astype(np.int64))
+        assert timeConversion.gpsToUnix([unix - GPS_EPOCH_UNIX + 18], adjusted=False)[0] == unix
+
+    finally:
+        monkeypatch.delenv("LEAP_SECONDS_VALID_UNTIL")
+        importlib.reload(timeConversion)
+
+
+def test_iso_to_unix():
+    unix = isoToUnix(["2023-11-14 22:13:20", "2023-11-14 22:13:20.250000"])
+
+    np.testing.assert_allclose(unix, [1700000000.0, 1700000000.25])
+
+
+def test_iso_to_unix_unparsed(capsys):
+    unix = isoToUnix(["2023-11-14 22:13:20", "not a time", None])
+
+    assert unix[0] == 1700000000.0
+    assert np.isnan(unix[1]) and np.isnan(unix[2])
+
+    # Missing times are not reported, only the strings that could not be parsed
+    assert "Warning: 1 of 3 times could not be parsed" in capsys.readouterr().out
+
+
+def test_iso_to_unix_empty():
+    assert len(isoToUnix([])) == 0
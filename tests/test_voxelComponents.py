@@ -0,0 +1,49 @@
+import numpy as np
+
+from voxelComponents import voxelComponents
+
+
+def blob(rng, center, count, spread=0.05):
+    return rng.normal(center, spread, (count, 3))
+
+
+def test_components_by_decreasing_size(rng):
+    xyz = np.vstack([blob(rng, (0, 0, 0), 50),
+                     blob(rng, (5, 0, 0), 200),
+                     blob(rng, (0, 5, 0), 5)])
+
+    labels, sizes = voxelComponents(xyz, cell_size=0.2, min_comp_size=10, workers=2)
+
+    np.testing.assert_array_equal(sizes, [200, 50])
+    assert np.all(labels[50:250] == 0)
+    assert np.all(labels[:50] == 1)
+
+    # Too small to be a component
+    assert np.all(labels[250:] == -1)
+
+
+def test_diagonal_voxels_touch():
+    # Voxels that only share a corner belong to the same component (26-connectivity)
+    xyz = np.array([[0.5, 0.5, 0.5], [1.5, 1.5, 1.5], [2.5, 2.5, 2.5], [4.5, 4.5, 4.5]])
+
+    labels, sizes = voxelComponents(xyz, cell_size=1.0, origin=(0, 0, 0), min_comp_size=1)
+
+    np.testing.assert_array_equal(labels, [0, 0, 0, 1])
+    np.testing.assert_array_equal(sizes, [3, 1])
+
+
+def test_grid_origin():
+    # The two points are in touching voxels or two voxels apart depending on the corner of the grid
+    xyz = np.array([[0.6, 0, 0], [2.4, 0, 0]])
+
+    labels, _ = voxelComponents(xyz, cell_size=1.0, origin=(0, 0, 0), min_comp_size=1)
+    assert labels[0] != labels[1]
+
+    labels, _ = voxelComponents(xyz, cell_size=1.0, origin=(0.5, 0, 0), min_comp_size=1)
+    assert labels[0] == labels[1]
+
+
+def test_no_points():
+    labels, sizes = voxelComponents(np.zeros((0, 3)), cell_size=1.0)
+
+    assert len(labels) == 0 and len(sizes) == 0